@@ -0,0 +1,49 @@
+import json
+import argparse
+from src.batch import run_batch
+from src.config.config_loader import TaskCfg
+from src.index import cluster
+from src.similarity import WebPageSimilarity
+from src.service import run_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description='web page structure similarity')
+    parser.add_argument('--config', default='config/config.yaml')
+    sub_parsers = parser.add_subparsers(dest='command', required=True)
+    pair_parser = sub_parsers.add_parser('pair', help='compare two web pages')
+    pair_parser.add_argument('url1')
+    pair_parser.add_argument('url2')
+    batch_parser = sub_parsers.add_parser('batch', help='run similarity/feature tasks from a jsonl or csv file')
+    batch_parser.add_argument('--input', required=True, help='jsonl/csv tasks with url1,url2 or url fields')
+    batch_parser.add_argument('--output', required=True, help='jsonl results, also used as checkpoint to resume')
+    batch_parser.add_argument('--workers', type=int, default=4)
+    batch_parser.add_argument('--unordered', action='store_true', help='write results in completion order')
+    sub_parsers.add_parser('cluster', help='cluster pages of the same template', add_help=False)
+    sub_parsers.add_parser('bench', help='benchmark every pipeline stage', add_help=False)
+    serve_parser = sub_parsers.add_parser('serve', help='run a long-running http similarity service')
+    serve_parser.add_argument('--host', help='listen address, default service.host in config')
+    serve_parser.add_argument('--port', type=int, help='listen port, default service.port in config')
+    args, extra_args = parser.parse_known_args()
+    if extra_args and args.command not in ('cluster', 'bench'):
+        parser.error(f'unrecognized arguments: {" ".join(extra_args)}')
+
+    if args.command == 'pair':
+        sim_model = WebPageSimilarity(TaskCfg.load_config_yaml(args.config))
+        is_sim, sim_score = sim_model.get_similarity(args.url1, args.url2)
+        print(json.dumps({'is_sim': bool(is_sim), 'score': float(sim_score)}))
+        sim_model.page_downloader.close()
+    elif args.command == 'batch':
+        run_batch(args.config, args.input, args.output, args.workers, ordered=not args.unordered)
+    elif args.command == 'cluster':
+        cluster.main(['--config', args.config] + extra_args)
+    elif args.command == 'bench':
+        # 性能测试模块只在bench命令中导入
+        from src.benchmark import bench
+        bench.main(['--config', args.config] + extra_args)
+    elif args.command == 'serve':
+        run_service(TaskCfg.load_config_yaml(args.config), args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import os
+import csv
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.config.config_loader import TaskCfg
+from src.model.sparse_vector import vec_to_json
+from src.similarity import WebPageSimilarity
+from src.util.log_util import create_logger
+
+logger = create_logger(__name__)
+
+# 每个工作进程持有一个WebPageSimilarity实例，避免每个任务重复初始化下载器和编码器
+_worker_model = None
+
+
+def read_tasks(input_file):
+    '''
+    流式读取jsonl或csv格式的任务，每条任务包含url1和url2两个字段(相似度任务)或url字段(特征提取任务)
+    :return 逐条产出(任务序号, 任务字典)
+    '''
+    with open(input_file, 'r', encoding='utf-8', newline='') as f:
+        if input_file.endswith('.csv'):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for task_id, record in enumerate(records):
+            yield task_id, record
+
+
+def load_checkpoint(output_file):
+    '''
+    读取已有的输出文件，得到已完成的任务序号；中断时写了一半的最后一行会被截掉
+    '''
+    done_ids = set()
+    if not os.path.exists(output_file):
+        return done_ids
+    with open(output_file, 'rb+') as f:
+        valid_size = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            done_ids.add(json.loads(line)['id'])
+            valid_size += len(line)
+        f.truncate(valid_size)
+    return done_ids
+
+
+def init_worker(config_file):
+    global _worker_model
+    _worker_model = WebPageSimilarity(TaskCfg.load_config_yaml(config_file))
+
+
+def run_task(task):
+    task_id, record = task
+    result = {'id': task_id}
+    try:
+        if record.get('url1') and record.get('url2'):
+            is_sim, sim_score = _worker_model.get_similarity(record['url1'], record['url2'])
+            result.update(url1=record['url1'], url2=record['url2'], is_sim=bool(is_sim), score=float(sim_score))
+        elif record.get('url'):
+            feature_vec, css_vec = _worker_model.get_page_feature_pipeline(record['url'])
+            result.update(url=record['url'], feature_vec=vec_to_json(feature_vec), css_vec=vec_to_json(css_vec))
+        else:
+            result['error'] = 'task should contain url1 and url2, or url'
+    except Exception as e:
+        logger.exception(f'task {task_id} fails')
+        result['error'] = repr(e)
+    return result
+
+
+def run_batch(config_file, input_file, output_file, workers=4, ordered=True, max_inflight=None):
+    '''
+    多进程批量执行相似度/特征提取任务，结果以jsonl流式写入输出文件
+    输出文件同时作为断点，重新运行时跳过已完成的任务；ordered为True时按输入顺序输出，否则按完成顺序输出
+    :return 本次完成的任务数
+    '''
+    done_ids = load_checkpoint(output_file)
+    if done_ids:
+        logger.info(f'resume from checkpoint, {len(done_ids)} tasks already done')
+    tasks = ((task_id, record) for task_id, record in read_tasks(input_file) if task_id not in done_ids)
+    max_inflight = max_inflight or max(1, workers) * 4
+    finished = 0
+    with open(output_file, 'a', encoding='utf-8') as out:
+        def write_result(result):
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+
+        if workers <= 0:
+            # 不启用进程池，在当前进程中逐个执行，便于调试
+            init_worker(config_file)
+            for task in tasks:
+                write_result(run_task(task))
+                finished += 1
+            return finished
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(config_file,)) as executor:
+            # 提交顺序队列，按输入顺序输出时只写出队首已完成的结果；同时在途任务数不超过max_inflight
+            # 按序输出时队首任务较慢会使其后已完成的结果堆积在队列中，队列长度同样不超过max_inflight
+            pending = deque()
+            inflight = set()
+            for task in tasks:
+                future = executor.submit(run_task, task)
+                pending.append(future)
+                inflight.add(future)
+                while len(inflight) >= max_inflight or len(pending) >= max_inflight:
+                    wait_futures = inflight if len(inflight) >= max_inflight else [pending[0]]
+                    done, _ = wait(wait_futures, return_when=FIRST_COMPLETED)
+                    inflight -= done
+                    finished += _flush_results(pending, done, ordered, write_result)
+            while inflight:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                finished += _flush_results(pending, done, ordered, write_result)
+    return finished
+
+
+def _flush_results(pending, done, ordered, write_result):
+    count = 0
+    if ordered:
+        while pending and pending[0].done():
+            write_result(pending.popleft().result())
+            count += 1
+    else:
+        for future in done:
+            pending.remove(future)
+            write_result(future.result())
+            count += 1
+    return count
@@ -0,0 +1,311 @@
+import os
+import sys
+import copy
+import json
+import time
+import zlib
+import logging
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from src.config.config_loader import TaskCfg, HtmlSimCfg, OpenaiCfg
+from src.dom_tree.dom_preprocess import create_dom_processor
+from src.model.registry import EmbedRegistry
+from src.model.html_embedding import CssEmbedder
+from src.similarity import bow_vec_similarity, cosine_similarity, bow_similarity_matrix, cosine_similarity_matrix
+from src.benchmark.synthetic import generate_page
+from src.util.log_util import create_logger
+
+logger = create_logger(__name__)
+
+
+class FakeEmbedding:
+    '''
+    性能测试用的文本向量化后端：由文本crc32生成确定性的随机向量，可模拟每次请求的网络延迟，接口与OpenaiEmbedding一致
+    '''
+    # 每次get_text_embed调用的模拟延迟(秒)
+    latency = 0.0
+
+    def __init__(self, embed_dim=1536):
+        self.embed_dim = embed_dim
+        self.num_calls = 0
+        self.num_texts = 0
+
+    @classmethod
+    def from_config(cls, model_cfg: HtmlSimCfg, openai_cfg: OpenaiCfg):
+        return cls()
+
+    def get_text_embed(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        self.num_calls += 1
+        self.num_texts += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        embed_list = [np.random.default_rng(zlib.crc32(text.encode('utf-8'))).standard_normal(self.embed_dim).tolist()
+                      for text in texts]
+        if len(embed_list) == 1:
+            return embed_list[0]
+        return embed_list
+
+
+def register_fake_backend():
+    '''
+    注册fake向量化后端，只在性能测试中调用，导入本模块时不会注册到正式流程可选的后端中
+    '''
+    EmbedRegistry.register_backend('fake')(FakeEmbedding)
+
+
+def summarize(samples, units=1, num_bytes=0):
+    '''
+    统计单个阶段的耗时分布和吞吐
+    :param samples: 每次运行的耗时(秒)
+    :param units: 每次运行处理的页面数(打分阶段为页面对数)
+    :param num_bytes: 每次运行处理的html字节数
+    '''
+    samples = np.asarray(samples, dtype=np.float64)
+    mean = float(samples.mean())
+    stats = {
+        'repeat': len(samples),
+        'p50_ms': float(np.percentile(samples, 50)) * 1000,
+        'p90_ms': float(np.percentile(samples, 90)) * 1000,
+        'p99_ms': float(np.percentile(samples, 99)) * 1000,
+        'mean_ms': mean * 1000,
+        'units_per_s': units / mean if mean > 0 else 0.0,
+    }
+    if num_bytes:
+        stats['mb_per_s'] = num_bytes / (1 << 20) / mean if mean > 0 else 0.0
+    return stats
+
+
+def time_stage(fn, repeat, warmup=1):
+    '''
+    先预热warmup次，再运行repeat次记录每次耗时
+    '''
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure_peak_memory(fn):
+    '''
+    单独运行一次并用tracemalloc统计python对象的峰值内存(MB)，与计时分开运行，避免tracemalloc的开销影响耗时
+    '''
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1 << 20)
+
+
+def load_pages(datas_dir=None, synthetic_specs=(), num_rules=200):
+    '''
+    :param datas_dir: html样例所在目录，为空时不加载
+    :param synthetic_specs: 合成网页的(结点数, 深度)列表
+    :return [(页面名称, html源码), ...]
+    '''
+    pages = []
+    if datas_dir:
+        for file_name in sorted(os.listdir(datas_dir)):
+            if file_name.endswith('.html'):
+                with open(os.path.join(datas_dir, file_name), 'r', encoding='utf-8') as f:
+                    pages.append((file_name, f.read()))
+    for num_nodes, depth in synthetic_specs:
+        pages.append((f'synthetic_{num_nodes}x{depth}', generate_page(num_nodes, depth, num_rules)))
+    return pages
+
+
+def parse_synthetic_specs(text):
+    '''
+    解析"2000x30,20000x60"形式的合成网页规格
+    '''
+    specs = []
+    for spec in filter(None, text.split(',')):
+        num_nodes, _, depth = spec.partition('x')
+        specs.append((int(num_nodes), int(depth or 30)))
+    return specs
+
+
+class PipelineBenchmark:
+    '''
+    各流程阶段的性能测试：dom解析与预处理(bs4/lxml，是否添加css)、TreeNode遍历、
+    各注册的向量化方法(使用fake文本向量化后端)以及相似度计算
+    '''
+
+    def __init__(self, cfg: TaskCfg, repeat=5, measure_memory=True, stage_filter=None):
+        '''
+        :param stage_filter: 只运行名称以其中任一前缀开头的阶段，为空时运行全部阶段
+        '''
+        self.cfg = copy.deepcopy(cfg)
+        register_fake_backend()
+        self.cfg.similarity_model.embed_backend = 'fake'
+        self.repeat = repeat
+        self.measure_memory = measure_memory
+        self.stage_filter = stage_filter
+        self.embedders = {name: embedder_cls(self.cfg.similarity_model, self.cfg.openai)
+                          for name, embedder_cls in EmbedRegistry.model_dict.items()}
+        self.css_embedder = CssEmbedder(self.cfg.similarity_model, self.cfg.openai)
+
+    def html_cfg(self, parser_backend, include_css):
+        html_cfg = copy.copy(self.cfg.html)
+        html_cfg.parser_backend = parser_backend
+        html_cfg.include_css = include_css
+        # 性能测试不下载远端css
+        html_cfg.remote_css = False
+        return html_cfg
+
+    def page_stages(self, html_text):
+        '''
+        :return [(阶段名称, 待计时的函数), ...]
+        '''
+        stages = []
+        for backend in ['bs4', 'lxml']:
+            plain_cfg = self.html_cfg(backend, False)
+            css_cfg = self.html_cfg(backend, True)
+            stages.append((f'parse/{backend}', lambda cfg=plain_cfg: create_dom_processor(html_text, cfg)))
+            stages.append((f'preprocess/{backend}',
+                           lambda cfg=plain_cfg: create_dom_processor(html_text, cfg).preprocess()))
+            stages.append((f'preprocess_css/{backend}',
+                           lambda cfg=css_cfg: create_dom_processor(html_text, cfg).preprocess()))
+        dom_processor = create_dom_processor(html_text, self.html_cfg(self.cfg.html.parser_backend, False))
+        tree_root = dom_processor.preprocess()
+        exclude_attrs = self.cfg.similarity_model.embed_ignore_tags
+        stages.append(('tree/traverse_preorder', tree_root.traverse_preorder))
+        stages.append(('tree/structure_code', lambda: tree_root.get_html_structure_code(exclude_attrs)))
+        stages.append(('tree/subtree_code_lens', lambda: tree_root.get_subtree_code_lens(exclude_attrs)))
+        for name, embedder in self.embedders.items():
+            stages.append((f'embed/{name}', lambda embedder=embedder: embedder.get_feature_vec(tree_root)))
+        stages.append(('embed/css', lambda: self.css_embedder.get_feature_vec(dom_processor.css_dict)))
+        return stages
+
+    def score_stages(self, html_texts, matrix_size=64):
+        '''
+        基于各页面的bow和embedding特征，测试单对相似度函数和批量相似度矩阵
+        '''
+        bow_vecs, embed_vecs = [], []
+        for html_text in html_texts:
+            tree_root = create_dom_processor(html_text, self.html_cfg(self.cfg.html.parser_backend, False)).preprocess()
+            bow_vecs.append(self.embedders['bow'].get_feature_vec(tree_root))
+            embed_vecs.append(self.embedders['plain_text'].get_feature_vec(tree_root))
+        # 页面数不足时循环复用，构造matrix_size个向量
+        bow_batch = [bow_vecs[i % len(bow_vecs)] for i in range(matrix_size)]
+        embed_batch = [embed_vecs[i % len(embed_vecs)] for i in range(matrix_size)]
+        num_pairs = matrix_size * matrix_size
+        return [
+            ('score/bow_pair', lambda: bow_vec_similarity(bow_vecs[0], bow_vecs[-1]), 1),
+            ('score/cosine_pair', lambda: cosine_similarity(embed_vecs[0], embed_vecs[-1]), 1),
+            ('score/bow_matrix', lambda: bow_similarity_matrix(bow_batch, bow_batch), num_pairs),
+            ('score/cosine_matrix', lambda: cosine_similarity_matrix(embed_batch, embed_batch), num_pairs),
+        ]
+
+    def selected(self, stage_name):
+        return not self.stage_filter or any(stage_name.startswith(prefix) for prefix in self.stage_filter)
+
+    def run_stage(self, fn, units=1, num_bytes=0):
+        stats = summarize(time_stage(fn, self.repeat), units, num_bytes)
+        if self.measure_memory:
+            stats['peak_mem_mb'] = measure_peak_memory(fn)
+        return stats
+
+    def run(self, pages):
+        '''
+        :param pages: [(页面名称, html源码), ...]
+        :return {'页面名称/阶段名称': 统计结果}
+        '''
+        results = {}
+        for page_name, html_text in pages:
+            num_bytes = len(html_text.encode('utf-8'))
+            for stage_name, fn in self.page_stages(html_text):
+                if not self.selected(stage_name):
+                    continue
+                results[f'{page_name}/{stage_name}'] = self.run_stage(fn, 1, num_bytes)
+                logger.info(f'{page_name}/{stage_name} done')
+        if pages:
+            for stage_name, fn, units in self.score_stages([html_text for _, html_text in pages]):
+                if self.selected(stage_name):
+                    results[f'all/{stage_name}'] = self.run_stage(fn, units)
+        return results
+
+
+def compare_with_baseline(results, baseline, tolerance=0.2):
+    '''
+    与基线结果比较，p50耗时或峰值内存超过基线(1 + tolerance)倍的阶段视为性能回退，只比较两边都有的阶段
+    :return [(阶段, 指标, 基线值, 当前值, 比值), ...]
+    '''
+    regressions = []
+    for key, stats in results.items():
+        base_stats = baseline.get(key)
+        if base_stats is None:
+            continue
+        for metric in ['p50_ms', 'peak_mem_mb']:
+            if metric not in stats or not base_stats.get(metric):
+                continue
+            ratio = stats[metric] / base_stats[metric]
+            if ratio > 1 + tolerance:
+                regressions.append((key, metric, base_stats[metric], stats[metric], ratio))
+    return regressions
+
+
+def format_results(results):
+    lines = [f'{"stage":<60}{"p50_ms":>10}{"p90_ms":>10}{"p99_ms":>10}{"units/s":>12}{"MB/s":>10}{"peak_MB":>10}']
+    for key, stats in results.items():
+        lines.append(f'{key:<60}{stats["p50_ms"]:>10.2f}{stats["p90_ms"]:>10.2f}{stats["p99_ms"]:>10.2f}'
+                     f'{stats["units_per_s"]:>12.1f}{stats.get("mb_per_s", 0):>10.2f}'
+                     f'{stats.get("peak_mem_mb", 0):>10.2f}')
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='benchmark every stage of the page similarity pipeline')
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--datas', default='datas', help='directory of html fixtures, empty to skip')
+    parser.add_argument('--synthetic', default='2000x30,20000x60',
+                        help='synthetic pages as comma separated NODESxDEPTH, empty to skip')
+    parser.add_argument('--css-rules', type=int, default=200, help='number of css rules in each synthetic page')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stages', default='', help='comma separated stage prefixes to run, e.g. parse,embed/bow')
+    parser.add_argument('--fake-latency', type=float, default=0.0, help='simulated latency of each embedding call')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory run')
+    parser.add_argument('--output', help='json file to save the results')
+    parser.add_argument('--baseline', help='json file saved by a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown ratio over the baseline')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(args)
+    # 关闭流程中的info和debug日志，避免日志输出影响耗时
+    logging.disable(logging.INFO)
+    FakeEmbedding.latency = args.fake_latency
+    cfg = TaskCfg.load_config_yaml(args.config)
+    pages = load_pages(args.datas, parse_synthetic_specs(args.synthetic), args.css_rules)
+    benchmark = PipelineBenchmark(cfg, args.repeat, not args.no_memory, list(filter(None, args.stages.split(','))))
+    results = benchmark.run(pages)
+    print(format_results(results))
+    if args.output:
+        report = {
+            'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'repeat': args.repeat,
+                     'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for key, metric, base_value, value, ratio in regressions:
+            print(f'REGRESSION {key} {metric}: {base_value:.2f} -> {value:.2f} ({ratio:.2f}x)')
+        if not regressions:
+            print(f'no regression over {args.baseline} with tolerance {args.tolerance}')
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
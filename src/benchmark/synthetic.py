@@ -0,0 +1,87 @@
+import random
+from html import escape
+
+_TAGS = ['div', 'div', 'div', 'span', 'span', 'a', 'ul', 'li', 'p', 'section', 'img', 'button']
+# 只有容器元素可以包含子结点，p、a、li等元素嵌套时会被解析器提前闭合，改变页面深度
+_CONTAINER_TAGS = {'div', 'span', 'ul', 'section'}
+_VOID_TAGS = {'img'}
+_WORDS = ['home', 'product', 'cloud', 'service', 'news', 'support', 'price', 'login', 'search', 'more']
+
+
+def generate_page(num_nodes=2000, depth=30, num_rules=200, num_classes=50, seed=0):
+    '''
+    生成指定结点数和最大深度的合成网页，包含style、script和引用class/id的css规则，用于性能测试
+    先构建一条深度为depth的结点链保证达到最大深度，其余结点随机挂到深度未达上限的结点下
+    :param num_nodes: body中的元素结点数
+    :param depth: body以下的最大嵌套深度，lxml默认限制约为255层
+    '''
+    rand = random.Random(seed)
+    depth = min(max(2, depth), num_nodes)
+    parents = [-1] + list(range(depth - 1))
+    depths = list(range(depth))
+    open_nodes = list(range(depth - 1))
+    tags = [rand.choice([tag for tag in _TAGS if tag in _CONTAINER_TAGS]) for _ in range(depth)]
+    for idx in range(depth, num_nodes):
+        parent = rand.choice(open_nodes)
+        parents.append(parent)
+        depths.append(depths[parent] + 1)
+        tags.append(rand.choice(_TAGS))
+        if depths[idx] < depth - 1 and tags[idx] in _CONTAINER_TAGS:
+            open_nodes.append(idx)
+    children = [[] for _ in range(num_nodes)]
+    for idx in range(1, num_nodes):
+        children[parents[idx]].append(idx)
+
+    def open_tag(idx):
+        attrs = [f'class="c{rand.randrange(num_classes)} c{rand.randrange(num_classes)}"']
+        if rand.random() < 0.05:
+            attrs.append(f'id="n{idx}"')
+        if tags[idx] == 'a':
+            attrs.append(f'href="/{rand.choice(_WORDS)}/{idx}"')
+        elif tags[idx] == 'img':
+            attrs.append(f'src="/img/{idx}.png"')
+        if rand.random() < 0.1:
+            attrs.append(f'style="color:#{rand.randrange(1 << 24):06x}"')
+        return f'<{tags[idx]} {" ".join(attrs)}>'
+
+    # 迭代序列化，避免深层页面递归过深
+    body = []
+    stack = [(0, False)]
+    while stack:
+        idx, closing = stack.pop()
+        if closing:
+            body.append(f'</{tags[idx]}>')
+            continue
+        body.append(open_tag(idx))
+        if tags[idx] in _VOID_TAGS:
+            continue
+        if not children[idx]:
+            body.append(escape(rand.choice(_WORDS)))
+        stack.append((idx, True))
+        stack.extend((child, False) for child in reversed(children[idx]))
+    return '<html><head><meta charset="utf-8"><title>synthetic</title>' \
+           f'<style>{generate_css(num_rules, num_classes, num_nodes, rand)}</style>' \
+           '<script>var x = 1;</script></head><body>' + ''.join(body) + '</body></html>'
+
+
+def generate_css(num_rules, num_classes, num_nodes, rand):
+    '''
+    生成包含标签、class、id、后代、子代和伪类等常见形式的css规则
+    '''
+    forms = [
+        lambda: f'.c{rand.randrange(num_classes)}',
+        lambda: f'div.c{rand.randrange(num_classes)}',
+        lambda: f'#n{rand.randrange(num_nodes)}',
+        lambda: f'.c{rand.randrange(num_classes)} {rand.choice(_TAGS)}',
+        lambda: f'ul > li.c{rand.randrange(num_classes)}',
+        lambda: f'.c{rand.randrange(num_classes)}, .c{rand.randrange(num_classes)} a',
+        lambda: f'a.c{rand.randrange(num_classes)}:hover',
+        lambda: f'.c{rand.randrange(num_classes)} > span',
+        lambda: rand.choice(_TAGS),
+    ]
+    rules = []
+    for _ in range(num_rules):
+        selector = rand.choice(forms)()
+        rules.append(f'{selector}{{color:#{rand.randrange(1 << 24):06x};margin:{rand.randrange(20)}px;'
+                     f'display:{rand.choice(["block", "flex", "inline"])}}}')
+    return '\n'.join(rules)
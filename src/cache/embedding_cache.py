@@ -0,0 +1,61 @@
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+
+class EmbeddingCache:
+    '''
+    基于sqlite的文本embedding持久化缓存，key为(模型名, 文本)的hash，向量以float32二进制紧凑存储
+    '''
+
+    def __init__(self, db_file):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, data BLOB)')
+
+    @staticmethod
+    def make_key(model_name, text):
+        return hashlib.sha256(f'{model_name}\0{text}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        '''
+        批量查询缓存
+        :return key到embedding(float32数组)的字典，只包含命中的key
+        '''
+        keys = list(keys)
+        result = {}
+        with self._lock:
+            # sqlite单条语句的参数个数有限制，分批查询
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(f'SELECT key, data FROM embeddings WHERE key IN ({placeholders})', batch)
+                for key, data in rows:
+                    result[key] = np.frombuffer(data, dtype=np.float32)
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+        return result
+
+    def put_many(self, items):
+        '''
+        批量写入缓存
+        :param items: (key, embedding)列表
+        '''
+        rows = [(key, np.asarray(embed, dtype=np.float32).tobytes()) for key, embed in items]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?)', rows)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,125 @@
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from src.config.config_loader import TaskCfg
+from src.util.log_util import create_logger
+
+logger = create_logger(__name__)
+
+# 特征提取逻辑变化(不体现在配置中)时需要修改版本号，使旧的缓存失效
+FEATURE_VERSION = 2
+# 影响特征提取结果的similarity_model配置项；相似度阈值、cascade判别区间等只影响判别，不参与指纹计算
+FEATURE_CFG_FIELDS = ('method', 'feature_dim_bow', 'sparse_bow', 'signed_hash', 'css_normalize', 'embed_backend',
+                      'local_embed_dim', 'local_ngram_range', 'depth_decay', 'warmup_depth', 'min_height',
+                      'max_height', 'min_code_len', 'max_depth', 'embed_ignore_tags')
+
+
+def config_fingerprint(cfg: TaskCfg):
+    '''
+    根据影响特征提取结果的配置参数计算指纹，配置变化时缓存key随之变化，旧缓存自动失效
+    '''
+    relevant_cfg = {
+        'version': FEATURE_VERSION,
+        'html': {
+            'filter_tags': cfg.html.filter_tags,
+            'css_tags': cfg.html.css_tags,
+            'remote_css': cfg.html.remote_css,
+            'include_css': cfg.html.include_css,
+        },
+        'similarity_model': {field: getattr(cfg.similarity_model, field) for field in FEATURE_CFG_FIELDS},
+        'openai': {
+            'embed_model_name': cfg.openai.embed_model_name,
+            'max_text_len': cfg.openai.max_text_len,
+        },
+    }
+    cfg_text = json.dumps(relevant_cfg, sort_keys=True, default=str)
+    return hashlib.sha256(cfg_text.encode('utf-8')).hexdigest()
+
+
+class FeatureCache:
+    '''
+    基于sqlite的页面特征持久化缓存，缓存内容为(feature_vec, css_vec)，支持TTL过期和LRU淘汰
+    '''
+    # 每写入多少条记录检查一次过期和容量
+    evict_interval = 100
+
+    def __init__(self, db_file, ttl=None, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS features ('
+                               'key TEXT PRIMARY KEY, url TEXT, created REAL, accessed REAL, data BLOB)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_features_accessed ON features (accessed)')
+
+    @staticmethod
+    def make_key(url, html_text, cfg_fingerprint):
+        '''
+        缓存key由url、网页源码hash和配置指纹共同决定
+        '''
+        html_hash = hashlib.sha256(html_text.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f'{url}\0{html_hash}\0{cfg_fingerprint}'.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''
+        :return 缓存的(feature_vec, css_vec)，未命中或已过期时返回None
+        '''
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT created, data FROM features WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl and now - row[0] > self.ttl:
+                with self._conn:
+                    self._conn.execute('DELETE FROM features WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute('UPDATE features SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return pickle.loads(row[1])
+
+    def put(self, key, url, features):
+        now = time.time()
+        data = pickle.dumps(features, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?)',
+                                   (key, url, now, now, data))
+            self._puts += 1
+            if self._puts % self.evict_interval == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        with self._conn:
+            if self.ttl:
+                self._conn.execute('DELETE FROM features WHERE created < ?', (now - self.ttl,))
+            if self.max_entries:
+                # 超出容量时按最近访问时间淘汰
+                self._conn.execute('DELETE FROM features WHERE key IN (SELECT key FROM features '
+                                   'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM features').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM features')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -12,6 +12,28 @@ class OpenaiCfg:
         self.version = openai_cfg['version']
         self.embed_model_name = openai_cfg['embed_model_name']
         self.max_text_len = openai_cfg['max_text_len']
+        self.embed_cache_file = openai_cfg.get('embed_cache_file', '')
+        self.max_batch_size = openai_cfg.get('max_batch_size', 16)
+        self.max_batch_tokens = openai_cfg.get('max_batch_tokens', 32000)
+        self.rpm = openai_cfg.get('rpm', 0)
+        self.tpm = openai_cfg.get('tpm', 0)
+        self.max_workers = openai_cfg.get('max_workers', 4)
+        self.max_retries = openai_cfg.get('max_retries', 5)
+        self.retry_backoff = openai_cfg.get('retry_backoff', 1.0)
+        self.request_timeout = openai_cfg.get('request_timeout', 30)
+
+
+class RenderProfileCfg:
+    '''
+    webdriver_lite轻量渲染模式相关参数
+    '''
+
+    def __init__(self, profile_cfg):
+        self.block_resources = profile_cfg.get('block_resources', 'png,jpg,jpeg,gif,webp,svg,ico,bmp,mp4,webm,mp3,'
+                                                                  'ogg,wav,woff,woff2,ttf,otf,eot').split(',')
+        self.block_domains = [domain for domain in profile_cfg.get('block_domains', '').split(',') if domain]
+        self.viewport = [int(size) for size in str(profile_cfg.get('viewport', '1280,800')).split(',')]
+        self.js_budget = profile_cfg.get('js_budget', 2)
 
 
 class HtmlCfg:
@@ -22,10 +44,27 @@ class HtmlCfg:
     def __init__(self, html_cfg):
         self.fetch_method = html_cfg['fetch_method']
         self.driver_file = html_cfg['driver_file']
+        self.driver_pool_size = html_cfg.get('driver_pool_size', 1)
+        self.driver_headless = html_cfg.get('driver_headless', False)
+        self.max_pages_per_driver = html_cfg.get('max_pages_per_driver', 200)
+        self.page_load_timeout = html_cfg.get('page_load_timeout', 30)
+        self.ready_timeout = html_cfg.get('ready_timeout', 5)
+        self.network_idle_time = html_cfg.get('network_idle_time', 0.5)
+        self.lite_profile = RenderProfileCfg(html_cfg.get('lite_profile') or {})
+        self.max_connections = html_cfg.get('max_connections', 32)
+        self.max_connections_per_host = html_cfg.get('max_connections_per_host', 4)
+        self.request_timeout = html_cfg.get('request_timeout', 10)
+        self.max_retries = html_cfg.get('max_retries', 3)
+        self.retry_backoff = html_cfg.get('retry_backoff', 0.5)
+        self.parser_backend = html_cfg.get('parser_backend', 'bs4')
         self.filter_tags = html_cfg['filter_tags'].split(',')
         self.css_tags = html_cfg['css_tags'].split(',')
         self.remote_css = html_cfg['get_remote_css']
+        self.css_cache_max_age = html_cfg.get('css_cache_max_age', 300)
+        self.css_fetch_workers = html_cfg.get('css_fetch_workers', 8)
+        self.css_fetch_timeout = html_cfg.get('css_fetch_timeout', 3)
         self.include_css = html_cfg['include_css_in_html']
+        self.pipeline_workers = html_cfg.get('pipeline_workers', 8)
 
 
 class HtmlSimCfg:
@@ -36,6 +75,13 @@ class HtmlSimCfg:
     def __init__(self, sim_cfg):
         self.method = sim_cfg['method']
         self.feature_dim_bow = sim_cfg['feature_dim_bow']
+        self.sparse_bow = sim_cfg.get('sparse_bow', False)
+        self.signed_hash = sim_cfg.get('signed_hash', False)
+        self.css_normalize = sim_cfg.get('css_normalize', True)
+        self.embed_backend = sim_cfg.get('embed_backend', 'openai')
+        self.local_embed_dim = sim_cfg.get('local_embed_dim', 512)
+        self.local_ngram_range = tuple(int(n) for n in str(sim_cfg.get('local_ngram_range', '3,5')).split(','))
+        self.local_embed_workers = sim_cfg.get('local_embed_workers', 4)
         self.depth_decay = sim_cfg['depth_decay']
         self.warmup_depth = sim_cfg['warmup_depth']
         self.min_height = sim_cfg['min_height']
@@ -45,17 +91,58 @@ class HtmlSimCfg:
         self.embed_ignore_tags = sim_cfg['embed_ignore_tags'].split(',')
         self.bow_thre = sim_cfg['bow_threshold']
         self.embed_thre = sim_cfg['embedding_threshold']
+        self.cascade_embed_method = sim_cfg.get('cascade_embed_method', 'html_structure')
+        self.cascade_low = sim_cfg.get('cascade_low', 0.3)
+        self.cascade_high = sim_cfg.get('cascade_high', 0.8)
+        self.cascade_tree_cache = sim_cfg.get('cascade_tree_cache', 256)
+
+
+class CacheCfg:
+    '''
+    特征及embedding缓存相关参数
+    '''
+
+    def __init__(self, cache_cfg):
+        self.feature_cache_file = cache_cfg.get('feature_cache_file', '')
+        self.feature_cache_ttl = cache_cfg.get('feature_cache_ttl', 0)
+        self.feature_cache_max_entries = cache_cfg.get('feature_cache_max_entries', 0)
+
+
+class MonitorCfg:
+    '''
+    日志及流程指标相关参数
+    '''
+
+    def __init__(self, monitor_cfg):
+        self.log_level = monitor_cfg.get('log_level', 'INFO')
+        self.metrics_sink = monitor_cfg.get('metrics_sink', 'none')
+
+
+class ServiceCfg:
+    '''
+    http服务相关参数
+    '''
+
+    def __init__(self, service_cfg):
+        self.host = service_cfg.get('host', '127.0.0.1')
+        self.port = service_cfg.get('port', 8080)
+        self.max_pending = service_cfg.get('max_pending', 256)
+        self.max_batch_tasks = service_cfg.get('max_batch_tasks', 128)
 
 
 class TaskCfg:
-    def __init__(self, openai_cfg, html_cfg, sim_cfg):
+    def __init__(self, openai_cfg, html_cfg, sim_cfg, cache_cfg=None, monitor_cfg=None, service_cfg=None):
         self.openai = OpenaiCfg(openai_cfg)
         self.html = HtmlCfg(html_cfg)
         self.similarity_model = HtmlSimCfg(sim_cfg)
+        self.cache = CacheCfg(cache_cfg or {})
+        self.monitor = MonitorCfg(monitor_cfg or {})
+        self.service = ServiceCfg(service_cfg or {})
 
     @classmethod
     def load_config_yaml(cls, config_file):
         with open(config_file, 'r', encoding='utf-8') as f:
             cfg_obj = yaml.safe_load(f)
-        task_cfg = cls(cfg_obj['openai'], cfg_obj['html'], cfg_obj['similarity_model'])
+        task_cfg = cls(cfg_obj['openai'], cfg_obj['html'], cfg_obj['similarity_model'], cfg_obj.get('cache'),
+                       cfg_obj.get('monitor'), cfg_obj.get('service'))
         return task_cfg
\ No newline at end of file
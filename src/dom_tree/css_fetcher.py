@@ -0,0 +1,102 @@
+import time
+import logging
+import threading
+import cssutils
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from src.util.log_util import create_logger
+
+logger = create_logger(__name__)
+
+
+def parse_css_rules(css_text, css_parser=None):
+    '''
+    利用css_utils解析css源码
+    :return (selector, 属性字典)列表，顺序与源码中的规则顺序一致
+    '''
+    if css_parser is None:
+        css_parser = cssutils.CSSParser(loglevel=logging.CRITICAL)
+    stylesheet = css_parser.parseString(css_text)
+    rules = []
+    for rule in stylesheet:
+        if rule.type == rule.STYLE_RULE:
+            prop_info = {}
+            for property in rule.style:
+                prop_info[property.name] = property.value
+            rules.append((rule.selectorText, prop_info))
+    return rules
+
+
+class CssEntry:
+    def __init__(self, rules, etag, last_modified):
+        self.rules = rules
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.time()
+
+
+class StylesheetCache:
+    '''
+    远端css下载及缓存：通过共享的requests.Session并发下载，按url缓存解析后的css规则
+    缓存超过max_age后通过ETag/Last-Modified向服务端重新验证，未变化时直接复用解析结果
+    '''
+
+    def __init__(self, max_age=300, max_workers=8, timeout=3, max_entries=1024):
+        self.max_age = max_age
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_rules_batch(self, css_urls):
+        '''
+        并发获取多个css链接的解析结果
+        :return 与css_urls顺序一致的css规则列表，下载失败的链接对应空列表
+        '''
+        return list(self.executor.map(self.get_rules, css_urls))
+
+    def get_rules(self, css_url):
+        with self.lock:
+            entry = self.entries.get(css_url)
+            if entry is not None:
+                self.entries.move_to_end(css_url)
+        if entry is not None and time.time() - entry.fetched_at < self.max_age:
+            return entry.rules
+        headers = {}
+        if entry is not None:
+            # 缓存过期，带上验证信息请求，服务端返回304时复用缓存
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        try:
+            response = self.session.get(css_url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            logger.debug(f'download css from {css_url} fails')
+            return entry.rules if entry is not None else []
+        if response.status_code == 304 and entry is not None:
+            entry.fetched_at = time.time()
+            return entry.rules
+        if response.status_code != 200:
+            # 重新验证失败(例如服务端暂时不可用)时继续使用过期的缓存，下次请求时再验证
+            logger.debug(f'download css from {css_url} fails with status {response.status_code}')
+            return entry.rules if entry is not None else []
+        entry = CssEntry(parse_css_rules(response.text), response.headers.get('ETag'),
+                         response.headers.get('Last-Modified'))
+        with self.lock:
+            self.entries[css_url] = entry
+            self.entries.move_to_end(css_url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry.rules
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
@@ -0,0 +1,194 @@
+from collections import defaultdict
+
+# 复合选择器之间的组合符
+_COMBINATORS = ' \t\r\n\f>+~'
+
+
+def split_selector_group(selector):
+    '''
+    按顶层逗号拆分选择器组，忽略括号、中括号和引号中的逗号
+    '''
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    while i < len(selector):
+        char = selector[i]
+        if char == '\\':
+            i += 2
+            continue
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(selector[start:i].strip())
+            start = i + 1
+        i += 1
+    parts.append(selector[start:].strip())
+    return [part for part in parts if part]
+
+
+def split_compounds(selector):
+    '''
+    按顶层组合符将选择器拆分为复合选择器列表，忽略括号、中括号和引号中的字符
+    '''
+    compounds = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    while i < len(selector):
+        char = selector[i]
+        if char == '\\':
+            i += 2
+            continue
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char in _COMBINATORS and depth == 0:
+            compounds.append(selector[start:i])
+            start = i + 1
+        i += 1
+    compounds.append(selector[start:])
+    return [compound for compound in compounds if compound]
+
+
+def _read_ident(compound, pos):
+    '''
+    从pos开始读取css标识符并处理转义
+    :return (标识符, 结束位置)，包含无法简单处理的十六进制转义时标识符为None
+    '''
+    chars = []
+    safe = True
+    while pos < len(compound):
+        char = compound[pos]
+        if char == '\\' and pos + 1 < len(compound):
+            next_char = compound[pos + 1]
+            if next_char in '0123456789abcdefABCDEF':
+                safe = False
+            chars.append(next_char)
+            pos += 2
+        elif char.isalnum() or char in '-_' or ord(char) > 127:
+            chars.append(char)
+            pos += 1
+        else:
+            break
+    return (''.join(chars) if safe else None), pos
+
+
+def compound_keys(compound):
+    '''
+    提取复合选择器中元素必须满足的id、class和标签名，:not()等括号中的条件不计入
+    :return [('id'|'class'|'tag', 取值), ...]，id在前，其次class，最后标签名
+    '''
+    if '|' in compound.split('[')[0]:
+        # 带命名空间的选择器不提取
+        return []
+    ids, class_names, tag_names = [], [], []
+    depth = 0
+    pos = 0
+    while pos < len(compound):
+        char = compound[pos]
+        if char in '([':
+            depth += 1
+            pos += 1
+        elif char in ')]':
+            depth -= 1
+            pos += 1
+        elif depth > 0:
+            pos += 1
+        elif char in '#.':
+            ident, pos = _read_ident(compound, pos + 1)
+            if ident:
+                (ids if char == '#' else class_names).append(ident)
+        elif pos == 0 and char not in '*:':
+            ident, pos = _read_ident(compound, pos)
+            if ident:
+                tag_names.append(ident.lower())
+            elif pos == 0:
+                pos += 1
+        else:
+            pos += 1
+    return [('id', key) for key in ids] + [('class', key) for key in class_names] + [('tag', key) for key in tag_names]
+
+
+def selector_key(selector):
+    '''
+    计算单个选择器(不含逗号)的索引键：优先取最右侧复合选择器中的id，其次class，再次标签名
+    :return ('id'|'class'|'tag', 取值)，无法建立索引时返回None，此时需要与所有元素匹配
+    '''
+    compounds = split_compounds(selector)
+    keys = compound_keys(compounds[-1]) if compounds else []
+    return keys[0] if keys else None
+
+
+def required_keys(selector):
+    '''
+    单个选择器(不含逗号)匹配时文档中必须出现的id、class和标签名，包括祖先和兄弟结点上的条件
+    '''
+    return set(key for compound in split_compounds(selector) for key in compound_keys(compound))
+
+
+class CssRuleIndex:
+    '''
+    仿照浏览器的css规则索引：按选择器最右侧的id、class或标签名分桶，
+    每个元素只与可能匹配的候选规则逐一比较，不需要对每条规则遍历整个文档
+    '''
+
+    def __init__(self, selector_dict, compile_selector, document_keys=None):
+        '''
+        :param selector_dict: selector到css属性字典的映射，顺序即规则的优先顺序
+        :param compile_selector: 编译选择器的函数，不支持的选择器需要返回None
+        :param document_keys: 文档中出现的(id, class, 标签名)索引键集合，
+            传入时预先舍弃需要的id、class或标签名在文档中不存在的规则
+        '''
+        self.buckets = {'id': defaultdict(list), 'class': defaultdict(list), 'tag': defaultdict(list)}
+        self.universal_rules = []
+        self.rules = []
+        for order, (selector, css_prop_info) in enumerate(selector_dict.items()):
+            parts = split_selector_group(selector)
+            if document_keys is not None:
+                parts = [part for part in parts if required_keys(part) <= document_keys]
+                if not parts:
+                    continue
+            matcher = compile_selector(selector)
+            if matcher is None:
+                continue
+            rule = (order, matcher, css_prop_info)
+            self.rules.append(rule)
+            keys = set(selector_key(part) for part in parts)
+            if None in keys:
+                self.universal_rules.append(rule)
+                continue
+            for key_type, key in keys:
+                self.buckets[key_type][key].append(rule)
+
+    def candidate_rules(self, tag_name, element_id, class_names):
+        '''
+        根据元素的标签名、id和class取出候选规则
+        :return 按规则顺序排列且去重的候选规则列表
+        '''
+        candidates = list(self.universal_rules)
+        if element_id and element_id in self.buckets['id']:
+            candidates.extend(self.buckets['id'][element_id])
+        for class_name in class_names:
+            if class_name in self.buckets['class']:
+                candidates.extend(self.buckets['class'][class_name])
+        if tag_name in self.buckets['tag']:
+            candidates.extend(self.buckets['tag'][tag_name])
+        if len(candidates) > 1:
+            candidates = sorted(dict((rule[0], rule) for rule in candidates).values(), key=lambda rule: rule[0])
+        return candidates
@@ -1,10 +1,24 @@
 import bs4
+import soupsieve
 import logging
 import cssutils
-import requests
+from lxml import etree
+from urllib.parse import urljoin
+from bs4.builder import HTMLTreeBuilder
+from soupsieve import SelectorSyntaxError
+from src.dom_tree.css_fetcher import StylesheetCache, parse_css_rules
+from src.dom_tree.css_matcher import CssRuleIndex
 from src.dom_tree.html_tree import TreeNode
 from src.config.config_loader import HtmlCfg
 from src.util.log_util import create_logger
+from src.util.metrics import get_metrics_sink
+
+try:
+    import cssselect
+    from lxml.cssselect import LxmlTranslator
+except ImportError:
+    # cssselect为可选依赖，只在lxml解析方式下将css属性添加到dom结点时需要
+    cssselect = None
 
 logger = create_logger(__name__)
 
@@ -14,10 +28,15 @@ class DomProcessor:
     封装dom tree预处理相关的方法
     '''
 
-    def __init__(self, raw_html, html_cfg: HtmlCfg):
+    def __init__(self, raw_html, html_cfg: HtmlCfg, page_url=None, css_fetcher: StylesheetCache = None):
         self.css_parser = cssutils.CSSParser(loglevel=logging.CRITICAL)
         self.cfg = html_cfg
         self.dom = bs4.BeautifulSoup(raw_html, 'lxml')
+        # 页面url用于将相对路径的css链接转换为绝对路径
+        self.page_url = page_url
+        self.css_fetcher = css_fetcher
+        # 自定义html tree的结点数，preprocess后更新
+        self.num_nodes = 0
 
     def filter_dom(self):
         # 根据配置将指定的结点类型过滤
@@ -36,71 +55,435 @@ class DomProcessor:
             logger.debug('select css in dom tree done')
         self.css_dict = selector_dict
 
-    @staticmethod
-    def get_css_from_remote_url(css_link):
-        # 从远端下载css
-        try:
-            css_text = requests.get(css_link, timeout=1).text
-        except:
-            css_text = ''
-        return css_text
-
-    def get_css_selectors(self):
-        selector_dict = {}
+    def resolve_stylesheet_urls(self, hrefs, base_href=None):
+        '''
+        将css链接转换为绝对路径，相对路径基于<base href>或页面url转换
+        '''
+        base_url = self.page_url or ''
+        if base_href:
+            base_url = urljoin(base_url, base_href)
+        css_urls = []
+        for href in hrefs:
+            css_url = urljoin(base_url, href.strip())
+            if css_url.startswith(('http://', 'https://')):
+                css_urls.append(css_url)
+        return css_urls
 
-        def process_css_text(css_text):
-            # 利用css_utils解析css源码
-            stylesheet = self.css_parser.parseString(css_text)
-            for rule in stylesheet:
-                if rule.type == rule.STYLE_RULE:
-                    selector = rule.selectorText
-                    prop_info = {}
-                    for property in rule.style:
-                        prop_info[property.name] = property.value
-                    selector_dict[selector] = prop_info
+    def get_stylesheet_urls(self):
+        '''
+        获取页面中<link rel=stylesheet>链接的绝对路径
+        '''
+        base_node = self.dom.find('base', href=True)
+        hrefs = []
+        for link in self.dom.find_all('link'):
+            href = link.attrs.get('href', '')
+            rel = link.attrs.get('rel', '')
+            if href and 'stylesheet' in rel:
+                hrefs.append(href)
+        return self.resolve_stylesheet_urls(hrefs, base_node['href'] if base_node is not None else None)
 
+    def get_css_selectors(self):
+        css_texts = []
         for tag in self.cfg.css_tags:
             for style_node in self.dom.find_all(tag):
-                process_css_text(style_node.text)
+                css_texts.append(style_node.text)
                 style_node.extract()
-        if self.cfg.remote_css:
-            # 从远端下载css
-            for link in self.dom.find_all('link'):
-                href = link.attrs.get('href', '')
-                rel = link.attrs.get('rel', '')
-                if href and 'stylesheet' in rel:
-                    css_text = DomProcessor.get_css_from_remote_url(href)
-                    if css_text:
-                        process_css_text(css_text)
+        css_urls = self.get_stylesheet_urls() if self.cfg.remote_css else []
+        return self.build_selector_dict(css_texts, css_urls)
+
+    def build_selector_dict(self, css_texts, css_urls):
+        '''
+        解析页面内的css源码及远端css，按顺序合并为selector到属性字典的映射
+        '''
+        metrics = get_metrics_sink()
+        selector_dict = {}
+        with metrics.timer('css_parse'):
+            for css_text in css_texts:
+                selector_dict.update(parse_css_rules(css_text, self.css_parser))
+        if css_urls:
+            # 从远端并发下载css，结果按链接在页面中的顺序合并
+            with metrics.timer('css_fetch'):
+                css_fetcher = self.css_fetcher or StylesheetCache()
+                for rules in css_fetcher.get_rules_batch(css_urls):
+                    selector_dict.update(rules)
+                if self.css_fetcher is None:
+                    css_fetcher.close()
         return selector_dict
 
+    # 以下方法屏蔽bs4与lxml结点接口的差异，供preprocess中的单次遍历使用
+    def top_nodes(self):
+        return self.dom.contents
+
+    @staticmethod
+    def node_tag(node):
+        return node.name
+
+    @staticmethod
+    def node_children(node):
+        return node.children
+
+    @staticmethod
+    def wrap_node(node):
+        return node
+
+    @staticmethod
+    def node_attr(node, key):
+        return node.attrs.get(key, '')
+
+    @staticmethod
+    def node_rels(node):
+        return node.attrs.get('rel', [])
+
+    @staticmethod
+    def node_text(node):
+        return node.text
+
+    @staticmethod
+    def remove_node(node):
+        node.extract()
+
+    def preprocess(self):
+        '''
+        融合过滤结点、收集css以及构建自定义html tree的预处理，等价于依次调用filter_dom、process_css和transform_dom_tree
+        不需要将css添加到dom结点时只遍历一次dom tree，遍历次数与filter_tags和css_tags的数量无关；
+        需要添加css时先遍历一次过滤结点并收集css，根据selector添加css属性后再遍历一次构建树
+        :return 自定义html tree的根结点，css解析结果保存在css_dict中，树的结点数保存在num_nodes中
+        '''
+        if self.cfg.include_css:
+            self.css_dict = self.fused_walk(None)
+            logger.debug('begin to select css in dom tree')
+            with get_metrics_sink().timer('css_assign'):
+                self.assign_selector_to_nodes(self.css_dict)
+            logger.debug('select css in dom tree done')
+            return self.transform_dom_tree()
+        tree_root = TreeNode(tag_name='root', attr_dict={})
+        self.css_dict = self.fused_walk(tree_root)
+        self.num_nodes = tree_root.finish_build()
+        return tree_root
+
+    def fused_walk(self, tree_root):
+        '''
+        先序遍历一次dom tree：跳过filter_tags结点，收集css_tags中的css源码及stylesheet链接，
+        tree_root不为None时同时构建自定义html tree，否则从dom中删除过滤掉的结点和css结点
+        :return selector到属性字典的映射
+        '''
+        filter_tags = set(self.cfg.filter_tags)
+        css_tag_texts = {tag: [] for tag in self.cfg.css_tags}
+        hrefs = []
+        base_href = None
+        removed_nodes = []
+        # 栈中保存(dom结点, 自定义树中的父结点)；父结点为None时只收集css，不构建树
+        # 只有dom的第一个顶层结点参与构建树，与transform_dom_tree保持一致
+        top_nodes = list(self.top_nodes())
+        stack = [(node, tree_root if i == 0 else None) for i, node in enumerate(top_nodes)][::-1]
+        while stack:
+            node, parent_node = stack.pop()
+            tag = self.node_tag(node)
+            if not tag:
+                continue
+            if tag in filter_tags:
+                removed_nodes.append(node)
+                continue
+            if tag in css_tag_texts:
+                css_tag_texts[tag].append(self.node_text(node))
+                removed_nodes.append(node)
+                continue
+            if tag == 'link':
+                href = self.node_attr(node, 'href')
+                if href and 'stylesheet' in self.node_rels(node):
+                    hrefs.append(href)
+            elif tag == 'base' and base_href is None:
+                base_href = self.node_attr(node, 'href') or None
+            cur_node = None
+            if parent_node is not None:
+                cur_node, add_flag = parent_node.add_child(self.wrap_node(node))
+                if not add_flag:
+                    # 去重的sibling不加入树，但其子树中的css仍需要收集
+                    cur_node = None
+            children = list(self.node_children(node))
+            stack.extend((child, cur_node) for child in reversed(children))
+        if tree_root is None:
+            for node in removed_nodes:
+                self.remove_node(node)
+        css_texts = [text for tag in self.cfg.css_tags for text in css_tag_texts[tag]]
+        css_urls = self.resolve_stylesheet_urls(hrefs, base_href) if self.cfg.remote_css else []
+        return self.build_selector_dict(css_texts, css_urls)
+
+    @staticmethod
+    def element_keys(tag_name, element_id, class_names):
+        # 结点对应的css规则索引键
+        keys = [('tag', tag_name)] + [('class', class_name) for class_name in class_names]
+        if element_id:
+            keys.append(('id', element_id))
+        return keys
+
     def assign_selector_to_nodes(self, selector_dict):
-        # 使用bs4基于selector找到修饰的dom，把css属性添加到dom属性中
-        for selector in selector_dict:
-            css_prop_info = selector_dict[selector]
+        # 按selector最右侧的id、class或标签名建立css规则索引，每个dom结点只与候选规则匹配，把css属性添加到dom属性中
+        namespaces = getattr(self.dom, '_namespaces', None)
+
+        def compile_selector(selector):
             try:
-                ele_list = self.dom.select(selector)
-                for ele in ele_list:
-                    ele.attrs['css_mark'] = 1
-                    for key in css_prop_info:
-                        if key not in ele.attrs:
-                            ele.attrs[key] = css_prop_info.get(key)
-            except NotImplementedError:
-                pass
+                return soupsieve.compile(selector, namespaces=namespaces)
+            except (SelectorSyntaxError, NotImplementedError):
+                # 伪元素等不支持的selector直接跳过
+                return None
+
+        elements = []
+        document_keys = set()
+        for ele in self.dom.find_all(True):
+            class_names = ele.attrs.get('class') or []
+            if isinstance(class_names, str):
+                class_names = class_names.split()
+            elements.append((ele, ele.attrs.get('id'), class_names))
+            document_keys.update(self.element_keys(ele.name, ele.attrs.get('id'), class_names))
+        rule_index = CssRuleIndex(selector_dict, compile_selector, document_keys)
+        for ele, ele_id, class_names in elements:
+            for _, matcher, css_prop_info in rule_index.candidate_rules(ele.name, ele_id, class_names):
+                if not matcher.match(ele):
+                    continue
+                # 新版本bs4会将属性值转为字符串，统一使用字符串'1'
+                ele.attrs['css_mark'] = '1'
+                for key in css_prop_info:
+                    if key not in ele.attrs:
+                        ele.attrs[key] = css_prop_info.get(key)
 
     def transform_dom_tree(self):
-        # 通过先序遍历构建自定义html tree，便于后续向量化计算
+        # 通过先序遍历构建自定义html tree，便于后续向量化计算；使用显式栈避免深层页面超过递归深度限制
         tree_root = TreeNode(tag_name='root', attr_dict={})
-
-        def build_recursive(dom_node, parent_node):
-            if dom_node.name:
-                cur_node, add_flag = parent_node.add_child(dom_node)
+        top_nodes = list(self.top_nodes())
+        stack = [(top_nodes[0], tree_root)] if top_nodes else []
+        while stack:
+            dom_node, parent_node = stack.pop()
+            if self.node_tag(dom_node):
+                cur_node, add_flag = parent_node.add_child(self.wrap_node(dom_node))
                 if add_flag:
-                    for child in dom_node.children:
-                        build_recursive(child, cur_node)
-
-        dom_root = self.dom.contents[0]
-        build_recursive(dom_root, tree_root)
-        # 构建完成后将TreeNode的index清零，避免下一次实例化时index继续累加
-        TreeNode.on_build()
+                    children = list(self.node_children(dom_node))
+                    stack.extend((child, cur_node) for child in reversed(children))
+        # 构建完成后释放sibling去重等构建状态
+        self.num_nodes = tree_root.finish_build()
         return tree_root
+
+
+class LxmlNode:
+    '''
+    lxml结点的轻量封装，提供与bs4结点相同的name和attrs接口，使TreeNode.create_dom_node_desc结果与bs4一致
+    '''
+    __slots__ = ('element', 'name', 'attrs')
+    # 与bs4相同，这些属性按空白切分为多值属性
+    multi_valued_attrs = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+    def __init__(self, element, css_mark=False):
+        self.element = element
+        self.name = element.tag
+        attrs = {}
+        global_multi = self.multi_valued_attrs.get('*', ())
+        tag_multi = self.multi_valued_attrs.get(self.name, ())
+        for key, value in element.attrib.items():
+            if key in global_multi or key in tag_multi:
+                value = value.split()
+            attrs[key] = value
+        if css_mark:
+            # 与bs4解析方式中设置的值及类型一致
+            attrs['css_mark'] = '1'
+        self.attrs = attrs
+
+
+class LxmlDomProcessor(DomProcessor):
+    '''
+    基于lxml元素树的dom tree预处理，跳过bs4对象模型，直接由lxml元素构建TreeNode
+    '''
+
+    def __init__(self, raw_html, html_cfg: HtmlCfg, page_url=None, css_fetcher: StylesheetCache = None):
+        self.css_parser = cssutils.CSSParser(loglevel=logging.CRITICAL)
+        self.cfg = html_cfg
+        # 带编码声明的unicode字符串无法直接交给lxml解析，统一转为utf-8字节
+        parser = etree.HTMLParser(encoding='utf-8')
+        self.dom = etree.fromstring(raw_html.encode('utf-8'), parser)
+        self.page_url = page_url
+        self.css_fetcher = css_fetcher
+        if self.cfg.include_css and cssselect is None:
+            raise ImportError('cssselect is required to assign css to nodes with parser_backend lxml, '
+                              'install cssselect or set html.include_css_in_html to false')
+        # 匹配到css规则的lxml元素，构建结点时标记css_mark，不写入元素属性以免与网页自带的属性混淆
+        self.css_marked = set()
+        # 自定义html tree的结点数，preprocess后更新
+        self.num_nodes = 0
+
+    def top_nodes(self):
+        return [] if self.dom is None else [self.dom]
+
+    @staticmethod
+    def node_tag(node):
+        # 注释、处理指令等结点的tag不是字符串
+        return node.tag if isinstance(node.tag, str) else None
+
+    @staticmethod
+    def node_children(node):
+        return node
+
+    def wrap_node(self, node):
+        return LxmlNode(node, node in self.css_marked)
+
+    @staticmethod
+    def node_attr(node, key):
+        return node.get(key, '')
+
+    @staticmethod
+    def node_rels(node):
+        return node.get('rel', '').split()
+
+    @staticmethod
+    def node_text(node):
+        return ''.join(node.itertext())
+
+    @staticmethod
+    def remove_node(node):
+        parent = node.getparent()
+        if parent is not None:
+            parent.remove(node)
+
+    def filter_dom(self):
+        if self.dom is None:
+            return
+        for element in list(self.dom.iter(*self.cfg.filter_tags)):
+            self.remove_node(element)
+
+    def get_stylesheet_urls(self):
+        if self.dom is None:
+            return []
+        base_href = None
+        for base_node in self.dom.iter('base'):
+            if base_node.get('href'):
+                base_href = base_node.get('href')
+                break
+        hrefs = []
+        for link in self.dom.iter('link'):
+            href = link.get('href', '')
+            if href and 'stylesheet' in self.node_rels(link):
+                hrefs.append(href)
+        return self.resolve_stylesheet_urls(hrefs, base_href)
+
+    def get_css_selectors(self):
+        css_texts = []
+        if self.dom is not None:
+            for tag in self.cfg.css_tags:
+                for style_node in list(self.dom.iter(tag)):
+                    css_texts.append(self.node_text(style_node))
+                    self.remove_node(style_node)
+        css_urls = self.get_stylesheet_urls() if self.cfg.remote_css else []
+        return self.build_selector_dict(css_texts, css_urls)
+
+    def assign_selector_to_nodes(self, selector_dict):
+        # 与bs4相同按selector最右侧的id、class或标签名建立css规则索引，每个dom结点只与候选规则匹配，把css属性添加到dom属性中
+        # selector通过cssselect转为以当前结点为起点的xpath，逐个结点判断是否匹配
+        if self.dom is None:
+            return
+        translator = SelfXPathTranslator()
+
+        def compile_selector(selector):
+            try:
+                return etree.XPath(css_to_self_xpath(selector, translator), extensions=_OF_TYPE_FUNCTIONS)
+            except (cssselect.SelectorError, cssselect.ExpressionError, etree.XPathSyntaxError):
+                # 伪元素等不支持的selector直接跳过
+                return None
+
+        elements = []
+        document_keys = set()
+        for ele in self.dom.iter():
+            if isinstance(ele.tag, str):
+                class_names = ele.get('class', '').split()
+                elements.append((ele, ele.get('id'), class_names))
+                document_keys.update(self.element_keys(ele.tag, ele.get('id'), class_names))
+        rule_index = CssRuleIndex(selector_dict, compile_selector, document_keys)
+        for ele, ele_id, class_names in elements:
+            for _, matcher, css_prop_info in rule_index.candidate_rules(ele.tag, ele_id, class_names):
+                if not matcher(ele):
+                    continue
+                self.css_marked.add(ele)
+                for key in css_prop_info:
+                    if key not in ele.attrib:
+                        ele.set(key, css_prop_info.get(key))
+
+
+# 不带标签名的*:first-of-type等伪类在cssselect中未实现，临时使用该标签名生成条件后替换为扩展函数
+_OF_TYPE_ELEMENT = 'webpage-sim-of-type'
+
+
+def _count_siblings_of_type(context, following=False):
+    # xpath扩展函数：统计当前结点之前(或之后)与其标签名相同的兄弟结点数
+    node = context.context_node
+    return float(sum(1 for sibling in node.itersiblings(preceding=not following) if sibling.tag == node.tag))
+
+
+_OF_TYPE_FUNCTIONS = {
+    (None, 'preceding-of-type'): _count_siblings_of_type,
+    (None, 'following-of-type'): lambda context: _count_siblings_of_type(context, following=True),
+}
+
+
+def _any_of_type(method):
+    def wrapper(self, xpath, *args):
+        if xpath.element != '*':
+            return method(self, xpath, *args)
+        xpath.element = _OF_TYPE_ELEMENT
+        method(self, xpath, *args)
+        xpath.element = '*'
+        xpath.condition = xpath.condition.replace(f'count(preceding-sibling::{_OF_TYPE_ELEMENT})',
+                                                  'preceding-of-type()')
+        xpath.condition = xpath.condition.replace(f'count(following-sibling::{_OF_TYPE_ELEMENT})',
+                                                  'following-of-type()')
+        return xpath
+    return wrapper
+
+
+if cssselect is not None:
+    class SelfXPathTranslator(LxmlTranslator):
+        '''
+        在lxml的css转换基础上支持不带标签名的*:first-of-type、*:nth-of-type()等伪类，与soupsieve的匹配结果保持一致
+        '''
+        xpath_first_of_type_pseudo = _any_of_type(LxmlTranslator.xpath_first_of_type_pseudo)
+        xpath_last_of_type_pseudo = _any_of_type(LxmlTranslator.xpath_last_of_type_pseudo)
+        xpath_only_of_type_pseudo = _any_of_type(LxmlTranslator.xpath_only_of_type_pseudo)
+        xpath_nth_of_type_function = _any_of_type(LxmlTranslator.xpath_nth_of_type_function)
+        xpath_nth_last_of_type_function = _any_of_type(LxmlTranslator.xpath_nth_last_of_type_function)
+
+
+def _self_xpath_step(parsed_tree, translator):
+    '''
+    将cssselect解析得到的选择器转为判断当前结点是否匹配的xpath步骤：最右侧复合选择器作用于当前结点，
+    左侧的部分按组合符依次转为ancestor、parent或preceding-sibling轴上的条件
+    '''
+    if not isinstance(parsed_tree, cssselect.parser.CombinedSelector):
+        expr = translator.xpath(parsed_tree)
+        return f'{expr.element}[{expr.condition}]' if expr.condition else expr.element
+    right_step = _self_xpath_step(parsed_tree.subselector, translator)
+    left_step = _self_xpath_step(parsed_tree.selector, translator)
+    axis = {
+        ' ': 'ancestor::',
+        '>': 'parent::',
+        '+': 'preceding-sibling::*[1]/self::',
+        '~': 'preceding-sibling::',
+    }[parsed_tree.combinator]
+    return f'{right_step}[{axis}{left_step}]'
+
+
+def css_to_self_xpath(selector, translator):
+    '''
+    将css选择器(组)转为以当前结点为上下文的xpath，结果非空表示当前结点匹配该选择器，
+    单个结点的匹配只需要检查其祖先和兄弟结点，不需要遍历整个文档
+    '''
+    steps = []
+    for parsed in cssselect.parse(selector):
+        if parsed.pseudo_element:
+            raise cssselect.ExpressionError('Pseudo-elements are not supported.')
+        steps.append('self::' + _self_xpath_step(parsed.parsed_tree, translator))
+    return ' | '.join(steps)
+
+
+def create_dom_processor(raw_html, html_cfg: HtmlCfg, page_url=None, css_fetcher: StylesheetCache = None):
+    '''
+    根据配置的parser_backend创建dom tree预处理类
+    '''
+    if html_cfg.parser_backend == 'lxml':
+        return LxmlDomProcessor(raw_html, html_cfg, page_url, css_fetcher)
+    return DomProcessor(raw_html, html_cfg, page_url, css_fetcher)
@@ -1,32 +1,43 @@
+import sys
+import itertools
 import numpy as np
 
+# 子树序列化时保留的最大结点深度，更深的结点被舍弃
+MAX_CODE_DEPTH = 100
+
 
 class TreeNode:
     '''
     自定义html tree的树结点结构
+    使用__slots__减少每个结点的内存占用，结点类型和属性名等重复出现的字符串做intern共享
+    结点index由所在树共享的计数器按创建顺序分配，不同线程同时构建多棵树时互不影响
     '''
-    _index = 0
+    __slots__ = ('tag_name', 'attr_dict', 'index', 'depth', 'height', 'children', 'child_keys', 'counter')
 
-    def __init__(self, tag_name, attr_dict, depth=0):
-        self.tag_name = tag_name
+    def __init__(self, tag_name, attr_dict, depth=0, counter=None):
+        self.tag_name = sys.intern(str(tag_name))
         self.attr_dict = attr_dict
-        self.index = TreeNode._index
-        TreeNode._index += 1
+        # 未传入计数器时当前结点为新树的根结点，index从0开始
+        self.counter = itertools.count() if counter is None else counter
+        self.index = next(self.counter)
         self.depth = depth  # 树的深度
         self.height = 0  # 当前结点的子树高度
         self.children = []
-        self.child_keys = set()
+        # sibling去重用的集合只在构建时需要，添加第一个子结点时才创建，构建完成后释放
+        self.child_keys = None
 
     def add_child(self, dom_node):
         '''
         根据传入的dom结点在新构建的树中添加子结点
         '''
         dom_node_desc, node_attr_dict = TreeNode.create_dom_node_desc(dom_node)
+        if self.child_keys is None:
+            self.child_keys = set()
         if dom_node_desc in self.child_keys and len(node_attr_dict) > 1:
             # 属性相同的siblings只添加一个
             return None, False
         else:
-            child_node = TreeNode(dom_node.name, node_attr_dict, self.depth + 1)
+            child_node = TreeNode(dom_node.name, node_attr_dict, self.depth + 1, self.counter)
             self.children.append(child_node)
             self.child_keys.add(dom_node_desc)
             return child_node, True
@@ -64,73 +75,123 @@ class TreeNode:
                 if value_text == '' or 'javascript' in value_text or value_text.startswith('url('):
                     continue
                 node_text += f'{key}={value_text}|'
-                attr_dict[key] = value_text
+                attr_dict[sys.intern(str(key))] = sys.intern(str(value_text))
             while node_text.endswith('|'):
                 node_text = node_text[:-1]
         if node_text.endswith('->'):
             node_text = node_text[:-1]
         return node_text, attr_dict
 
-    @classmethod
-    def on_build(cls):
-        # 构建新树完成时调用，将index清零，防止多次实例化时index不断累加
-        cls._index = 0
+    def finish_build(self):
+        '''
+        以当前结点为根的树构建完成时调用，释放各结点构建时使用的child_keys和计数器
+        :return 树的结点数
+        '''
+        num_nodes = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.child_keys = None
+            node.counter = None
+            stack.extend(node.children)
+            num_nodes += 1
+        return num_nodes
 
     def traverse_preorder(self):
         '''
         先序遍历得到结点列表，以及计算各结点高度
+        使用显式栈迭代遍历，避免层级很深的页面超过递归深度限制；先序序列逆序即可保证子结点先于父结点计算高度
         '''
-        node_list = []
-        height = 0
-        if self.tag_name != 'root':
-            node_list.append(self)
-        for child_node in self.children:
-            sub_nodes, sub_height = child_node.traverse_preorder()
-            node_list.extend(sub_nodes)
-            height = max(height, sub_height)
-        height += 1
-        self.height = height
-        return node_list, height
+        order = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(reversed(node.children))
+        for node in reversed(order):
+            node.height = 1 + max((child.height for child in node.children), default=0)
+        node_list = order if self.tag_name != 'root' else order[1:]
+        return node_list, self.height
 
-    def get_html_structure_code(self, exclude_attrs, max_depth=100):
+    def get_html_structure_code(self, exclude_attrs, max_depth=MAX_CODE_DEPTH):
         '''
-        将当前结点对应的子树序列化为html源文本
+        将当前结点对应的子树序列化为html源文本，每个开始或结束标签占一行
         '''
-        if self.depth < max_depth:
-            html_code = self.get_node_html_tag(exclude_attrs)
-        elif self.depth == max_depth:
-            return self.get_node_html_tag() + f'</{self.tag_name}>'
-        else:
-            return ''
-        if self.children:
-            for child_node in self.children:
-                child_code = child_node.get_html_structure_code(exclude_attrs, max_depth)
-                if child_code:
-                    html_code += '\n' + child_code
-        if self.tag_name != 'root':
-            html_code += f'\n</{self.tag_name}>'
-        if html_code.startswith('\n'):
-            html_code = html_code[1:]
-        return html_code
+        lines = []
+        # 栈中元素为待展开的结点，或者字符串形式的结束标签
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                lines.append(node)
+            elif node.depth < max_depth:
+                html_tag = node.get_node_html_tag(exclude_attrs)
+                if html_tag:
+                    lines.append(html_tag)
+                if node.tag_name != 'root':
+                    stack.append(f'</{node.tag_name}>')
+                stack.extend(reversed(node.children))
+            elif node.depth == max_depth:
+                lines.append(node.get_node_html_tag() + f'</{node.tag_name}>')
+        return '\n'.join(lines)
 
-    def get_structure_embed(self, node_embed_list):
+    def get_subtree_code_lens(self, exclude_attrs, max_depth=MAX_CODE_DEPTH):
         '''
-        利用先序遍历将子树embedding逐层向上聚合，得到最终树的embedding
-        '''
-        # 根结点的embedding为空
-        node_base_embed = node_embed_list[self.index - 1][0] if self.index > 0 else None
-        child_embeds = []
-        # 对于叶子结点对应的子树分治获取对应embedding
-        for child in self.children:
-            child_idx = child.index
-            child_embed, child_tag = node_embed_list[child_idx]
-            if child_tag == 1:
-                child_embeds.append(child_embed)
+        自底向上一次遍历计算当前树中各结点子树序列化结果的长度，与get_html_structure_code的结果一致，但不拼接字符串
+        :return (结点index到序列化长度的字典, 结点index到结点html文本的字典)
+        '''
+        order = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(reversed(node.children))
+        # 各子树序列化后的字符数(不含换行)和行数，行之间以换行符连接
+        code_sizes = {}
+        code_lens = {}
+        tag_texts = {}
+        for node in reversed(order):
+            if node.depth < max_depth:
+                tag_text = tag_texts[node.index] = node.get_node_html_tag(exclude_attrs)
+                chars, lines = len(tag_text), int(bool(tag_text))
+                if node.tag_name != 'root':
+                    chars, lines = chars + len(node.tag_name) + 3, lines + 1
+                for child in node.children:
+                    child_chars, child_lines = code_sizes[child.index]
+                    chars, lines = chars + child_chars, lines + child_lines
+            elif node.depth == max_depth:
+                chars, lines = len(node.get_node_html_tag()) + len(node.tag_name) + 3, 1
             else:
-                child_embeds.append(child.get_structure_embed(node_embed_list))
-        # 这里采用简单平均聚合；实际在有训练情况下，可以采用transform等复杂结构聚合捕捉子节点序关系
-        child_embeds = np.array(child_embeds)
-        node_embed = np.mean(child_embeds, axis=0)
-        if node_base_embed is not None:
-            node_embed = (node_base_embed + node_embed) / 2
-        return node_embed
+                chars, lines = 0, 0
+            code_sizes[node.index] = (chars, lines)
+            code_lens[node.index] = chars + lines - 1 if lines else 0
+        return code_lens, tag_texts
+
+    def get_structure_embed(self, node_embed_list):
+        '''
+        利用后序遍历将子树embedding逐层向上聚合，得到最终树的embedding
+        '''
+        node_embeds = {}
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                # 对于叶子结点对应的子树直接使用其embedding，其余子树分治获取embedding
+                for child in node.children:
+                    if node_embed_list[child.index][1] != 1:
+                        stack.append((child, False))
+                continue
+            # 根结点的embedding为空
+            node_base_embed = node_embed_list[node.index - 1][0] if node.index > 0 else None
+            child_embeds = []
+            for child in node.children:
+                child_embed, child_tag = node_embed_list[child.index]
+                child_embeds.append(child_embed if child_tag == 1 else node_embeds.pop(child.index))
+            # 这里采用简单平均聚合；实际在有训练情况下，可以采用transform等复杂结构聚合捕捉子节点序关系
+            child_embeds = np.array(child_embeds)
+            node_embed = np.mean(child_embeds, axis=0)
+            if node_base_embed is not None:
+                node_embed = (node_base_embed + node_embed) / 2
+            node_embeds[node.index] = node_embed
+        return node_embeds[self.index]
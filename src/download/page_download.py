@@ -1,8 +1,18 @@
 import time
+import queue
+import random
+import asyncio
+import threading
+import aiohttp
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException, TimeoutException, JavascriptException
 from selenium.webdriver.chrome.service import Service
 from src.config.config_loader import HtmlCfg
+from src.util.log_util import create_logger
+
+logger = create_logger(__name__)
 
 
 class Downloader:
@@ -12,6 +22,16 @@ class Downloader:
     def get_html(self, url):
         raise NotImplementedError
 
+    def get_html_batch(self, urls):
+        '''
+        批量下载网页，默认逐个下载；支持并发下载的子类可以重写
+        :return 与urls顺序一致的网页源码列表，下载失败的网页为空字符串
+        '''
+        return [self.get_html(url) for url in urls]
+
+    def close(self):
+        pass
+
 
 class BaseDownloader(Downloader):
     def __init__(self, cfg):
@@ -38,16 +58,250 @@ class BaseDownloader(Downloader):
         return html_src
 
 
+class AsyncDownloader(Downloader):
+    '''
+    基于asyncio的并发下载器，按host复用keep-alive连接池，并限制全局及单个host的并发数
+    事件循环运行在后台线程中，连接池在多次调用之间保持复用
+    '''
+    # 出现以下状态码时重试，其余非200状态码直接返回下载失败
+    retry_status = {429, 500, 502, 503, 504}
+
+    def __init__(self, cfg: HtmlCfg):
+        super(AsyncDownloader, self).__init__(cfg)
+        self.headers = {
+            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36',
+            'accept': 'text/html,application/xhtml+xml,*/*',
+            'accept-encoding': 'gzip, deflate',
+            'accept-language': 'zh-CN,zh;q=0.9',
+        }
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+
+    async def _get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.cfg.max_connections,
+                                             limit_per_host=self.cfg.max_connections_per_host)
+            timeout = aiohttp.ClientTimeout(total=self.cfg.request_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers)
+        return self.session
+
+    async def fetch(self, url):
+        '''
+        下载单个网页，失败时按指数退避加随机抖动重试
+        '''
+        session = await self._get_session()
+        for trial in range(self.cfg.max_retries + 1):
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return await response.text(errors='replace')
+                    if response.status not in self.retry_status:
+                        return ''
+            except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError):
+                pass
+            if trial < self.cfg.max_retries:
+                await asyncio.sleep(self.cfg.retry_backoff * (2 ** trial) * random.uniform(0.5, 1.5))
+        return ''
+
+    async def fetch_many(self, urls):
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
+
+    def run(self, coro):
+        '''
+        在后台事件循环中执行协程并同步等待结果
+        '''
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get_html(self, url):
+        return self.run(self.fetch(url))
+
+    def get_html_batch(self, urls):
+        return self.run(self.fetch_many(urls))
+
+    def close(self):
+        if self.session is not None:
+            self.run(self.session.close())
+            self.session = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+
+
+class DriverSession:
+    '''
+    浏览器会话及其已加载的网页数，用于达到上限后回收会话
+    '''
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.page_count = 0
+
+
 class WebDriverDownloader(Downloader):
+    '''
+    基于selenium的网页下载器，维护一组可复用的浏览器会话并行下载网页
+    网页加载后等待document就绪及网络空闲(不超过最大等待时间)，会话崩溃或加载网页数达到上限时回收重建
+    '''
+
     def __init__(self, cfg: HtmlCfg):
         super(WebDriverDownloader, self).__init__(cfg)
-        self.driver = webdriver.Chrome(service=Service(cfg.driver_file))
+        # 信号量限制同时使用的会话数，空闲会话放入队列复用
+        self.slots = threading.Semaphore(cfg.driver_pool_size)
+        self.idle_sessions = queue.SimpleQueue()
+        self.all_sessions = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=cfg.driver_pool_size)
+        self.ready_timeout = cfg.ready_timeout
+
+    def build_options(self):
+        options = webdriver.ChromeOptions()
+        if self.cfg.driver_headless:
+            options.add_argument('--headless=new')
+        return options
+
+    def create_driver(self):
+        driver = webdriver.Chrome(service=Service(self.cfg.driver_file), options=self.build_options())
+        driver.set_page_load_timeout(self.cfg.page_load_timeout)
+        return driver
+
+    def acquire_session(self):
+        '''
+        获取会话：优先复用空闲会话，没有空闲会话时新建
+        '''
+        self.slots.acquire()
+        try:
+            return self.idle_sessions.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            session = DriverSession(self.create_driver())
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.all_sessions.add(session)
+        return session
+
+    def release_session(self, session, broken=False):
+        if broken or session.page_count >= self.cfg.max_pages_per_driver:
+            # 会话崩溃或加载网页过多(可能存在内存泄漏)时关闭，下次需要时重新创建
+            with self.lock:
+                self.all_sessions.discard(session)
+            self.quit_session(session)
+        else:
+            self.idle_sessions.put(session)
+        self.slots.release()
+
+    @staticmethod
+    def quit_session(session):
+        try:
+            session.driver.quit()
+        except Exception:
+            # chromedriver已退出时quit同样会失败，直接丢弃会话
+            pass
+
+    def wait_ready(self, driver):
+        '''
+        等待document加载完成且一段时间内没有新的资源请求，超过ready_timeout后直接使用当前dom
+        '''
+        deadline = time.time() + self.ready_timeout
+        last_count = -1
+        idle_since = time.time()
+        try:
+            while time.time() < deadline:
+                ready_state, resource_count = driver.execute_script(
+                    "return [document.readyState, performance.getEntriesByType('resource').length]")
+                if resource_count != last_count:
+                    last_count = resource_count
+                    idle_since = time.time()
+                if ready_state == 'complete' and time.time() - idle_since >= self.cfg.network_idle_time:
+                    return
+                time.sleep(0.1)
+        except JavascriptException:
+            pass
 
     def get_html(self, url):
         try:
-            self.driver.get(url)
-        except:
+            session = self.acquire_session()
+        except Exception:
+            logger.warning(f'create webdriver session for {url} fails', exc_info=True)
             return ''
-        time.sleep(1)
-        html_src = self.driver.page_source
-        return html_src
+        broken = False
+        try:
+            session.page_count += 1
+            try:
+                session.driver.get(url)
+            except TimeoutException:
+                # 网页加载超时，仍然尝试使用已加载的dom
+                pass
+            self.wait_ready(session.driver)
+            return session.driver.page_source
+        except Exception:
+            # 除WebDriverException外，chromedriver进程退出时会抛出未经selenium封装的urllib3异常，同样回收会话后重建
+            logger.warning(f'download {url} by webdriver fails, recycle the session', exc_info=True)
+            broken = True
+            return ''
+        finally:
+            self.release_session(session, broken)
+
+    def get_html_batch(self, urls):
+        return list(self.executor.map(self.get_html, urls))
+
+    def close(self):
+        self.executor.shutdown()
+        with self.lock:
+            sessions = list(self.all_sessions)
+            self.all_sessions.clear()
+        for session in sessions:
+            self.quit_session(session)
+
+
+class LiteWebDriverDownloader(WebDriverDownloader):
+    '''
+    只获取最终dom结构的轻量渲染模式：屏蔽图片、媒体、字体及指定第三方域名的请求，
+    页面加载策略为eager(DOMContentLoaded后即返回)，并限制视窗大小和等待js执行的时间
+    '''
+
+    def __init__(self, cfg: HtmlCfg):
+        super(LiteWebDriverDownloader, self).__init__(cfg)
+        self.profile = cfg.lite_profile
+        self.ready_timeout = min(cfg.ready_timeout, self.profile.js_budget)
+
+    def build_options(self):
+        options = super(LiteWebDriverDownloader, self).build_options()
+        options.page_load_strategy = 'eager'
+        width, height = self.profile.viewport
+        options.add_argument(f'--window-size={width},{height}')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--mute-audio')
+        options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.managed_default_content_settings.media_stream': 2,
+        })
+        return options
+
+    def blocked_url_patterns(self):
+        patterns = [f'*.{ext}' for ext in self.profile.block_resources]
+        patterns.extend(f'*{domain}/*' for domain in self.profile.block_domains)
+        return patterns
+
+    def create_driver(self):
+        driver = super(LiteWebDriverDownloader, self).create_driver()
+        # 通过chrome devtools协议在网络层屏蔽资源请求
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_url_patterns()})
+        return driver
+
+
+def create_downloader(cfg: HtmlCfg):
+    '''
+    根据配置的fetch_method创建网页下载器
+    '''
+    if cfg.fetch_method == 'webdriver':
+        return WebDriverDownloader(cfg)
+    if cfg.fetch_method == 'webdriver_lite':
+        return LiteWebDriverDownloader(cfg)
+    if cfg.fetch_method == 'async':
+        return AsyncDownloader(cfg)
+    return BaseDownloader(cfg)
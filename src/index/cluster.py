@@ -0,0 +1,196 @@
+import json
+import argparse
+import numpy as np
+from array import array
+from functools import lru_cache
+from src.config.config_loader import TaskCfg
+from src.index.lsh import simhash_signature, HyperplaneHasher
+from src.model.sparse_vector import vec_from_json
+from src.similarity import score_feature_matrix, uses_bow_features
+from src.util.log_util import create_logger
+
+logger = create_logger(__name__)
+
+
+class UnionFind:
+    '''
+    基于numpy数组的并查集，用于合并相似网页得到聚类
+    '''
+
+    def __init__(self, size):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            # 路径减半压缩
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        root_x, root_y = self.find(x), self.find(y)
+        if root_x == root_y:
+            return False
+        if root_x > root_y:
+            root_x, root_y = root_y, root_x
+        self.parent[root_y] = root_x
+        return True
+
+    def roots(self):
+        return np.array([self.find(x) for x in range(len(self.parent))], dtype=np.int64)
+
+
+class FeatureFile:
+    '''
+    按行存储页面特征的jsonl文件，每行格式为{"url": ..., "feature_vec": ..., "css_vec": ...}
+    只在内存中保存每行的文件偏移，按需读取特征，使内存占用与网页数量线性且很小
+    '''
+
+    def __init__(self, file_path, cache_size=10000):
+        self.file_path = file_path
+        self.offsets = array('q')
+        self.file = open(file_path, 'rb')
+        self.read_record = lru_cache(maxsize=cache_size)(self._read_record)
+
+    def scan(self):
+        '''
+        顺序扫描文件，记录每行偏移
+        :return 逐行产出(序号, 记录)
+        '''
+        self.file.seek(0)
+        offset = 0
+        for line in self.file:
+            if line.strip():
+                self.offsets.append(offset)
+                yield len(self.offsets) - 1, json.loads(line)
+            offset += len(line)
+
+    def _read_record(self, idx):
+        self.file.seek(self.offsets[idx])
+        return json.loads(self.file.readline())
+
+    def read_features(self, idx):
+        record = self.read_record(idx)
+        return vec_from_json(record.get('feature_vec')) or [], vec_from_json(record.get('css_vec'))
+
+    def close(self):
+        self.file.close()
+
+
+class TemplateCluster:
+    '''
+    大规模网页模板聚类：LSH分段分桶产生候选对，使用get_similarity相同的阈值确认相似边，并查集合并得到聚类
+    '''
+
+    def __init__(self, cfg: TaskCfg, num_bits=64, num_bands=4, window=10, seed=0):
+        self.cfg = cfg
+        self.num_bits = num_bits
+        # 默认每段16位，无关网页落入同一个桶的概率很小，桶内基本只有同模板的网页
+        self.num_bands = num_bands
+        # 同一个桶内按签名排序后，每个网页最多与前window个网页比较，限制大桶的比较次数
+        self.window = window
+        self.seed = seed
+        self.hyperplane_hasher = None
+
+    def signature(self, feature_vec):
+        if uses_bow_features(self.cfg):
+            return simhash_signature(feature_vec, self.num_bits, self.seed)
+        if self.hyperplane_hasher is None:
+            self.hyperplane_hasher = HyperplaneHasher(len(feature_vec), self.num_bits, self.seed)
+        return self.hyperplane_hasher.signature(feature_vec)
+
+    def is_similar(self, feature_file, idx1, idx2):
+        sim_flags, _ = score_feature_matrix(self.cfg, [feature_file.read_features(idx1)],
+                                            [feature_file.read_features(idx2)])
+        return bool(sim_flags[0, 0])
+
+    def run(self, feature_file: FeatureFile):
+        '''
+        :return (并查集, 各网页确认的相似边数)
+        '''
+        signatures = array('Q')
+        for _, record in feature_file.scan():
+            feature_vec = vec_from_json(record.get('feature_vec'))
+            # 特征提取失败的网页签名记为0，不参与比较
+            signatures.append(self.signature(feature_vec) if feature_vec else 0)
+        signatures = np.frombuffer(signatures, dtype=np.uint64) if len(signatures) else np.zeros(0, np.uint64)
+        size = len(signatures)
+        logger.info(f'signatures of {size} pages done')
+        union_find = UnionFind(size)
+        degrees = np.zeros(size, dtype=np.int32)
+        valid = signatures != 0
+        band_bits = self.num_bits // self.num_bands
+        compare_count = 0
+        for band in range(self.num_bands):
+            shift = band * band_bits
+            keys = (signatures >> np.uint64(shift)) & np.uint64((1 << band_bits) - 1)
+            # 桶内按完整签名排序，签名相近的网页相邻，窗口限制下仍能比较到输入文件中相距很远的同模板网页；
+            # 各段使用不同的循环移位，使不同段中参与排序的高位不同
+            rotated = signatures if shift == 0 else \
+                ((signatures >> np.uint64(shift)) | (signatures << np.uint64(self.num_bits - shift))) \
+                & np.uint64((1 << self.num_bits) - 1)
+            order = np.flatnonzero(valid)
+            order = order[np.lexsort((rotated[order], keys[order]))]
+            sorted_keys = keys[order]
+            # 相同取值的连续区间即为一个桶
+            bounds = np.flatnonzero(np.diff(sorted_keys)) + 1
+            for bucket in np.split(order, bounds):
+                for pos in range(1, len(bucket)):
+                    idx = bucket[pos]
+                    for prev in bucket[max(0, pos - self.window):pos]:
+                        if union_find.find(idx) == union_find.find(prev):
+                            continue
+                        compare_count += 1
+                        if self.is_similar(feature_file, prev, idx):
+                            union_find.union(prev, idx)
+                            degrees[prev] += 1
+                            degrees[idx] += 1
+            logger.info(f'band {band} done, {compare_count} pairs compared')
+        return union_find, degrees
+
+    def iter_clusters(self, feature_file: FeatureFile, union_find, degrees, min_size=2):
+        '''
+        :return 逐个产出聚类，包含成员url列表，以及代表网页(确认相似边最多的成员)
+        '''
+        roots = union_find.roots()
+        order = np.argsort(roots, kind='stable')
+        bounds = np.flatnonzero(np.diff(roots[order])) + 1
+        cluster_id = 0
+        for members in np.split(order, bounds):
+            if len(members) < min_size:
+                continue
+            representative = members[np.argmax(degrees[members])]
+            yield {
+                'cluster_id': cluster_id,
+                'size': len(members),
+                'representative': feature_file.read_record(representative)['url'],
+                'members': [feature_file.read_record(idx)['url'] for idx in members],
+            }
+            cluster_id += 1
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='cluster pages of the same template from stored feature vectors')
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--input', required=True, help='jsonl file with url, feature_vec and css_vec of each page')
+    parser.add_argument('--output', required=True, help='jsonl file to write clusters')
+    parser.add_argument('--num-bands', type=int, default=4)
+    parser.add_argument('--window', type=int, default=10)
+    parser.add_argument('--min-size', type=int, default=2)
+    args = parser.parse_args(args)
+    cfg = TaskCfg.load_config_yaml(args.config)
+    feature_file = FeatureFile(args.input)
+    cluster = TemplateCluster(cfg, num_bands=args.num_bands, window=args.window)
+    union_find, degrees = cluster.run(feature_file)
+    cluster_count = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for cluster_info in cluster.iter_clusters(feature_file, union_find, degrees, args.min_size):
+            f.write(json.dumps(cluster_info, ensure_ascii=False) + '\n')
+            cluster_count += 1
+    feature_file.close()
+    logger.info(f'{cluster_count} clusters written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
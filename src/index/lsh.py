@@ -0,0 +1,60 @@
+import numpy as np
+from src.model.sparse_vector import SparseVector
+
+_MASK64 = (1 << 64) - 1
+
+
+def mix64(values, seed=0):
+    '''
+    splitmix64混合函数，将整数数组确定性地映射为均匀分布的64位hash
+    '''
+    x = np.asarray(values, dtype=np.uint64) + np.uint64((0x9E3779B97F4A7C15 * (seed + 1)) & _MASK64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _pack_bits(bits):
+    signature = 0
+    for pos in np.flatnonzero(bits):
+        signature |= 1 << int(pos)
+    return signature
+
+
+def simhash_signature(feature_vec, num_bits=64, seed=0):
+    '''
+    计算bag-of-words特征的SimHash签名：每个特征下标对应一个伪随机的±1向量，按特征取值加权求和后取符号
+    两个签名的汉明距离近似反映特征向量之间的夹角
+    '''
+    if not isinstance(feature_vec, SparseVector):
+        feature_vec = SparseVector.from_dense(feature_vec)
+    if feature_vec.nnz == 0:
+        return 0
+    hashes = mix64(feature_vec.indices, seed)
+    bits = (hashes[:, None] >> np.arange(num_bits, dtype=np.uint64)) & np.uint64(1)
+    signs = bits.astype(np.float64) * 2 - 1
+    return _pack_bits(feature_vec.values @ signs > 0)
+
+
+class HyperplaneHasher:
+    '''
+    稠密embedding的随机超平面签名，超平面由固定随机种子生成，保证签名可复现
+    '''
+
+    def __init__(self, dim, num_bits=64, seed=0):
+        self.dim = dim
+        self.num_bits = num_bits
+        self.planes = np.random.default_rng(seed).standard_normal((num_bits, dim))
+
+    def signature(self, embed):
+        return _pack_bits(self.planes @ np.asarray(embed, dtype=np.float64) > 0)
+
+
+def band_keys(signature, num_bits=64, num_bands=4):
+    '''
+    将签名按位切分为num_bands段，签名中任意一段完全相同的向量成为候选对
+    :return 各段的取值列表
+    '''
+    band_bits = num_bits // num_bands
+    band_mask = (1 << band_bits) - 1
+    return [(signature >> (band * band_bits)) & band_mask for band in range(num_bands)]
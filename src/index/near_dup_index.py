@@ -0,0 +1,128 @@
+import os
+import json
+import pickle
+import numpy as np
+from src.index.lsh import simhash_signature, HyperplaneHasher, band_keys
+from src.similarity import bow_similarity_matrix, cosine_similarity_matrix
+
+
+class NearDupIndex:
+    '''
+    网页特征的近似重复检索索引
+    bow特征使用SimHash签名，embedding特征使用随机超平面签名，签名按段(LSH banding)建立倒排桶；
+    查询时从桶中召回候选页面，再用bow_vec_similarity/cosine_similarity精确计算相似度重排序
+    默认64位签名分为4段、每段16位，无关页面落入同一个桶的概率约为4/65536，候选列表保持很短；
+    签名汉明距离不超过3的页面至少有一段完全相同，一定会被召回
+    '''
+    meta_file = 'meta.json'
+    data_file = 'data.pkl'
+
+    def __init__(self, method='bow', num_bits=64, num_bands=4, seed=0):
+        if num_bits % num_bands != 0:
+            raise ValueError(f'num_bits {num_bits} must be divisible by num_bands {num_bands}')
+        self.method = method
+        self.num_bits = num_bits
+        self.num_bands = num_bands
+        self.seed = seed
+        self.hyperplane_hasher = None
+        # key -> (feature_vec, css_vec, 签名)
+        self.entries = {}
+        self.buckets = [{} for _ in range(num_bands)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def signature(self, feature_vec):
+        if self.method == 'bow':
+            return simhash_signature(feature_vec, self.num_bits, self.seed)
+        if self.hyperplane_hasher is None:
+            self.hyperplane_hasher = HyperplaneHasher(len(feature_vec), self.num_bits, self.seed)
+        return self.hyperplane_hasher.signature(feature_vec)
+
+    def add(self, key, feature_vec, css_vec=None):
+        '''
+        添加页面特征，key已存在时覆盖原有特征
+        '''
+        if key in self.entries:
+            self.remove(key)
+        signature = self.signature(feature_vec)
+        self.entries[key] = (feature_vec, css_vec, signature)
+        for band, band_key in enumerate(band_keys(signature, self.num_bits, self.num_bands)):
+            self.buckets[band].setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for band, band_key in enumerate(band_keys(entry[2], self.num_bits, self.num_bands)):
+            bucket = self.buckets[band].get(band_key)
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[band][band_key]
+        return True
+
+    def candidates(self, feature_vec):
+        '''
+        召回与查询特征至少有一段签名相同的页面
+        '''
+        keys = set()
+        for band, band_key in enumerate(band_keys(self.signature(feature_vec), self.num_bits, self.num_bands)):
+            keys.update(self.buckets[band].get(band_key, ()))
+        return keys
+
+    def score(self, feature_vec, css_vec, keys):
+        '''
+        精确计算查询特征与候选页面的相似度；查询和候选页面都有css特征时，与css相似度取平均
+        '''
+        vecs = [self.entries[key][0] for key in keys]
+        if self.method == 'bow':
+            scores = bow_similarity_matrix([feature_vec], vecs)[0]
+        else:
+            scores = cosine_similarity_matrix([feature_vec], vecs)[0]
+        if css_vec is not None:
+            css_keys = [i for i, key in enumerate(keys) if self.entries[key][1] is not None]
+            if css_keys:
+                css_scores = bow_similarity_matrix([css_vec], [self.entries[keys[i]][1] for i in css_keys])[0]
+                scores[css_keys] = (scores[css_keys] + css_scores) / 2
+        return scores
+
+    def query(self, feature_vec, css_vec=None, top_k=10, min_score=None):
+        '''
+        :return 按相似度降序排列的(key, 相似度)列表，最多top_k个
+        '''
+        keys = list(self.candidates(feature_vec))
+        if not keys:
+            return []
+        scores = self.score(feature_vec, css_vec, keys)
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        results = [(keys[i], float(scores[i])) for i in order]
+        if min_score is not None:
+            results = [(key, score) for key, score in results if score >= min_score]
+        return results
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        meta = {'method': self.method, 'num_bits': self.num_bits, 'num_bands': self.num_bands, 'seed': self.seed}
+        with open(os.path.join(index_dir, self.meta_file), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        with open(os.path.join(index_dir, self.data_file), 'wb') as f:
+            pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, cls.meta_file), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(**meta)
+        with open(os.path.join(index_dir, cls.data_file), 'rb') as f:
+            entries = pickle.load(f)
+        # 签名随数据保存，加载时只需重建倒排桶
+        for key, (feature_vec, css_vec, signature) in entries.items():
+            if index.method != 'bow' and index.hyperplane_hasher is None:
+                index.hyperplane_hasher = HyperplaneHasher(len(feature_vec), index.num_bits, index.seed)
+            index.entries[key] = (feature_vec, css_vec, signature)
+            for band, band_key in enumerate(band_keys(signature, index.num_bits, index.num_bands)):
+                index.buckets[band].setdefault(band_key, set()).add(key)
+        return index
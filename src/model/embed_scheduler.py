@@ -0,0 +1,130 @@
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from src.util.log_util import create_logger
+from src.util.metrics import get_metrics_sink
+
+logger = create_logger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    # tiktoken为可选依赖，未安装时按字节数估计token数
+    _encoding = None
+
+
+def estimate_tokens(text):
+    '''
+    估计文本的token数，安装tiktoken时精确计算，否则按utf-8字节数的1/3估计(html源码的token通常更短，估计偏保守)
+    '''
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+class RateLimiter:
+    '''
+    按每分钟请求数(rpm)和token数(tpm)限流，统计最近window秒内已发出的请求，预算不足时阻塞等待
+    rpm或tpm为0时不限制对应维度
+    '''
+
+    def __init__(self, rpm=0, tpm=0, window=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.history = deque()
+        self.used_tokens = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, tokens):
+        # 单个批次超过tpm时只要窗口内没有其它请求也可以发出，避免永久等待
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                while self.history and now - self.history[0][0] >= self.window:
+                    _, expired_tokens = self.history.popleft()
+                    self.used_tokens -= expired_tokens
+                rpm_ok = not self.rpm or len(self.history) < self.rpm
+                tpm_ok = not self.tpm or self.used_tokens + tokens <= self.tpm
+                if rpm_ok and tpm_ok:
+                    self.history.append((now, tokens))
+                    self.used_tokens += tokens
+                    return
+                self.cond.wait(self.window - (now - self.history[0][0]))
+
+
+class EmbedScheduler:
+    '''
+    文本embedding请求调度：按文本数和token数切分批次，在rpm/tpm预算内用线程池并发请求，
+    可重试的错误按带随机抖动的指数退避重试，结果与输入顺序一致
+    '''
+
+    def __init__(self, request_fn, max_batch_size=16, max_batch_tokens=32000, rpm=0, tpm=0, max_workers=4,
+                 max_retries=5, retry_backoff=1.0, retryable_errors=(), retry_after=None):
+        '''
+        :param request_fn: 请求一个批次embedding的函数，输入文本列表，返回等长的embedding列表
+        :param retryable_errors: 需要重试的异常类型
+        :param retry_after: 从异常中获取服务端建议等待时间(秒)的函数，返回None时按退避时间等待
+        '''
+        self.request_fn = request_fn
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retryable_errors = retryable_errors
+        self.retry_after = retry_after
+        self.rate_limiter = RateLimiter(rpm, tpm)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def make_batches(self, texts):
+        '''
+        按顺序贪心切分批次，每批文本数不超过max_batch_size，token数不超过max_batch_tokens
+        :return [(批次中文本的起始下标, 文本列表, token数), ...]
+        '''
+        batches = []
+        start, batch, batch_tokens = 0, [], 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append((start, batch, batch_tokens))
+                start, batch, batch_tokens = i, [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append((start, batch, batch_tokens))
+        return batches
+
+    def request_batch(self, texts, tokens):
+        trial = 0
+        while True:
+            self.rate_limiter.acquire(tokens)
+            try:
+                return self.request_fn(texts)
+            except self.retryable_errors as err:
+                if trial >= self.max_retries:
+                    raise
+                delay = self.retry_after(err) if self.retry_after is not None else None
+                if delay is None:
+                    delay = self.retry_backoff * (2 ** trial) * (0.5 + random.random())
+                logger.warning(f'embedding request fails with {type(err).__name__}, retry after {delay:.2f}s')
+                get_metrics_sink().inc('embed_retries', error=type(err).__name__)
+                time.sleep(delay)
+                trial += 1
+
+    def run(self, texts):
+        '''
+        :return 与texts顺序一致的embedding列表
+        '''
+        batches = self.make_batches(texts)
+        futures = [self.executor.submit(self.request_batch, batch, tokens) for _, batch, tokens in batches]
+        embeds = [None] * len(texts)
+        for (start, batch, _), future in zip(batches, futures):
+            embeds[start:start + len(batch)] = future.result()
+        return embeds
+
+    def close(self):
+        self.executor.shutdown()
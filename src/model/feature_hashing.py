@@ -0,0 +1,72 @@
+import zlib
+import numpy as np
+from src.model.sparse_vector import SparseVector
+
+
+def stable_hash(word):
+    '''
+    与进程无关的32位字符串hash(crc32)，替代每个进程随机加盐的内置hash，保证特征可跨进程复用
+    '''
+    return zlib.crc32(word.encode('utf-8'))
+
+
+class FeatureHasher:
+    '''
+    确定性的特征hash引擎：虚拟word经crc32映射到特征下标，一次numpy累加得到整个特征向量
+    '''
+    _SIGN_BIT = 1 << 31
+
+    def __init__(self, dim, signed=False, depth_decay=1.0, warmup_depth=0, max_cached_words=1 << 20):
+        self.dim = dim
+        self.signed = signed
+        self.depth_decay = depth_decay
+        self.warmup_depth = warmup_depth
+        self.max_cached_words = max_cached_words
+        # 页面之间大量虚拟word重复出现，缓存word的hash结果
+        self._hash_cache = {}
+        self._depth_weights = self._build_depth_weights(64)
+
+    def _build_depth_weights(self, max_depth):
+        # 预计算各深度的衰减权重表，前warmup_depth层不做衰减
+        depths = np.arange(max_depth + 1)
+        return self.depth_decay ** np.maximum(0, depths - self.warmup_depth)
+
+    def depth_weights(self, depths):
+        '''
+        查表得到各深度对应的衰减权重
+        '''
+        depths = np.asarray(depths, dtype=np.int64)
+        if len(depths) and depths.max() >= len(self._depth_weights):
+            self._depth_weights = self._build_depth_weights(int(depths.max()) * 2)
+        return self._depth_weights[depths]
+
+    def hash_words(self, words):
+        '''
+        批量计算虚拟word的hash值
+        :return uint32数组
+        '''
+        cache = self._hash_cache
+        if len(cache) > self.max_cached_words:
+            cache.clear()
+        hashes = np.empty(len(words), dtype=np.uint32)
+        for i, word in enumerate(words):
+            word_hash = cache.get(word)
+            if word_hash is None:
+                word_hash = cache[word] = stable_hash(word)
+            hashes[i] = word_hash
+        return hashes
+
+    def transform(self, words, weights=None, sparse=False):
+        '''
+        将虚拟word及其权重映射为特征向量
+        signed为True时用hash最高位决定取值符号，使hash冲突的期望影响相互抵消
+        :return sparse为True时返回SparseVector，否则返回长度为dim的稠密列表
+        '''
+        hashes = self.hash_words(words)
+        indices = (hashes % self.dim).astype(np.int64)
+        weights = np.ones(len(words)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if self.signed:
+            weights = np.where(hashes & self._SIGN_BIT, -weights, weights)
+        if sparse:
+            return SparseVector.from_pairs(indices, weights, self.dim)
+        return np.bincount(indices, weights=weights, minlength=self.dim).tolist()
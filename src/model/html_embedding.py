@@ -1,8 +1,15 @@
+import re
+import numpy as np
 from src.config.config_loader import HtmlSimCfg, OpenaiCfg
 from src.dom_tree.html_tree import TreeNode
+from src.dom_tree.css_matcher import split_selector_group
+# 导入各文本向量化后端，完成后端注册
 from src.model.openai_model import OpenaiEmbedding
+from src.model.local_model import LocalEmbedding
 from src.model.registry import EmbedRegistry
+from src.model.feature_hashing import FeatureHasher
 from src.util.log_util import create_logger
+from src.util.metrics import get_metrics_sink
 
 logger = create_logger(__name__)
 
@@ -14,7 +21,9 @@ class Embedder:
 
     def __init__(self, model_cfg: HtmlSimCfg, openai_cfg: OpenaiCfg):
         self.cfg = model_cfg
-        self.openai_embed_model = OpenaiEmbedding(openai_cfg)
+        # 按配置从注册器中获取文本向量化后端，默认调用openai接口
+        backend_cls = EmbedRegistry.get_backend_cls(model_cfg.embed_backend)
+        self.text_embed_model = backend_cls.from_config(model_cfg, openai_cfg)
 
     def get_feature_vec(self, tree_root: TreeNode):
         raise NotImplementedError
@@ -22,35 +31,34 @@ class Embedder:
 
 @EmbedRegistry.registry('bow')
 class BowEmbedder(Embedder):
+    def __init__(self, model_cfg: HtmlSimCfg, openai_cfg: OpenaiCfg):
+        super(BowEmbedder, self).__init__(model_cfg, openai_cfg)
+        # 深度衰减系数，深度越大，对应结点特征权重越低；前warmup_depth层不做衰减
+        self.hasher = FeatureHasher(model_cfg.feature_dim_bow, signed=model_cfg.signed_hash,
+                                    depth_decay=model_cfg.depth_decay, warmup_depth=model_cfg.warmup_depth)
+
     def get_feature_vec(self, tree_root: TreeNode):
         '''
         利用节点类型和属性值构造虚拟word，利用bag-of-words和hash构造特征
         :return dom_tree的特征向量
         '''
-        feature_vec = [0] * self.cfg.feature_dim_bow
+        words, depths, css_marks = [], [], []
         # 先序遍历得到结点列表
         node_list, _ = tree_root.traverse_preorder()
-        # 深度衰减系数，深度越大，对应结点特征权重越低
-        decay = self.cfg.depth_decay
-        warmup_depth = self.cfg.warmup_depth
         for node in node_list:
             attr_dict = node.attr_dict
-            depth = node.depth
-            css_mark = attr_dict.get('css_mark', 0)
+            css_mark = bool(attr_dict.get('css_mark', 0))
             for attr_key, attr_value in attr_dict.items():
                 if attr_key == 'css_mark':
                     continue
                 # 利用结点和属性信息构造虚拟word
-                word = f'{node.tag_name}_{attr_key}_{attr_value}'
-                # 根据深度衰减计算权重
-                weight = decay ** max(0, depth - warmup_depth)
-                if css_mark:
-                    # 对css修饰的结点，增加权重
-                    weight = min(1, weight * 2)
-                word_hash = abs(hash(word)) % (10 ** 8)
-                index = word_hash % self.cfg.feature_dim_bow
-                feature_vec[index] += weight
-        return feature_vec
+                words.append(f'{node.tag_name}_{attr_key}_{attr_value}')
+                depths.append(node.depth)
+                css_marks.append(css_mark)
+        # 根据深度衰减查表计算权重，对css修饰的结点增加权重
+        weights = self.hasher.depth_weights(depths)
+        weights = np.where(css_marks, np.minimum(1, weights * 2), weights)
+        return self.hasher.transform(words, weights, sparse=self.cfg.sparse_bow)
 
 
 @EmbedRegistry.registry('plain_text')
@@ -58,50 +66,50 @@ class TextEmbedder(Embedder):
 
     def get_feature_vec(self, tree_root: TreeNode):
         '''
-        将处理后的domTree序列化为html源文本后，利用openai text-embddding向量化
+        将处理后的domTree序列化为html源文本后，利用文本向量化后端(默认openai text-embddding)向量化
         :return dom_tree的embedding结果
         '''
         exclude_tags = self.cfg.embed_ignore_tags
         max_depth = self.cfg.max_depth
         html_text = tree_root.get_html_structure_code(exclude_tags, max_depth)
-        logger.debug('getting openai embedding for filtered html code')
-        html_embed = self.openai_embed_model.get_text_embed(html_text)
-        logger.debug('openai embedding done')
+        logger.debug('getting text embedding for filtered html code')
+        html_embed = self.text_embed_model.get_text_embed(html_text)
+        logger.debug('text embedding done')
         return html_embed
 
 
 @EmbedRegistry.registry('html_structure')
 class StructureEmbedder(Embedder):
     def select_subtrees_for_embedding(self, tree_root: TreeNode):
+        '''
+        先序遍历筛选可以直接序列化编码的子树，依赖traverse_preorder计算的结点高度
+        子树序列化长度自底向上一次计算得到，只有被选中的子树才拼接源码，被选中的子树互不重叠，整体为线性时间
+        '''
+        exclude_attrs = self.cfg.embed_ignore_tags
+        code_lens, tag_texts = tree_root.get_subtree_code_lens(exclude_attrs)
         nodes_for_embeds = []
-
-        def node_selector(node):
-            '''
-            先序遍历递归的筛选可以直接序列化编码的子树
-            '''
-            leaf_tag = 0
-            html_code = ''
+        stack = [tree_root]
+        while stack:
+            node = stack.pop()
             # 判断以该结点为根结点的子树是否可以直接序列化编码
+            leaf_tag = 0
             if node.height <= self.cfg.min_height:
                 leaf_tag = 1
-                html_code = node.get_html_structure_code(exclude_attrs=self.cfg.embed_ignore_tags)
-            elif node.height <= self.cfg.max_height:
-                html_code = node.get_html_structure_code(exclude_attrs=self.cfg.embed_ignore_tags)
-                if len(html_code) <= self.cfg.min_code_len:
-                    leaf_tag = 1
+            elif node.height <= self.cfg.max_height and code_lens[node.index] <= self.cfg.min_code_len:
+                leaf_tag = 1
             if leaf_tag:
                 # 子树可以直接序列化编码
+                html_code = node.get_html_structure_code(exclude_attrs=exclude_attrs)
                 nodes_for_embeds.append((html_code, node.index, leaf_tag))
             else:
                 # 当前子树高度过大，需要分治，此时需要先编码结点文本
-                node_text = node.get_node_html_tag(exclude_attrs=self.cfg.embed_ignore_tags)
+                node_text = tag_texts.get(node.index)
+                if node_text is None:
+                    node_text = node.get_node_html_tag(exclude_attrs=exclude_attrs)
                 if node_text:
                     nodes_for_embeds.append((node_text, node.index, leaf_tag))
                 # 继续进入子树判断
-                for child in node.children:
-                    node_selector(child)
-
-        node_selector(tree_root)
+                stack.extend(reversed(node.children))
         return nodes_for_embeds
 
     def get_feature_vec(self, tree_root: TreeNode):
@@ -113,11 +121,12 @@ class StructureEmbedder(Embedder):
         node_list, _ = tree_root.traverse_preorder()
         # 筛选得到需要向量化的子树/结点文本，以及对应结点的index
         nodes_for_embeds = self.select_subtrees_for_embedding(tree_root)
-        # 批量调用openai接口得到结点和部分子树的embedding
+        # 批量调用文本向量化后端得到结点和部分子树的embedding
         node_texts = [text for text, _, _ in nodes_for_embeds]
-        logger.debug(f'getting openai embedding for {len(nodes_for_embeds)} subtrees or nodes')
-        embedding_list = self.openai_embed_model.get_text_embed(node_texts)
-        logger.debug('openai embedding done')
+        get_metrics_sink().inc('embed_subtrees', len(nodes_for_embeds))
+        logger.debug(f'getting text embedding for {len(nodes_for_embeds)} subtrees or nodes')
+        embedding_list = self.text_embed_model.get_text_embed(node_texts)
+        logger.debug('text embedding done')
         node_embedding_list = [(None, 0)] * len(node_list)
         for i, (_, node_idx, is_leaf) in enumerate(nodes_for_embeds):
             node_embedding_list[node_idx - 1] = (embedding_list[i], is_leaf)
@@ -127,17 +136,52 @@ class StructureEmbedder(Embedder):
 
 
 class CssEmbedder(Embedder):
+    # 前端框架为组件样式生成的作用域属性，每次构建都会变化
+    _SCOPED_ATTR = re.compile(r'\[(?:_ngcontent|_nghost|data-v)-[^\]]*\]')
+    _VENDOR_PREFIX = re.compile(r'(?<![\w-])-(?:webkit|moz|ms|o)-')
+
+    def __init__(self, model_cfg: HtmlSimCfg, openai_cfg: OpenaiCfg):
+        super(CssEmbedder, self).__init__(model_cfg, openai_cfg)
+        self.hasher = FeatureHasher(model_cfg.feature_dim_bow, signed=model_cfg.signed_hash)
+
+    def normalize_selector(self, selector_text):
+        '''
+        拆分selector组，去掉作用域属性并统一空白和大小写
+        :return 规范化后的selector列表
+        '''
+        selectors = []
+        for selector in split_selector_group(selector_text):
+            selector = self._SCOPED_ATTR.sub('', selector)
+            selector = re.sub(r'\s*([>+~])\s*', r' \1 ', selector)
+            selectors.append(' '.join(selector.lower().split()))
+        return selectors
+
+    def normalize_prop(self, prop_key, prop_value):
+        # 去掉属性名和属性值中的浏览器厂商前缀
+        prop_key = self._VENDOR_PREFIX.sub('', prop_key.lower())
+        prop_value = self._VENDOR_PREFIX.sub('', ' '.join(str(prop_value).lower().split()))
+        return prop_key, prop_value
+
+    def get_css_words(self, css_selector_dict):
+        '''
+        将css规则展开为(selector, 属性名, 属性值)三元组对应的虚拟word，与规则数量呈线性关系
+        开启css_normalize时先规范化selector和属性，规范化后重复的三元组只保留一个
+        '''
+        if not self.cfg.css_normalize:
+            return [f'{selector_text}_{prop_key}_{prop_value}'
+                    for selector_text, prop_info in css_selector_dict.items()
+                    for prop_key, prop_value in prop_info.items()]
+        words = {}
+        for selector_text, prop_info in css_selector_dict.items():
+            props = [self.normalize_prop(prop_key, prop_value) for prop_key, prop_value in prop_info.items()]
+            for selector in self.normalize_selector(selector_text):
+                for prop_key, prop_value in props:
+                    words[f'{selector}_{prop_key}_{prop_value}'] = None
+        return list(words)
+
     def get_feature_vec(self, css_selector_dict):
         '''
         将css通过bag-of-words向量化,用于html和css分开计算相似度的场景
         :return css的特征向量
         '''
-        feature_vec = [0.0] * self.cfg.feature_dim_bow
-        for selector_text in css_selector_dict:
-            for prop_key in css_selector_dict:
-                prop_value = css_selector_dict.get(prop_key)
-                word = f'{selector_text}_{prop_key}_{prop_value}'
-                word_hash = abs(hash(word)) % (10 ** 8)
-                index = word_hash % self.cfg.feature_dim_bow
-                feature_vec[index] += 1.0
-        return feature_vec
+        return self.hasher.transform(self.get_css_words(css_selector_dict), sparse=self.cfg.sparse_bow)
@@ -0,0 +1,61 @@
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from src.config.config_loader import HtmlSimCfg, OpenaiCfg
+from src.model.feature_hashing import FeatureHasher
+from src.model.registry import EmbedRegistry
+from src.util.metrics import get_metrics_sink
+
+
+@EmbedRegistry.register_backend('local')
+class LocalEmbedding:
+    '''
+    本地cpu文本向量化，不依赖网络：字符n-gram经带符号hash投影到低维稠密向量，
+    按sublinear tf加权后L2归一化，两段文本的余弦相似度近似于其n-gram分布的相似度；接口与OpenaiEmbedding一致
+    '''
+
+    def __init__(self, embed_dim=512, ngram_range=(3, 5), num_workers=4, batch_size=16):
+        self.embed_dim = embed_dim
+        self.ngram_range = ngram_range
+        self.batch_size = batch_size
+        # n-gram种类较多，限制hash缓存的大小
+        self.hasher = FeatureHasher(embed_dim, signed=True, max_cached_words=1 << 18)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+
+    @classmethod
+    def from_config(cls, model_cfg: HtmlSimCfg, openai_cfg: OpenaiCfg):
+        return cls(model_cfg.local_embed_dim, model_cfg.local_ngram_range, model_cfg.local_embed_workers)
+
+    def char_ngrams(self, text):
+        text = ' '.join(text.lower().split())
+        min_n, max_n = self.ngram_range
+        return [text[i:i + n] for n in range(min_n, max_n + 1) for i in range(len(text) - n + 1)]
+
+    def embed_text(self, text):
+        ngram_counts = Counter(self.char_ngrams(text))
+        if not ngram_counts:
+            return [0.0] * self.embed_dim
+        weights = 1 + np.log(np.fromiter(ngram_counts.values(), dtype=np.float64, count=len(ngram_counts)))
+        embed = np.asarray(self.hasher.transform(list(ngram_counts), weights))
+        norm = np.linalg.norm(embed)
+        return (embed / norm).tolist() if norm > 0 else embed.tolist()
+
+    def embed_batch(self, texts):
+        return [self.embed_text(text) for text in texts]
+
+    def get_text_embed(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        metrics = get_metrics_sink()
+        metrics.inc('embed_requests', backend='local')
+        metrics.inc('embed_texts', len(texts), backend='local')
+        # 按batch_size分批在线程池中并行向量化，结果顺序与输入一致
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        embed_list = [embed for batch_embeds in self.executor.map(self.embed_batch, batches)
+                      for embed in batch_embeds]
+        if len(embed_list) == 1:
+            return embed_list[0]
+        return embed_list
+
+    def close(self):
+        self.executor.shutdown()
@@ -1,26 +1,86 @@
-from openai import AzureOpenAI
-from src.config.config_loader import OpenaiCfg
+import numpy as np
+from openai import AzureOpenAI, RateLimitError, APIConnectionError, InternalServerError
+from src.cache.embedding_cache import EmbeddingCache
+from src.model.embed_scheduler import EmbedScheduler
+from src.config.config_loader import OpenaiCfg, HtmlSimCfg
+from src.model.registry import EmbedRegistry
+from src.util.metrics import get_metrics_sink
 
 
+@EmbedRegistry.register_backend('openai')
 class OpenaiEmbedding:
     '''
     封装对openai text-embedding接口的调用
     '''
     def __init__(self, cfg: OpenaiCfg):
         self.cfg = cfg
+        # 重试由调度器统一控制，关闭客户端自带的重试
         self.openai = AzureOpenAI(
             api_key=cfg.api_key,
             api_version=cfg.version,
-            azure_endpoint=cfg.endpoint
+            azure_endpoint=cfg.endpoint,
+            timeout=cfg.request_timeout,
+            max_retries=0
         )
+        self.scheduler = EmbedScheduler(lambda texts: self.request_embed(texts), cfg.max_batch_size,
+                                        cfg.max_batch_tokens, cfg.rpm, cfg.tpm, cfg.max_workers, cfg.max_retries,
+                                        cfg.retry_backoff, (RateLimitError, APIConnectionError, InternalServerError),
+                                        self.get_retry_after)
+        self.embed_cache = None
+        if cfg.embed_cache_file:
+            self.embed_cache = EmbeddingCache(cfg.embed_cache_file)
+
+    @classmethod
+    def from_config(cls, model_cfg: HtmlSimCfg, openai_cfg: OpenaiCfg):
+        return cls(openai_cfg)
+
+    def request_embed(self, texts):
+        '''
+        调用openai接口获取文本embedding
+        '''
+        metrics = get_metrics_sink()
+        metrics.inc('embed_requests', backend='openai')
+        metrics.inc('embed_texts', len(texts), backend='openai')
+        with metrics.timer('embed_request'):
+            response = self.openai.embeddings.create(input=texts, model=self.cfg.embed_model_name)
+        return [embed.embedding for embed in sorted(response.data, key=lambda embed: embed.index)]
+
+    @staticmethod
+    def get_retry_after(err):
+        # 429等响应中服务端建议的等待时间
+        response = getattr(err, 'response', None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            return None
 
     def get_text_embed(self, texts):
         if isinstance(texts, str):
             texts = [texts]
         texts = [text[:self.cfg.max_text_len] for text in texts]
-        response = self.openai.embeddings.create(input=texts, model=self.cfg.embed_model_name)
-        embed_data = response.data
-        embed_list = [embed.embedding for embed in embed_data]
+        # 同一批次中相同的文本只请求一次
+        keys = [EmbeddingCache.make_key(self.cfg.embed_model_name, text) for text in texts]
+        unique_texts = dict(zip(keys, texts))
+        embed_dict = {}
+        if self.embed_cache is not None:
+            embed_dict = self.embed_cache.get_many(unique_texts)
+        miss_keys = [key for key in unique_texts if key not in embed_dict]
+        if self.embed_cache is not None:
+            metrics = get_metrics_sink()
+            metrics.inc('embed_cache_hits', len(embed_dict))
+            metrics.inc('embed_cache_misses', len(miss_keys))
+        if miss_keys:
+            # 按批次和rpm/tpm预算调度请求
+            miss_embeds = self.scheduler.run([unique_texts[key] for key in miss_keys])
+            if self.embed_cache is not None:
+                self.embed_cache.put_many(zip(miss_keys, miss_embeds))
+                # 与缓存命中的结果保持相同精度
+                miss_embeds = [np.asarray(embed, dtype=np.float32) for embed in miss_embeds]
+            embed_dict.update(zip(miss_keys, miss_embeds))
+        embed_list = [embed_dict[key] for key in keys]
+        embed_list = [embed.tolist() if isinstance(embed, np.ndarray) else embed for embed in embed_list]
         if len(embed_list) == 1:
             return embed_list[0]
-        return embed_list
\ No newline at end of file
+        return embed_list
@@ -1,8 +1,9 @@
 class EmbedRegistry:
     '''
-    向量化模型注册类，实现按照名称获取对应模型类
+    向量化模型注册类，实现按照名称获取对应模型类；文本向量化后端单独注册，供各向量化模型按配置选择
     '''
     model_dict = {}
+    backend_dict = {}
 
     @classmethod
     def registry(cls, embed_name):
@@ -15,4 +16,17 @@ class EmbedRegistry:
     def get_embedding_cls(cls, embed_name):
         if embed_name not in cls.model_dict:
             raise ValueError(f'embedding method {embed_name} not defined')
-        return cls.model_dict.get(embed_name)
\ No newline at end of file
+        return cls.model_dict.get(embed_name)
+
+    @classmethod
+    def register_backend(cls, backend_name):
+        def wrapper(backend_cls):
+            cls.backend_dict[backend_name] = backend_cls
+            return backend_cls
+        return wrapper
+
+    @classmethod
+    def get_backend_cls(cls, backend_name):
+        if backend_name not in cls.backend_dict:
+            raise ValueError(f'embedding backend {backend_name} not defined')
+        return cls.backend_dict.get(backend_name)
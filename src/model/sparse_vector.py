@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class SparseVector:
+    '''
+    稀疏特征向量，只保存非零位置的下标(升序)和取值，用于高维bag-of-words特征
+    '''
+    __slots__ = ('indices', 'values', 'dim')
+
+    def __init__(self, indices, values, dim):
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.dim = dim
+
+    @classmethod
+    def from_pairs(cls, indices, values, dim):
+        '''
+        根据(下标, 取值)对构造稀疏向量，相同下标的取值累加，累加后为0的位置被舍弃
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(indices) == 0:
+            return cls(indices, values, dim)
+        uniq_indices, inverse = np.unique(indices, return_inverse=True)
+        uniq_values = np.bincount(inverse, weights=values, minlength=len(uniq_indices))
+        nonzero = uniq_values != 0
+        return cls(uniq_indices[nonzero], uniq_values[nonzero], dim)
+
+    @classmethod
+    def from_dense(cls, dense_vec):
+        dense_vec = np.asarray(dense_vec, dtype=np.float64)
+        indices = np.flatnonzero(dense_vec)
+        return cls(indices, dense_vec[indices], len(dense_vec))
+
+    def to_dense(self):
+        dense_vec = np.zeros(self.dim)
+        dense_vec[self.indices] = self.values
+        return dense_vec
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def __len__(self):
+        # 长度与稠密向量保持一致，因此可以沿用`if feature_vec`判断特征是否提取成功
+        return self.dim
+
+    def __eq__(self, other):
+        if not isinstance(other, SparseVector):
+            return NotImplemented
+        return self.dim == other.dim and np.array_equal(self.indices, other.indices) \
+            and np.array_equal(self.values, other.values)
+
+    def __repr__(self):
+        return f'SparseVector(dim={self.dim}, nnz={self.nnz})'
+
+
+def stack_sparse_vectors(vecs):
+    '''
+    将多个稀疏向量拼接为(下标, 取值, 所属向量序号)三个数组，便于批量计算
+    '''
+    if not vecs:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0), empty
+    indices = np.concatenate([vec.indices for vec in vecs])
+    values = np.concatenate([vec.values for vec in vecs])
+    segments = np.repeat(np.arange(len(vecs)), [vec.nnz for vec in vecs])
+    return indices, values, segments
+
+
+def vec_to_json(vec):
+    '''
+    将特征向量转换为可json序列化的对象：稀疏向量转为{dim, indices, values}字典，稠密向量转为列表
+    '''
+    if vec is None:
+        return None
+    if isinstance(vec, SparseVector):
+        return {'dim': vec.dim, 'indices': vec.indices.tolist(), 'values': vec.values.tolist()}
+    return [float(value) for value in vec]
+
+
+def vec_from_json(obj):
+    if isinstance(obj, dict):
+        return SparseVector(obj['indices'], obj['values'], obj['dim'])
+    return obj
@@ -0,0 +1,254 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from src.config.config_loader import TaskCfg
+from src.model.sparse_vector import vec_to_json
+from src.similarity import WebPageSimilarity
+from src.util.log_util import create_logger
+from src.util.metrics import get_metrics_sink, set_metrics_sink, PrometheusSink
+
+logger = create_logger(__name__)
+
+
+def is_url(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+class SimilarityService:
+    '''
+    常驻的网页相似度服务：下载器(浏览器会话)、向量化模型和各级缓存只初始化一次，在请求之间保持复用；
+    阻塞的特征提取在线程池中执行，同一url的并发请求合并为一次提取；处理中的任务数超过max_pending时直接拒绝
+    '''
+
+    def __init__(self, cfg: TaskCfg, sim_model: WebPageSimilarity = None):
+        self.cfg = cfg
+        self.sim_model = sim_model or WebPageSimilarity(cfg)
+        if not get_metrics_sink().enabled:
+            # 服务模式通过/metrics输出指标，配置中未开启时使用Prometheus格式
+            set_metrics_sink(PrometheusSink())
+        self.executor = ThreadPoolExecutor(max_workers=cfg.html.pipeline_workers)
+        self.max_pending = cfg.service.max_pending
+        self.max_batch_tasks = cfg.service.max_batch_tasks
+        self.pending = 0
+        # url到正在进行的特征提取任务，只在事件循环线程中访问
+        self.inflight = {}
+        self.start_time = time.time()
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def get_features(self, url):
+        '''
+        提取单个url的特征，同一url已有正在进行的提取时直接等待其结果
+        :return (feature_vec, css_vec)
+        '''
+        future = self.inflight.get(url)
+        if future is not None:
+            get_metrics_sink().inc('coalesced_requests')
+        else:
+            future = asyncio.ensure_future(self.run_blocking(self.sim_model.get_page_feature_pipeline, url))
+            self.inflight[url] = future
+            future.add_done_callback(lambda _: self.inflight.pop(url, None))
+        # 单个请求被取消时不取消共享的提取任务
+        return await asyncio.shield(future)
+
+    async def get_similarity(self, url1, url2):
+        '''
+        与WebPageSimilarity.get_similarity结果一致，两个网页的特征并发提取
+        '''
+        features1, features2 = await asyncio.gather(self.get_features(url1), self.get_features(url2))
+        if not features1[0] or not features2[0]:
+            return False, 0.0
+        sim_flags, sim_scores = await self.run_blocking(self.sim_model.score_features, [features1], [features2],
+                                                        [url1], [url2])
+        return bool(sim_flags[0, 0]), float(sim_scores[0, 0])
+
+    async def run_task(self, task_id, record):
+        '''
+        执行单条批量任务，任务及结果格式与batch.py一致
+        '''
+        result = {'id': task_id}
+        try:
+            if is_url(record.get('url1')) and is_url(record.get('url2')):
+                is_sim, sim_score = await self.get_similarity(record['url1'], record['url2'])
+                result.update(url1=record['url1'], url2=record['url2'], is_sim=is_sim, score=sim_score)
+            elif is_url(record.get('url')):
+                feature_vec, css_vec = await self.get_features(record['url'])
+                result.update(url=record['url'], feature_vec=vec_to_json(feature_vec), css_vec=vec_to_json(css_vec))
+            else:
+                result['error'] = 'task should contain url1 and url2, or url'
+        except Exception as e:
+            logger.exception(f'task {task_id} fails')
+            result['error'] = repr(e)
+        return result
+
+    def try_admit(self, cost):
+        '''
+        背压控制：处理中的任务数加上本次请求的任务数超过max_pending时拒绝
+        '''
+        if self.pending + cost > self.max_pending:
+            return False
+        self.pending += cost
+        return True
+
+    def release(self, cost):
+        self.pending -= cost
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'inflight_urls': len(self.inflight),
+            'uptime': time.time() - self.start_time,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.sim_model.page_downloader.close()
+        if self.sim_model.css_fetcher is not None:
+            self.sim_model.css_fetcher.close()
+
+
+SERVICE_KEY = web.AppKey('service', SimilarityService)
+
+
+def json_error(status, message, headers=None):
+    return web.json_response({'error': message}, status=status, headers=headers)
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='{"error": "request body should be json"}', content_type='application/json')
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='{"error": "request body should be a json object"}',
+                                 content_type='application/json')
+    return body
+
+
+def require_urls(*fields):
+    '''
+    :return 校验请求体中指定字段均为非空字符串的函数，校验失败时返回错误信息
+    '''
+    def validate(body):
+        if not all(is_url(body.get(field)) for field in fields):
+            return f'{" and ".join(fields)} should be non-empty strings'
+        return None
+    return validate
+
+
+def admitted(cost_fn, validate_fn=None):
+    '''
+    需要背压控制的接口，cost_fn根据请求体计算任务数；validate_fn在计入任务数之前校验请求体，返回错误信息时直接返回400
+    cost_fn需要能处理任意格式的json对象
+    '''
+    def decorator(handler):
+        async def wrapper(request):
+            service = request.app[SERVICE_KEY]
+            body = await read_json(request)
+            error = validate_fn(body) if validate_fn is not None else None
+            if error:
+                return json_error(400, error)
+            # 任务数超过max_pending的请求只在空闲时才能进入，不会永远被拒绝
+            cost = min(cost_fn(body), service.max_pending)
+            if not service.try_admit(cost):
+                get_metrics_sink().inc('rejected_requests', path=request.path)
+                return json_error(503, 'server busy, retry later', {'Retry-After': '1'})
+            try:
+                return await handler(request, service, body)
+            finally:
+                service.release(cost)
+        return wrapper
+    return decorator
+
+
+@admitted(lambda body: 2, require_urls('url1', 'url2'))
+async def handle_similarity(request, service, body):
+    url1, url2 = body['url1'], body['url2']
+    is_sim, sim_score = await service.get_similarity(url1, url2)
+    return web.json_response({'is_sim': is_sim, 'score': sim_score})
+
+
+@admitted(lambda body: 1, require_urls('url'))
+async def handle_features(request, service, body):
+    url = body['url']
+    feature_vec, css_vec = await service.get_features(url)
+    if not feature_vec:
+        return json_error(502, f'download from {url} fails')
+    return web.json_response({'url': url, 'feature_vec': vec_to_json(feature_vec), 'css_vec': vec_to_json(css_vec)})
+
+
+def batch_cost(body):
+    # tasks格式错误的请求按1个任务计，由handle_batch返回400
+    tasks = body.get('tasks')
+    return max(len(tasks), 1) if isinstance(tasks, list) else 1
+
+
+@admitted(batch_cost)
+async def handle_batch(request, service, body):
+    tasks = body.get('tasks')
+    if not isinstance(tasks, list) or not tasks:
+        return json_error(400, 'tasks should be a non-empty list')
+    if len(tasks) > service.max_batch_tasks:
+        return json_error(413, f'at most {service.max_batch_tasks} tasks in a batch')
+    results = await asyncio.gather(*[service.run_task(task_id, record if isinstance(record, dict) else {})
+                                     for task_id, record in enumerate(tasks)])
+    return web.json_response({'results': results})
+
+
+async def handle_health(request):
+    return web.json_response(request.app[SERVICE_KEY].health())
+
+
+async def handle_metrics(request):
+    return web.Response(text=get_metrics_sink().render(), content_type='text/plain', charset='utf-8')
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    metrics = get_metrics_sink()
+    start = time.perf_counter()
+    status = 500
+    # 按路由统计，未匹配的路径统一计为other，避免标签取值无限增长
+    resource = request.match_info.route.resource
+    path = resource.canonical if resource is not None else 'other'
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        metrics.inc('http_requests', path=path, status=status)
+        metrics.observe('request_seconds', time.perf_counter() - start, path=path)
+
+
+def create_app(cfg: TaskCfg, service: SimilarityService = None):
+    service = service or SimilarityService(cfg)
+    app = web.Application(middlewares=[metrics_middleware])
+    app[SERVICE_KEY] = service
+    app.router.add_post('/similarity', handle_similarity)
+    app.router.add_post('/features', handle_features)
+    app.router.add_post('/batch', handle_batch)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/metrics', handle_metrics)
+
+    async def on_cleanup(app):
+        app[SERVICE_KEY].close()
+
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def run_service(cfg: TaskCfg, host=None, port=None):
+    '''
+    启动http服务，host和port默认使用配置service.host和service.port
+    '''
+    host = host or cfg.service.host
+    port = port or cfg.service.port
+    logger.info(f'similarity service listening on {host}:{port}')
+    web.run_app(create_app(cfg), host=host, port=port, print=None)
@@ -1,10 +1,17 @@
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from src.config.config_loader import TaskCfg
-from src.download.page_download import WebDriverDownloader, BaseDownloader
-from src.dom_tree.dom_preprocess import DomProcessor
+from src.download.page_download import create_downloader
+from src.dom_tree.dom_preprocess import create_dom_processor
+from src.dom_tree.css_fetcher import StylesheetCache
 from src.model.registry import EmbedRegistry
 from src.model.html_embedding import CssEmbedder
-from src.util.log_util import create_logger
+from src.model.sparse_vector import SparseVector, stack_sparse_vectors
+from src.cache.feature_cache import FeatureCache, config_fingerprint
+from src.cache.lru_cache import LruCache
+from src.util.log_util import create_logger, set_log_level
+from src.util.metrics import get_metrics_sink, set_metrics_sink, create_metrics_sink
 
 logger = create_logger(__name__)
 
@@ -13,6 +20,8 @@ def cosine_similarity(vec1, vec2):
     '''
     向量余弦相似度计算
     '''
+    if isinstance(vec1, SparseVector) and isinstance(vec2, SparseVector):
+        return sparse_cosine_similarity(vec1, vec2)
     if isinstance(vec1, list):
         vec1 = np.array(vec1)
     if isinstance(vec2, list):
@@ -26,20 +35,191 @@ def cosine_similarity(vec1, vec2):
     return cos_sim
 
 
+def _bow_total(values1, values2):
+    # 曼哈顿相似度的归一化项：非负取值时等于max(a, b)；带符号取值(signed hashing)时取max(|a|, |b|, |a-b|)，
+    # 保证每一维的距离不超过归一化项，相似度始终在[0, 1]之间
+    return np.maximum(np.maximum(np.abs(values1), np.abs(values2)), np.abs(values1 - values2))
+
+
 def bow_vec_similarity(vec1, vec2):
     '''
     基于曼哈顿距离计算稀疏向量相似度
     '''
+    if isinstance(vec1, SparseVector) and isinstance(vec2, SparseVector):
+        return sparse_bow_similarity(vec1, vec2)
     diff = 0
     total = 0
     for i in range(len(vec1)):
         diff += abs(vec1[i] - vec2[i])
-        total += max(vec1[i], vec2[i])
+        total += max(abs(vec1[i]), abs(vec2[i]), abs(vec1[i] - vec2[i]))
     if total == 0:
         return 0
     return 1 - diff / total
 
 
+def _align_sparse(vec1, vec2):
+    # 将两个稀疏向量对齐到非零下标的并集上，返回两个等长的稠密取值数组
+    union, inverse = np.unique(np.concatenate([vec1.indices, vec2.indices]), return_inverse=True)
+    values1 = np.zeros(len(union))
+    values2 = np.zeros(len(union))
+    values1[inverse[:vec1.nnz]] = vec1.values
+    values2[inverse[vec1.nnz:]] = vec2.values
+    return values1, values2
+
+
+def sparse_bow_similarity(vec1: SparseVector, vec2: SparseVector):
+    '''
+    稀疏向量版本的曼哈顿距离相似度，只在两个向量非零下标的并集上计算，结果与bow_vec_similarity一致
+    '''
+    values1, values2 = _align_sparse(vec1, vec2)
+    total = _bow_total(values1, values2).sum()
+    if total == 0:
+        return 0
+    return 1 - np.abs(values1 - values2).sum() / total
+
+
+def sparse_cosine_similarity(vec1: SparseVector, vec2: SparseVector):
+    '''
+    稀疏向量版本的余弦相似度，只在两个向量非零下标的交集上计算点积
+    '''
+    norm_vec1 = np.linalg.norm(vec1.values)
+    norm_vec2 = np.linalg.norm(vec2.values)
+    if norm_vec1 == 0 or norm_vec2 == 0:
+        return 0
+    _, pos1, pos2 = np.intersect1d(vec1.indices, vec2.indices, assume_unique=True, return_indices=True)
+    dot_pro = np.dot(vec1.values[pos1], vec2.values[pos2])
+    return dot_pro / (norm_vec1 * norm_vec2)
+
+
+def _is_sparse_batch(vecs1, vecs2):
+    return any(isinstance(vec, SparseVector) for vec in vecs1) or \
+        any(isinstance(vec, SparseVector) for vec in vecs2)
+
+
+def _sparse_cosine_matrix(vecs1, vecs2):
+    scores = np.zeros((len(vecs1), len(vecs2)))
+    indices2, values2, segments2 = stack_sparse_vectors(vecs2)
+    norm2 = np.sqrt(np.bincount(segments2, weights=values2 ** 2, minlength=len(vecs2)))
+    norm2[norm2 == 0] = np.inf
+    for row, vec1 in enumerate(vecs1):
+        norm1 = np.linalg.norm(vec1.values)
+        if norm1 == 0:
+            continue
+        # 行向量展开为稠密数组后，通过下标查表一次性得到与所有列向量的点积
+        dense1 = vec1.to_dense()
+        dot_pro = np.bincount(segments2, weights=dense1[indices2] * values2, minlength=len(vecs2))
+        scores[row] = dot_pro / (norm1 * norm2)
+    return scores
+
+
+def _sparse_bow_matrix(vecs1, vecs2):
+    scores = np.zeros((len(vecs1), len(vecs2)))
+    indices2, values2, segments2 = stack_sparse_vectors(vecs2)
+    for row, vec1 in enumerate(vecs1):
+        dense1 = vec1.to_dense()
+        ref_values = dense1[indices2]
+        # 先按列向量全为0计算行向量单独贡献的距离，再用列向量非零位置上的实际贡献替换
+        base_diff = np.abs(vec1.values).sum()
+        diff = base_diff + np.bincount(segments2, weights=np.abs(ref_values - values2) - np.abs(ref_values),
+                                       minlength=len(vecs2))
+        total = base_diff + np.bincount(segments2, weights=_bow_total(ref_values, values2) - np.abs(ref_values),
+                                        minlength=len(vecs2))
+        nonzero = total != 0
+        scores[row, nonzero] = 1 - diff[nonzero] / total[nonzero]
+    return scores
+
+
+def cosine_similarity_matrix(vecs1, vecs2):
+    '''
+    批量计算两组向量两两之间的余弦相似度，返回shape为(len(vecs1), len(vecs2))的矩阵
+    '''
+    if _is_sparse_batch(vecs1, vecs2):
+        return _sparse_cosine_matrix(vecs1, vecs2)
+    mat1 = np.asarray(vecs1, dtype=np.float64)
+    mat2 = np.asarray(vecs2, dtype=np.float64)
+    norm1 = np.linalg.norm(mat1, axis=1)
+    norm2 = np.linalg.norm(mat2, axis=1)
+    # 零向量的相似度记为0，与cosine_similarity保持一致
+    norm1[norm1 == 0] = np.inf
+    norm2[norm2 == 0] = np.inf
+    return (mat1 / norm1[:, None]) @ (mat2 / norm2[:, None]).T
+
+
+def bow_similarity_matrix(vecs1, vecs2, block_elems=2 ** 24):
+    '''
+    批量计算两组稀疏向量两两之间基于曼哈顿距离的相似度，返回shape为(len(vecs1), len(vecs2))的矩阵
+    按块计算，单块中间结果不超过block_elems个元素，避免一次性展开全部向量对占用过多内存
+    '''
+    if _is_sparse_batch(vecs1, vecs2):
+        return _sparse_bow_matrix(vecs1, vecs2)
+    mat1 = np.asarray(vecs1, dtype=np.float64)
+    mat2 = np.asarray(vecs2, dtype=np.float64)
+    n1, n2 = len(mat1), len(mat2)
+    scores = np.zeros((n1, n2))
+    if n1 == 0 or n2 == 0:
+        return scores
+    dim = max(mat1.shape[1], 1)
+    col_step = max(1, min(n2, block_elems // dim))
+    row_step = max(1, block_elems // (dim * col_step))
+    for row in range(0, n1, row_step):
+        block1 = mat1[row:row + row_step, None, :]
+        for col in range(0, n2, col_step):
+            block2 = mat2[None, col:col + col_step, :]
+            diff = np.abs(block1 - block2).sum(axis=2)
+            total = _bow_total(block1, block2).sum(axis=2)
+            nonzero = total != 0
+            block_score = np.zeros_like(total)
+            block_score[nonzero] = 1 - diff[nonzero] / total[nonzero]
+            scores[row:row + row_step, col:col + col_step] = block_score
+    return scores
+
+
+def uses_bow_features(cfg: TaskCfg):
+    '''
+    bow方法以及cascade方法的页面特征均为bow向量
+    '''
+    return cfg.similarity_model.method in ('bow', 'cascade')
+
+
+def apply_css_gate(cfg: TaskCfg, flags, scores, css_vecs1, css_vecs2):
+    '''
+    css属性没有添加到对应的html tag中时，结构相似的页面对需要额外计算css相似度
+    :return css判别后的(相似度标志矩阵, 相似度分数矩阵)
+    '''
+    if cfg.html.include_css:
+        return flags, scores
+    css_scores = bow_similarity_matrix(css_vecs1, css_vecs2)
+    scores = np.where(flags, (scores + css_scores) / 2, scores)
+    flags = flags & (css_scores >= cfg.similarity_model.bow_thre)
+    return flags, scores
+
+
+def score_feature_matrix(cfg: TaskCfg, features1, features2):
+    '''
+    批量计算两组页面特征两两之间的相似度，相似度计算和css判别逻辑与get_similarity一致
+    :return (相似度标志矩阵, 相似度分数矩阵)，特征提取失败的页面与其它页面均判别为不相似，分数为0
+    '''
+    sim_flags = np.zeros((len(features1), len(features2)), dtype=bool)
+    sim_scores = np.zeros((len(features1), len(features2)))
+    valid1 = [i for i, (feature_vec, _) in enumerate(features1) if feature_vec]
+    valid2 = [i for i, (feature_vec, _) in enumerate(features2) if feature_vec]
+    if not valid1 or not valid2:
+        return sim_flags, sim_scores
+    vecs1 = [features1[i][0] for i in valid1]
+    vecs2 = [features2[i][0] for i in valid2]
+    if uses_bow_features(cfg):
+        scores = bow_similarity_matrix(vecs1, vecs2)
+        flags = scores >= cfg.similarity_model.bow_thre
+    else:
+        scores = cosine_similarity_matrix(vecs1, vecs2)
+        flags = scores >= cfg.similarity_model.embed_thre
+    flags, scores = apply_css_gate(cfg, flags, scores, [features1[i][1] for i in valid1],
+                                   [features2[i][1] for i in valid2])
+    sim_flags[np.ix_(valid1, valid2)] = flags
+    sim_scores[np.ix_(valid1, valid2)] = scores
+    return sim_flags, sim_scores
+
+
 class WebPageSimilarity:
     '''
     网页相似度分析主流程
@@ -47,58 +227,124 @@ class WebPageSimilarity:
 
     def __init__(self, cfg: TaskCfg):
         self.cfg = cfg
+        set_log_level(cfg.monitor.log_level)
+        if cfg.monitor.metrics_sink != 'none' and not get_metrics_sink().enabled:
+            # 指标在进程内共享，已经设置了指标输出(包括自定义实现)时不替换
+            set_metrics_sink(create_metrics_sink(cfg.monitor.metrics_sink))
         # 根据配置选择网页下载方法类
-        self.page_downloader = WebDriverDownloader(cfg.html)
-        if cfg.html.fetch_method != 'webdriver':
-            self.page_downloader = BaseDownloader(cfg.html)
+        self.page_downloader = create_downloader(cfg.html)
+        self.css_fetcher = None
+        if cfg.html.remote_css:
+            # 同一站点的网页大多共享相同的css，解析结果在网页之间复用
+            self.css_fetcher = StylesheetCache(cfg.html.css_cache_max_age, cfg.html.css_fetch_workers,
+                                               cfg.html.css_fetch_timeout)
         # 从注册器中获取向量化方法类
-        embedder_cls = EmbedRegistry.get_embedding_cls(cfg.similarity_model.method)
-        self.embedder = embedder_cls(cfg.similarity_model, cfg.openai)
+        self.remote_embedder = None
+        if cfg.similarity_model.method == 'cascade':
+            # 级联方法先用bow特征判别，只有不确定的页面对才使用远端向量化方法，dom tree缓存起来供其复用
+            self.embedder = EmbedRegistry.get_embedding_cls('bow')(cfg.similarity_model, cfg.openai)
+            remote_embedder_cls = EmbedRegistry.get_embedding_cls(cfg.similarity_model.cascade_embed_method)
+            self.remote_embedder = remote_embedder_cls(cfg.similarity_model, cfg.openai)
+            self.tree_cache = LruCache(cfg.similarity_model.cascade_tree_cache)
+            # 特征缓存命中的页面没有解析dom tree，只保存源码，需要远端向量化时再解析，不需要重新下载
+            self.html_cache = LruCache(cfg.similarity_model.cascade_tree_cache)
+            self.cascade_stats = {'bow_similar': 0, 'bow_dissimilar': 0, 'embedding': 0}
+            self.stats_lock = threading.Lock()
+        else:
+            embedder_cls = EmbedRegistry.get_embedding_cls(cfg.similarity_model.method)
+            self.embedder = embedder_cls(cfg.similarity_model, cfg.openai)
         self.css_embedder = None
         if not cfg.html.include_css:
             # 没有将css属性添加到对应html tag时才需要单独计算css特征向量
             self.css_embedder = CssEmbedder(cfg.similarity_model, cfg.openai)
+        self.feature_cache = None
+        if cfg.cache.feature_cache_file:
+            self.feature_cache = FeatureCache(cfg.cache.feature_cache_file, cfg.cache.feature_cache_ttl,
+                                              cfg.cache.feature_cache_max_entries)
+            self.cfg_fingerprint = config_fingerprint(cfg)
 
     def get_page_feature_pipeline(self, url):
         '''
         根据url下载源码，处理dom tree以及提取特征流程
         '''
-        html_text = self.page_downloader.get_html(url)
+        metrics = get_metrics_sink()
+        with metrics.timer('download'):
+            html_text = self.page_downloader.get_html(url)
+        if html_text and metrics.enabled:
+            metrics.inc('download_bytes', len(html_text.encode('utf-8')))
+        return self.get_html_features(url, html_text)
+
+    def get_page_features_concurrent(self, urls, max_workers=None):
+        '''
+        在同一进程内用线程池并发执行get_page_feature_pipeline，重复的url只处理一次
+        下载网页和请求openai embedding主要是网络等待，多个页面的下载、预处理和向量化可以相互重叠；
+        各页面的dom tree独立编号，下载器、css缓存和特征缓存均可在线程间共享，因此可以安全并发
+        dom解析和bow向量化等cpu密集的部分受GIL限制，大批量离线任务仍建议使用main.py batch的多进程方式
+        :param max_workers: 线程数，默认使用配置html.pipeline_workers
+        :return 与urls顺序一致的(feature_vec, css_vec)列表
+        '''
+        unique_urls = list(dict.fromkeys(urls))
+        max_workers = max_workers or self.cfg.html.pipeline_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            feature_map = dict(zip(unique_urls, executor.map(self.get_page_feature_pipeline, unique_urls)))
+        return [feature_map[url] for url in urls]
+
+    def get_html_features(self, url, html_text):
+        '''
+        根据网页源码提取特征，开启特征缓存时相同url、源码和配置的页面直接返回缓存结果
+        '''
+        metrics = get_metrics_sink()
         if not html_text:
             # 下载网页失败，返回空的特征向量
             logger.error(f'download from {url} fails!')
+            metrics.inc('pages', status='download_failed')
             return [], []
+        cache_key = None
+        if self.feature_cache is not None:
+            cache_key = FeatureCache.make_key(url, html_text, self.cfg_fingerprint)
+            features = self.feature_cache.get(cache_key)
+            if features is not None:
+                logger.info(f'feature cache hit for {url}')
+                if self.remote_embedder is not None:
+                    self.html_cache.put(url, html_text)
+                metrics.inc('feature_cache_hits')
+                metrics.inc('pages', status='cache_hit')
+                return features
+            metrics.inc('feature_cache_misses')
         logger.info('begin to build dom tree')
-        dom_processor = DomProcessor(html_text, self.cfg.html)
+        with metrics.timer('parse'):
+            dom_processor = create_dom_processor(html_text, self.cfg.html, url, self.css_fetcher)
         logger.info('build dom tree done;begin to preprocess dom tree')
-        dom_processor.filter_dom()
-        dom_processor.process_css()
-        tree_root = dom_processor.transform_dom_tree()
+        # preprocess阶段的耗时包含其中的css_parse、css_fetch和css_assign阶段
+        with metrics.timer('preprocess'):
+            tree_root = dom_processor.preprocess()
+        metrics.inc('dom_nodes', dom_processor.num_nodes)
+        metrics.inc('css_selectors', len(dom_processor.css_dict))
+        if self.remote_embedder is not None:
+            self.tree_cache.put(url, tree_root)
         logger.info('preprocess dom tree done;begin to get embedding')
-        feature_vec = self.embedder.get_feature_vec(tree_root)
+        with metrics.timer('embed'):
+            feature_vec = self.embedder.get_feature_vec(tree_root)
         css_vec = None
         if self.css_embedder is not None:
-            css_vec = self.css_embedder.get_feature_vec(dom_processor.css_dict)
+            with metrics.timer('css_embed'):
+                css_vec = self.css_embedder.get_feature_vec(dom_processor.css_dict)
         logger.info('embedding done')
+        if cache_key is not None:
+            self.feature_cache.put(cache_key, url, (feature_vec, css_vec))
+        metrics.inc('pages', status='ok')
         return feature_vec, css_vec
 
     def get_similarity(self, url1, url2):
-        logger.info(f'begin to get features of {url1}')
-        feature_vec1, css_vec1 = self.get_page_feature_pipeline(url1)
-        if feature_vec1:
-            logger.info(f'features of {url1} done')
-        else:
+        # 两个网页并发下载(取决于下载器是否支持)，再分别提取特征
+        features = self.get_features_batch([url1, url2])
+        (feature_vec1, css_vec1), (feature_vec2, css_vec2) = features
+        if not feature_vec1 or not feature_vec2:
             # 下载网页失败时无法向量化，返回不相似
-            logger.error(f'features of {url1} fails')
-            return False, 0
-        logger.info(f'begin to get features of {url2}')
-        feature_vec2, css_vec2 = self.get_page_feature_pipeline(url2)
-        if feature_vec2:
-            logger.info(f'features of {url2} done')
-        else:
-            # 下载网页失败时无法向量化，返回不相似
-            logger.error(f'features of {url2} fails')
             return False, 0
+        if self.remote_embedder is not None:
+            sim_flags, sim_scores = self.cascade_score([url1], [url2], features[:1], features[1:])
+            return bool(sim_flags[0, 0]), float(sim_scores[0, 0])
         is_sim = False
         if self.cfg.similarity_model.method == 'bow':
             # 使用bag-of-words向量化时基于曼哈顿距离计算相似度
@@ -122,3 +368,137 @@ class WebPageSimilarity:
             if css_score < self.cfg.similarity_model.bow_thre:
                 is_sim = False
         return is_sim, sim_score
+
+    def get_features_batch(self, urls, batch_size=64):
+        '''
+        批量提取页面特征，重复的url只下载和向量化一次；每batch_size个网页通过下载器并发下载
+        :return 与urls顺序一致的(feature_vec, css_vec)列表
+        '''
+        metrics = get_metrics_sink()
+        unique_urls = list(dict.fromkeys(urls))
+        feature_map = {}
+        for start in range(0, len(unique_urls), batch_size):
+            batch_urls = unique_urls[start:start + batch_size]
+            # 整批下载的耗时单独计为download_batch，与单个网页的download耗时区分
+            with metrics.timer('download_batch'):
+                html_texts = self.page_downloader.get_html_batch(batch_urls)
+            if metrics.enabled:
+                metrics.inc('download_bytes', sum(len(text.encode('utf-8')) for text in html_texts if text))
+            for url, html_text in zip(batch_urls, html_texts):
+                logger.info(f'begin to get features of {url}')
+                feature_map[url] = self.get_html_features(url, html_text)
+                if feature_map[url][0]:
+                    logger.info(f'features of {url} done')
+                else:
+                    logger.error(f'features of {url} fails')
+        return [feature_map[url] for url in urls]
+
+    def score_features(self, features1, features2, urls1=None, urls2=None):
+        '''
+        批量计算两组页面特征两两之间的相似度，相似度计算和css判别逻辑与get_similarity一致
+        cascade方法需要传入特征对应的url，用于对不确定的页面对调用远端向量化
+        :return (相似度标志矩阵, 相似度分数矩阵)，特征提取失败的页面与其它页面均判别为不相似，分数为0
+        '''
+        if self.remote_embedder is not None and urls1 is not None and urls2 is not None:
+            return self.cascade_score(urls1, urls2, features1, features2)
+        return score_feature_matrix(self.cfg, features1, features2)
+
+    def get_remote_features(self, urls):
+        '''
+        cascade方法中获取页面的远端embedding，优先复用缓存的dom tree；特征缓存命中的页面使用保存的源码解析，
+        两者都已被淘汰的页面才重新下载和解析
+        :return url到embedding的字典，失败的页面对应空列表
+        '''
+        embeds = {}
+        for url in dict.fromkeys(urls):
+            tree_root = self.tree_cache.get(url)
+            if tree_root is None:
+                html_text = self.html_cache.get(url) or self.page_downloader.get_html(url)
+                if not html_text:
+                    embeds[url] = []
+                    continue
+                tree_root = create_dom_processor(html_text, self.cfg.html, url, self.css_fetcher).preprocess()
+                self.tree_cache.put(url, tree_root)
+            with get_metrics_sink().timer('cascade_embed'):
+                embeds[url] = self.remote_embedder.get_feature_vec(tree_root)
+        return embeds
+
+    def cascade_score(self, urls1, urls2, features1, features2):
+        '''
+        级联判别：先用本地bow特征计算相似度，不低于cascade_high直接判别为相似，低于cascade_low直接判别为不相似，
+        只有介于两者之间的页面对才调用远端embedding，按余弦相似度和embed_thre判别；css判别逻辑与其它方法一致
+        :return (相似度标志矩阵, 相似度分数矩阵)，特征提取失败的页面与其它页面均判别为不相似，分数为0
+        '''
+        model_cfg = self.cfg.similarity_model
+        sim_flags = np.zeros((len(features1), len(features2)), dtype=bool)
+        sim_scores = np.zeros((len(features1), len(features2)))
+        valid1 = [i for i, (feature_vec, _) in enumerate(features1) if feature_vec]
+        valid2 = [i for i, (feature_vec, _) in enumerate(features2) if feature_vec]
+        if not valid1 or not valid2:
+            return sim_flags, sim_scores
+        scores = bow_similarity_matrix([features1[i][0] for i in valid1], [features2[i][0] for i in valid2])
+        flags = scores >= model_cfg.cascade_high
+        rows, cols = np.nonzero((scores >= model_cfg.cascade_low) & ~flags)
+        num_similar, num_uncertain = int(flags.sum()), len(rows)
+        if num_uncertain:
+            pair_urls = [(urls1[valid1[row]], urls2[valid2[col]]) for row, col in zip(rows, cols)]
+            embeds = self.get_remote_features([url for pair in pair_urls for url in pair])
+            for row, col, (url1, url2) in zip(rows, cols, pair_urls):
+                if not embeds[url1] or not embeds[url2]:
+                    # 远端向量化失败时退回bow阈值判别
+                    flags[row, col] = scores[row, col] >= model_cfg.bow_thre
+                    continue
+                scores[row, col] = cosine_similarity(embeds[url1], embeds[url2])
+                flags[row, col] = scores[row, col] >= model_cfg.embed_thre
+        with self.stats_lock:
+            self.cascade_stats['bow_similar'] += num_similar
+            self.cascade_stats['embedding'] += num_uncertain
+            self.cascade_stats['bow_dissimilar'] += scores.size - num_similar - num_uncertain
+        metrics = get_metrics_sink()
+        metrics.inc('cascade_pairs', num_similar, tier='bow_similar')
+        metrics.inc('cascade_pairs', num_uncertain, tier='embedding')
+        metrics.inc('cascade_pairs', scores.size - num_similar - num_uncertain, tier='bow_dissimilar')
+        logger.debug(f'cascade resolved {num_similar} similar and {scores.size - num_similar - num_uncertain} '
+                     f'dissimilar pairs by bow, {num_uncertain} pairs by embedding')
+        flags, scores = apply_css_gate(self.cfg, flags, scores, [features1[i][1] for i in valid1],
+                                       [features2[i][1] for i in valid2])
+        sim_flags[np.ix_(valid1, valid2)] = flags
+        sim_scores[np.ix_(valid1, valid2)] = scores
+        return sim_flags, sim_scores
+
+    def get_cascade_stats(self):
+        '''
+        cascade方法中各级分别判别的页面对数量
+        :return {'bow_similar': bow直接判别为相似的数量, 'bow_dissimilar': bow直接判别为不相似的数量,
+                 'embedding': 调用远端embedding判别的数量, 'total': 总数}
+        '''
+        with self.stats_lock:
+            stats = dict(self.cascade_stats)
+        stats['total'] = sum(stats.values())
+        return stats
+
+    @staticmethod
+    def get_metrics_text():
+        '''
+        :return 进程内流程指标的Prometheus文本格式，未开启指标时为空字符串
+        '''
+        return get_metrics_sink().render()
+
+    def compare_one_to_many(self, ref_url, candidate_urls):
+        '''
+        计算一个参考页面与多个候选页面的相似度，每个页面只提取一次特征
+        :return 与candidate_urls顺序一致的(相似度标志, 相似度分数)列表
+        '''
+        candidate_urls = list(candidate_urls)
+        features = self.get_features_batch([ref_url] + candidate_urls)
+        sim_flags, sim_scores = self.score_features(features[:1], features[1:], [ref_url], candidate_urls)
+        return [(bool(flag), float(score)) for flag, score in zip(sim_flags[0], sim_scores[0])]
+
+    def similarity_matrix(self, urls):
+        '''
+        计算多个页面两两之间的相似度，每个页面只提取一次特征
+        :return (相似度标志矩阵, 相似度分数矩阵)，shape均为(len(urls), len(urls))
+        '''
+        urls = list(urls)
+        features = self.get_features_batch(urls)
+        return self.score_features(features, features, urls, urls)
@@ -1,6 +1,8 @@
+import os
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
+# 日志等级默认为INFO，可通过环境变量WEBPAGE_SIM_LOG_LEVEL或配置monitor.log_level调整
+logging.basicConfig(level=os.environ.get('WEBPAGE_SIM_LOG_LEVEL', 'INFO').upper())
 # 涉及的三方包日志等级统一设置为ERROR
 for pkg in ['selenium', 'urllib3', 'httpx']:
     logger_pkg = logging.getLogger(pkg)
@@ -8,6 +10,9 @@ for pkg in ['selenium', 'urllib3', 'httpx']:
 
 
 def create_logger(name):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    return logger
\ No newline at end of file
+    # 不单独设置等级，沿用root logger的等级
+    return logging.getLogger(name)
+
+
+def set_log_level(level):
+    logging.getLogger().setLevel(str(level).upper())
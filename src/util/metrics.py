@@ -0,0 +1,185 @@
+import time
+import bisect
+import threading
+
+# 阶段耗时直方图的默认分桶上界(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Timer:
+    __slots__ = ('sink', 'stage', 'start')
+
+    def __init__(self, sink, stage):
+        self.sink = sink
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.sink.observe('stage_seconds', time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsSink:
+    '''
+    流程指标输出接口：计数器累加(inc)、观测值记录(observe)以及阶段计时(timer)
+    enabled为False时调用方可以跳过计算指标本身的开销(例如统计字节数)
+    '''
+    enabled = True
+
+    def inc(self, name, value=1, **labels):
+        raise NotImplementedError
+
+    def observe(self, name, value, **labels):
+        raise NotImplementedError
+
+    def timer(self, stage):
+        '''
+        :return 上下文管理器，退出时将耗时记录到stage_seconds{stage=...}
+        '''
+        return _Timer(self, stage)
+
+    def render(self):
+        return ''
+
+
+class NullSink(MetricsSink):
+    '''
+    关闭指标时使用的空实现，各方法直接返回，计时复用同一个空上下文管理器，开销接近于零
+    '''
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in items) + '}'
+
+
+class PrometheusSink(MetricsSink):
+    '''
+    在进程内聚合指标，按Prometheus文本格式输出：计数器输出为<namespace>_<name>_total，观测值输出为直方图
+    各方法线程安全，多进程批量任务中每个进程单独聚合
+    '''
+
+    def __init__(self, namespace='webpage_sim', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        # (name, labels) -> [各分桶计数, 总和, 总数]
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        pos = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            if pos < len(self.buckets):
+                histogram[0][pos] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def get_counter(self, name, **labels):
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_histogram(self, name, **labels):
+        '''
+        :return (观测次数, 观测值总和)
+        '''
+        with self.lock:
+            histogram = self.histograms.get((name, tuple(sorted(labels.items()))))
+        return (histogram[2], histogram[1]) if histogram else (0, 0.0)
+
+    def render(self):
+        '''
+        :return Prometheus文本格式(text/plain; version=0.0.4)的全部指标
+        '''
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(counts), total, count)) for key, (counts, total, count)
+                                in self.histograms.items())
+        lines = []
+        last_name = None
+        for (name, labels), value in counters:
+            metric = f'{self.namespace}_{name}_total'
+            if metric != last_name:
+                lines.append(f'# TYPE {metric} counter')
+                last_name = metric
+            lines.append(f'{metric}{_format_labels(labels)} {value}')
+        for (name, labels), (counts, total, count) in histograms:
+            metric = f'{self.namespace}_{name}'
+            if metric != last_name:
+                lines.append(f'# TYPE {metric} histogram')
+                last_name = metric
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{metric}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{metric}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+_SINK_TYPES = {'none': NullSink, 'prometheus': PrometheusSink}
+_sink = NullSink()
+
+
+def create_metrics_sink(sink_type):
+    if sink_type not in _SINK_TYPES:
+        raise ValueError(f'metrics sink {sink_type} not defined')
+    return _SINK_TYPES[sink_type]()
+
+
+def get_metrics_sink():
+    '''
+    获取进程内当前的指标输出，默认为NullSink
+    '''
+    return _sink
+
+
+def set_metrics_sink(sink: MetricsSink):
+    '''
+    替换进程内的指标输出，可以传入自定义的MetricsSink实现
+    '''
+    global _sink
+    _sink = sink if sink is not None else NullSink()
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import subprocess
+import tempfile
+import unittest
+from lxml import etree
+from src.config.config_loader import TaskCfg
+from src.benchmark.synthetic import generate_page
+from src.benchmark.bench import PipelineBenchmark, FakeEmbedding, compare_with_baseline, parse_synthetic_specs, main
+
+
+class SyntheticPageTest(unittest.TestCase):
+    def test_size_and_depth(self):
+        for num_nodes, depth in [(50, 5), (2000, 30), (3000, 200)]:
+            html_text = generate_page(num_nodes, depth)
+            body = etree.fromstring(html_text.encode('utf-8'), etree.HTMLParser()).find('body')
+            elements = list(body.iter())[1:]
+            self.assertEqual(len(elements), num_nodes)
+            self.assertEqual(max(len(list(ele.iterancestors())) - 1 for ele in elements), depth)
+        self.assertEqual(generate_page(100, 10, seed=1), generate_page(100, 10, seed=1))
+
+    def test_parse_specs(self):
+        self.assertEqual(parse_synthetic_specs('2000x30,100'), [(2000, 30), (100, 30)])
+
+
+class PipelineBenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.cfg = TaskCfg.load_config_yaml('../../config/config.yaml')
+
+    def test_run_all_stages(self):
+        benchmark = PipelineBenchmark(self.cfg, repeat=2)
+        results = benchmark.run([('tiny', generate_page(200, 10, num_rules=20))])
+        # 原配置不受影响，向量化使用fake后端
+        self.assertEqual(self.cfg.similarity_model.embed_backend, 'openai')
+        self.assertTrue(isinstance(benchmark.embedders['plain_text'].text_embed_model, FakeEmbedding))
+        for stage in ['parse/bs4', 'preprocess/lxml', 'preprocess_css/bs4', 'tree/traverse_preorder',
+                      'embed/bow', 'embed/plain_text', 'embed/html_structure', 'embed/css']:
+            stats = results[f'tiny/{stage}']
+            self.assertEqual(stats['repeat'], 2)
+            self.assertTrue(stats['p50_ms'] <= stats['p90_ms'] <= stats['p99_ms'])
+            self.assertGreater(stats['mb_per_s'], 0)
+            self.assertIn('peak_mem_mb', stats)
+        self.assertIn('all/score/bow_matrix', results)
+        self.assertIn('all/score/cosine_pair', results)
+
+    def test_fake_backend_not_registered_on_import(self):
+        # 导入main或bench模块不会注册fake后端，只有运行性能测试时注册
+        code = 'import main, sys; print("src.benchmark.bench" in sys.modules); ' \
+               'from src.benchmark import bench; from src.model.registry import EmbedRegistry; ' \
+               'print("fake" in EmbedRegistry.backend_dict); bench.register_fake_backend(); ' \
+               'print("fake" in EmbedRegistry.backend_dict)'
+        output = subprocess.run([sys.executable, '-c', code], cwd='../..', capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.split(), ['False', 'False', 'True'])
+
+    def test_stage_filter(self):
+        benchmark = PipelineBenchmark(self.cfg, repeat=1, measure_memory=False, stage_filter=['tree/'])
+        results = benchmark.run([('tiny', generate_page(100, 5, num_rules=10))])
+        self.assertEqual(sorted(results), ['tiny/tree/structure_code', 'tiny/tree/subtree_code_lens',
+                                           'tiny/tree/traverse_preorder'])
+        self.assertNotIn('peak_mem_mb', results['tiny/tree/structure_code'])
+
+    def test_compare_with_baseline(self):
+        baseline = {'a': {'p50_ms': 10, 'peak_mem_mb': 2}, 'b': {'p50_ms': 10}}
+        results = {'a': {'p50_ms': 11, 'peak_mem_mb': 3}, 'b': {'p50_ms': 13}, 'c': {'p50_ms': 100}}
+        regressions = compare_with_baseline(results, baseline, tolerance=0.2)
+        self.assertEqual([(key, metric) for key, metric, _, _, _ in regressions], [('a', 'peak_mem_mb'), ('b', 'p50_ms')])
+
+    def test_main_with_baseline(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'bench.json')
+            args = ['--config', '../../config/config.yaml', '--datas', '', '--synthetic', '100x5', '--repeat', '1',
+                    '--stages', 'tree/', '--no-memory']
+            main(args + ['--output', output])
+            with open(output, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+            self.assertIn('synthetic_100x5/tree/traverse_preorder', report['results'])
+            # 基线耗时缩小后当前结果应判别为性能回退
+            for stats in report['results'].values():
+                stats['p50_ms'] /= 1000
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(report, f)
+            with self.assertRaises(SystemExit):
+                main(args + ['--baseline', output, '--fail-on-regression'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from src.cache.embedding_cache import EmbeddingCache
+
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, 'embeddings.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_put_many(self):
+        cache = EmbeddingCache(self.cache_file)
+        keys = [EmbeddingCache.make_key('model', text) for text in ['a', 'b', 'c']]
+        self.assertEqual(cache.get_many(keys), {})
+        cache.put_many([(keys[0], [0.1, 0.2]), (keys[1], [0.3, 0.4])])
+        cache.close()
+        cache = EmbeddingCache(self.cache_file)
+        result = cache.get_many(keys)
+        self.assertEqual(set(result), set(keys[:2]))
+        self.assertEqual(result[keys[0]].dtype, np.float32)
+        self.assertTrue(np.allclose(result[keys[1]], [0.3, 0.4]))
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'entries': 2})
+        cache.close()
+
+    def test_key_depends_on_model(self):
+        self.assertNotEqual(EmbeddingCache.make_key('model1', 'a'), EmbeddingCache.make_key('model2', 'a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
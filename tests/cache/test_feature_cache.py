@@ -0,0 +1,77 @@
+import os
+import time
+import tempfile
+import unittest
+from src.cache.feature_cache import FeatureCache, config_fingerprint
+from src.config.config_loader import TaskCfg
+from src.model.sparse_vector import SparseVector
+
+config_file = '../../config/config.yaml'
+
+
+class FeatureCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, 'features.db')
+        self.cfg = TaskCfg.load_config_yaml(config_file)
+        self.features = ([0.0, 1.5, 2.0], SparseVector([1, 3], [1.0, 2.0], 10))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_put(self):
+        cache = FeatureCache(self.cache_file)
+        key = FeatureCache.make_key('http://a.com', '<html></html>', config_fingerprint(self.cfg))
+        self.assertIsNone(cache.get(key))
+        cache.put(key, 'http://a.com', self.features)
+        feature_vec, css_vec = cache.get(key)
+        self.assertEqual(feature_vec, self.features[0])
+        self.assertEqual(css_vec, self.features[1])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+        cache.close()
+        # 缓存持久化到文件，重新打开后仍然可以命中
+        cache = FeatureCache(self.cache_file)
+        self.assertIsNotNone(cache.get(key))
+        cache.close()
+
+    def test_key_changes(self):
+        # 源码或配置变化时缓存key随之变化
+        fingerprint = config_fingerprint(self.cfg)
+        key = FeatureCache.make_key('http://a.com', '<html></html>', fingerprint)
+        self.assertNotEqual(key, FeatureCache.make_key('http://a.com', '<html><div></div></html>', fingerprint))
+        self.assertNotEqual(key, FeatureCache.make_key('http://b.com', '<html></html>', fingerprint))
+        # 调整判别阈值不影响特征，缓存仍然有效
+        self.cfg.similarity_model.bow_thre = 0.7
+        self.cfg.similarity_model.embed_thre = 0.9
+        self.cfg.similarity_model.cascade_low = 0.1
+        self.cfg.similarity_model.cascade_high = 0.9
+        self.assertEqual(fingerprint, config_fingerprint(self.cfg))
+        self.cfg.similarity_model.depth_decay = 0.5
+        self.assertNotEqual(fingerprint, config_fingerprint(self.cfg))
+
+    def test_ttl(self):
+        cache = FeatureCache(self.cache_file, ttl=1)
+        cache.put('key', 'http://a.com', self.features)
+        self.assertIsNotNone(cache.get('key'))
+        time.sleep(1.1)
+        self.assertIsNone(cache.get('key'))
+        cache.close()
+
+    def test_lru_eviction(self):
+        cache = FeatureCache(self.cache_file, max_entries=2)
+        for key in ['k1', 'k2']:
+            cache.put(key, key, self.features)
+            time.sleep(0.01)
+        # 访问k1后k2成为最久未访问的记录
+        cache.get('k1')
+        time.sleep(0.01)
+        cache.put('k3', 'k3', self.features)
+        cache.evict()
+        self.assertIsNotNone(cache.get('k1'))
+        self.assertIsNone(cache.get('k2'))
+        self.assertIsNotNone(cache.get('k3'))
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+from src.cache.lru_cache import LruCache
+
+
+class LruCacheTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LruCache(max_entries=2)
+        cache.put('k1', 1)
+        cache.put('k2', 2)
+        # 访问k1后k2成为最久未访问的记录
+        self.assertEqual(cache.get('k1'), 1)
+        cache.put('k3', 3)
+        self.assertIsNone(cache.get('k2'))
+        self.assertEqual(cache.get('k1'), 1)
+        self.assertEqual(cache.get('k3'), 3)
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
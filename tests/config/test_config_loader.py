@@ -13,6 +13,8 @@ class TaskCfgTest(unittest.TestCase):
         self.assertIn('openai', self.cfg.__dict__)
         self.assertIn('html', self.cfg.__dict__)
         self.assertIn('similarity_model', self.cfg.__dict__)
+        self.assertIn('cache', self.cfg.__dict__)
+        self.assertIn('monitor', self.cfg.__dict__)
 
     def test_load_config_openai(self):
         # 测试openai相关的配置参数完整性
@@ -21,29 +23,43 @@ class TaskCfgTest(unittest.TestCase):
         self.assertIn('version', self.cfg.openai.__dict__)
         self.assertIn('embed_model_name', self.cfg.openai.__dict__)
         self.assertIn('max_text_len', self.cfg.openai.__dict__)
+        self.assertIn('max_batch_size', self.cfg.openai.__dict__)
+        self.assertIn('rpm', self.cfg.openai.__dict__)
+        self.assertIn('tpm', self.cfg.openai.__dict__)
 
     def test_load_config_html(self):
         # 测试页面下载及预处理相关的配置参数完整性
         self.assertIn('fetch_method', self.cfg.html.__dict__)
-        self.assertIn(self.cfg.html.fetch_method, ['webdriver', 'base'])
+        self.assertIn(self.cfg.html.fetch_method, ['webdriver', 'webdriver_lite', 'async', 'base'])
         self.assertIn('driver_file', self.cfg.html.__dict__)
+        self.assertIn('max_connections', self.cfg.html.__dict__)
+        self.assertIn('max_connections_per_host', self.cfg.html.__dict__)
+        self.assertIn('max_retries', self.cfg.html.__dict__)
+        self.assertIn('lite_profile', self.cfg.html.__dict__)
+        self.assertIn('js_budget', self.cfg.html.lite_profile.__dict__)
         self.assertIn('filter_tags', self.cfg.html.__dict__)
         self.assertIn('css_tags', self.cfg.html.__dict__)
         self.assertIn('include_css', self.cfg.html.__dict__)
         self.assertIn('remote_css', self.cfg.html.__dict__)
+        self.assertIn('pipeline_workers', self.cfg.html.__dict__)
 
     def test_load_config_sim_model(self):
         # 测试特征提取与相似度计算相关的配置参数完整性
         self.assertIn('method', self.cfg.similarity_model.__dict__)
-        self.assertIn(self.cfg.similarity_model.method, ['bow', 'plain_text', 'html_structure'])
+        self.assertIn(self.cfg.similarity_model.method, ['bow', 'plain_text', 'html_structure', 'cascade'])
+        self.assertIn('cascade_low', self.cfg.similarity_model.__dict__)
+        self.assertIn('cascade_high', self.cfg.similarity_model.__dict__)
+        self.assertIn(self.cfg.similarity_model.embed_backend, ['openai', 'local'])
         if self.cfg.similarity_model.method == 'bow':
             self.assertIn('feature_dim_bow', self.cfg.similarity_model.__dict__)
+            self.assertIn('sparse_bow', self.cfg.similarity_model.__dict__)
             self.assertIn('depth_decay', self.cfg.similarity_model.__dict__)
             self.assertIn('warmup_depth', self.cfg.similarity_model.__dict__)
             self.assertIn('bow_thre', self.cfg.similarity_model.__dict__)
         elif self.cfg.similarity_model.method == 'plain_text':
             self.assertIn('embed_ignore_tags', self.cfg.similarity_model.__dict__)
             self.assertIn('embed_thre', self.cfg.similarity_model.__dict__)
+            self.assertIn('embed_backend', self.cfg.similarity_model.__dict__)
             self.assertIn('max_depth', self.cfg.similarity_model.__dict__)
         else:
             self.assertIn('embed_ignore_tags', self.cfg.similarity_model.__dict__)
@@ -52,6 +68,24 @@ class TaskCfgTest(unittest.TestCase):
             self.assertIn('max_height', self.cfg.similarity_model.__dict__)
             self.assertIn('min_code_len', self.cfg.similarity_model.__dict__)
 
+    def test_load_config_cache(self):
+        # 测试缓存相关的配置参数完整性
+        self.assertIn('feature_cache_file', self.cfg.cache.__dict__)
+        self.assertIn('feature_cache_ttl', self.cfg.cache.__dict__)
+        self.assertIn('feature_cache_max_entries', self.cfg.cache.__dict__)
+
+    def test_load_config_monitor(self):
+        # 测试日志及流程指标相关的配置参数完整性
+        self.assertIn('log_level', self.cfg.monitor.__dict__)
+        self.assertIn(self.cfg.monitor.metrics_sink, ['none', 'prometheus'])
+
+    def test_load_config_service(self):
+        # 测试http服务相关的配置参数完整性
+        self.assertIn('host', self.cfg.service.__dict__)
+        self.assertIn('port', self.cfg.service.__dict__)
+        self.assertIn('max_pending', self.cfg.service.__dict__)
+        self.assertIn('max_batch_tasks', self.cfg.service.__dict__)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,119 @@
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.config.config_loader import TaskCfg
+from src.dom_tree.css_fetcher import StylesheetCache, parse_css_rules
+from src.dom_tree.dom_preprocess import DomProcessor
+
+config_file = '../../config/config.yaml'
+css_files = {
+    '/static/main.css': '.main {color: red; margin: 0} div p {padding: 1px}',
+    '/static/theme.css': '.main {color: blue}',
+}
+
+
+class CssHandler(BaseHTTPRequestHandler):
+    '''
+    本地模拟css服务，支持ETag验证，并记录各状态码的请求次数
+    '''
+    protocol_version = 'HTTP/1.1'
+    status_counts = {}
+    # 模拟暂时不可用、返回503的路径
+    unavailable_paths = set()
+
+    def do_GET(self):
+        css_text = css_files.get(self.path)
+        if self.path in CssHandler.unavailable_paths:
+            status, body = 503, b''
+        elif css_text is None:
+            status, body = 404, b''
+        elif self.headers.get('If-None-Match') == f'"{self.path}"':
+            status, body = 304, b''
+        else:
+            status, body = 200, css_text.encode('utf-8')
+        CssHandler.status_counts[status] = CssHandler.status_counts.get(status, 0) + 1
+        self.send_response(status)
+        if css_text is not None:
+            self.send_header('ETag', f'"{self.path}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StylesheetCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CssHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        CssHandler.status_counts = {}
+        CssHandler.unavailable_paths = set()
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+        self.html_cfg.remote_css = True
+
+    def test_parse_css_rules(self):
+        rules = parse_css_rules(css_files['/static/main.css'])
+        self.assertEqual(rules, [('.main', {'color': 'red', 'margin': '0'}), ('div p', {'padding': '1px'})])
+
+    def test_cache_and_revalidate(self):
+        css_urls = [f'{self.base_url}/static/main.css', f'{self.base_url}/static/theme.css',
+                    f'{self.base_url}/static/missing.css']
+        css_fetcher = StylesheetCache(max_age=300)
+        rules_list = css_fetcher.get_rules_batch(css_urls)
+        self.assertEqual(len(rules_list[0]), 2)
+        self.assertEqual(rules_list[2], [])
+        # 缓存未过期时不再请求
+        css_fetcher.get_rules_batch(css_urls[:2])
+        self.assertEqual(CssHandler.status_counts, {200: 2, 404: 1})
+        # 缓存过期后通过ETag验证，服务端返回304
+        css_fetcher.max_age = 0
+        rules_list = css_fetcher.get_rules_batch(css_urls[:2])
+        self.assertEqual(len(rules_list[0]), 2)
+        self.assertEqual(CssHandler.status_counts, {200: 2, 404: 1, 304: 2})
+        css_fetcher.close()
+
+    def test_stale_rules_on_error(self):
+        # 缓存过期后重新验证返回503时继续使用过期的css规则，服务恢复后正常验证
+        css_url = f'{self.base_url}/static/main.css'
+        css_fetcher = StylesheetCache(max_age=0)
+        rules = css_fetcher.get_rules(css_url)
+        CssHandler.unavailable_paths = {'/static/main.css'}
+        self.assertEqual(css_fetcher.get_rules(css_url), rules)
+        self.assertEqual(css_fetcher.get_rules(f'{self.base_url}/static/theme.css'), [('.main', {'color': 'blue'})])
+        # 没有缓存时返回空列表
+        empty_fetcher = StylesheetCache()
+        self.assertEqual(empty_fetcher.get_rules(css_url), [])
+        empty_fetcher.close()
+        CssHandler.unavailable_paths = set()
+        self.assertEqual(css_fetcher.get_rules(css_url), rules)
+        self.assertEqual(CssHandler.status_counts, {200: 2, 503: 2, 304: 1})
+        css_fetcher.close()
+
+    def test_resolve_relative_links(self):
+        # 相对路径的css链接基于页面url转换为绝对路径，多个css按页面顺序合并
+        html_text = '<html><head><link rel="stylesheet" href="../static/main.css">' \
+                    '<link rel="stylesheet" href="/static/theme.css"><link rel="icon" href="a.ico"></head>' \
+                    '<body><div class="main"></div></body></html>'
+        css_fetcher = StylesheetCache()
+        dom_processor = DomProcessor(html_text, self.html_cfg, f'{self.base_url}/pages/index.html', css_fetcher)
+        self.assertEqual(dom_processor.get_stylesheet_urls(),
+                         [f'{self.base_url}/static/main.css', f'{self.base_url}/static/theme.css'])
+        selector_dict = dom_processor.get_css_selectors()
+        self.assertEqual(selector_dict['.main'], {'color': 'blue'})
+        self.assertIn('div p', selector_dict)
+        css_fetcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
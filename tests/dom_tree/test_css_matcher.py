@@ -0,0 +1,86 @@
+import unittest
+from soupsieve import SelectorSyntaxError
+from src.config.config_loader import TaskCfg
+from src.dom_tree.css_matcher import split_selector_group, selector_key, required_keys
+from src.dom_tree.dom_preprocess import DomProcessor, LxmlDomProcessor
+
+local_html_path = '../../datas/huawei_ads_1.html'
+config_file = '../../config/config.yaml'
+
+
+def select_assign(dom_processor, selector_dict):
+    # 逐条规则在整个文档中查找结点的方式，作为索引匹配结果的参照
+    for selector, css_prop_info in selector_dict.items():
+        try:
+            ele_list = dom_processor.dom.select(selector)
+        except (SelectorSyntaxError, NotImplementedError):
+            continue
+        for ele in ele_list:
+            ele.attrs['css_mark'] = '1'
+            for key in css_prop_info:
+                if key not in ele.attrs:
+                    ele.attrs[key] = css_prop_info.get(key)
+
+
+def dump_tree(tree_root):
+    node_list, _ = tree_root.traverse_preorder()
+    return [(node.tag_name, node.depth, node.attr_dict) for node in node_list]
+
+
+class CssMatcherTest(unittest.TestCase):
+    def test_selector_key(self):
+        self.assertEqual(selector_key('div.main > a#home:hover'), ('id', 'home'))
+        self.assertEqual(selector_key('#nav ul li.active'), ('class', 'active'))
+        self.assertEqual(selector_key('.nav  Li'), ('tag', 'li'))
+        self.assertEqual(selector_key('.md\\:flex'), ('class', 'md:flex'))
+        self.assertEqual(selector_key('a:not(.b)'), ('tag', 'a'))
+        self.assertEqual(selector_key('a[title="x y"]'), ('tag', 'a'))
+        self.assertIsNone(selector_key('#nav *'))
+        self.assertIsNone(selector_key('.a > :first-child'))
+        self.assertIsNone(selector_key('svg|rect'))
+
+    def test_selector_group(self):
+        self.assertEqual(split_selector_group('a, b:not(.c, .d), [title="e,f"]'), ['a', 'b:not(.c, .d)', '[title="e,f"]'])
+        self.assertEqual(required_keys('#nav .menu > li:not(.x) a'),
+                         {('id', 'nav'), ('class', 'menu'), ('tag', 'li'), ('tag', 'a')})
+
+
+class AssignSelectorTest(unittest.TestCase):
+    '''
+    测试基于规则索引添加css属性的结果与逐条规则全文档查找一致
+    '''
+
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+        self.html_cfg.remote_css = False
+        self.html_cfg.include_css = True
+
+    def check_same(self, html_text):
+        dom_processor = DomProcessor(html_text, self.html_cfg)
+        tree_root = dom_processor.preprocess()
+        expect_processor = DomProcessor(html_text, self.html_cfg)
+        select_assign(expect_processor, expect_processor.fused_walk(None))
+        self.assertEqual(dump_tree(tree_root), dump_tree(expect_processor.transform_dom_tree()))
+        return tree_root
+
+    def test_local_html(self):
+        with open(local_html_path, 'r', encoding='utf-8') as f:
+            self.check_same(f.read().strip())
+
+    def test_unsupported_selectors(self):
+        # 伪元素等不支持的selector被跳过，不影响其它规则
+        html_text = '<html><head><style>p:before{content:"x"} p::after{content:"y"} #main p, .item{color:red}' \
+                    ' div > :first-child{margin:0} .missing a{color:blue}</style></head>' \
+                    '<body><div id="main"><p class="item">a</p><span class="item">b</span></div></body></html>'
+        tree_root = self.check_same(html_text)
+        node_list, _ = tree_root.traverse_preorder()
+        p_node = [node for node in node_list if node.tag_name == 'p'][0]
+        self.assertEqual(p_node.attr_dict.get('color'), 'red')
+        self.assertEqual(p_node.attr_dict.get('margin'), '0')
+        for processor_cls in [DomProcessor, LxmlDomProcessor]:
+            processor_cls(html_text, self.html_cfg).preprocess()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
 import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 import bs4
-from src.dom_tree.dom_preprocess import DomProcessor
+import numpy as np
+from src.dom_tree.dom_preprocess import DomProcessor, LxmlDomProcessor, create_dom_processor
 from src.dom_tree.html_tree import TreeNode
 from src.config.config_loader import TaskCfg
 
 local_html_path = '../../datas/huawei_ads_1.html'
+local_html_files = ['../../datas/huawei_ads_1.html', '../../datas/huawei_ads_2.html', '../../datas/huawei_cloud.html']
 config_file = '../../config/config.yaml'
 
 
@@ -53,5 +57,213 @@ class DomTreeTest(unittest.TestCase):
         self.assertTrue(isinstance(tree_root, TreeNode))
 
 
+def dump_tree(tree_root):
+    # 先序遍历输出各结点的类型、深度、序号和属性，用于比较两棵树是否一致
+    node_list, _ = tree_root.traverse_preorder()
+    return [(node.tag_name, node.depth, node.index, node.attr_dict) for node in node_list]
+
+
+class LxmlBackendTest(unittest.TestCase):
+    '''
+    测试lxml解析方式构建的dom tree与bs4解析方式一致
+    '''
+
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+
+    def build_tree(self, processor_cls, html_text):
+        dom_processor = processor_cls(html_text, self.html_cfg)
+        dom_processor.filter_dom()
+        dom_processor.process_css()
+        return dom_processor, dom_processor.transform_dom_tree()
+
+    def test_create_dom_processor(self):
+        self.html_cfg.parser_backend = 'lxml'
+        self.assertTrue(isinstance(create_dom_processor('<html></html>', self.html_cfg), LxmlDomProcessor))
+        self.html_cfg.parser_backend = 'bs4'
+        self.assertTrue(isinstance(create_dom_processor('<html></html>', self.html_cfg), DomProcessor))
+
+    def test_same_tree_as_bs4(self):
+        for html_file in local_html_files:
+            with open(html_file, 'r', encoding='utf-8') as f:
+                html_text = f.read().strip()
+            bs4_processor, bs4_tree = self.build_tree(DomProcessor, html_text)
+            lxml_processor, lxml_tree = self.build_tree(LxmlDomProcessor, html_text)
+            self.assertEqual(dump_tree(lxml_tree), dump_tree(bs4_tree))
+            self.assertEqual(lxml_processor.css_dict, bs4_processor.css_dict)
+
+    def test_multi_valued_attrs(self):
+        html_text = '<html><body><div class=" a  b " id="x  y"><a rel="nofollow  noopener"></a></div></body></html>'
+        _, bs4_tree = self.build_tree(DomProcessor, html_text)
+        _, lxml_tree = self.build_tree(LxmlDomProcessor, html_text)
+        self.assertEqual(dump_tree(lxml_tree), dump_tree(bs4_tree))
+
+
+    def test_css_combinators(self):
+        # lxml逐结点匹配的结果与bs4(soupsieve)一致
+        html_text = '<html><body><div id="m" class="a"><ul><li class="b">x</li><li class="b c">y</li></ul>' \
+                    '<p>z</p><span class="c">w</span></div><span class="c">v</span></body></html>'
+        selectors = ['.a li', 'ul > .b', 'li + .c', 'p ~ span', '#m > span.c', 'div .c, body > span',
+                     'li:first-child', 'a:hover', 'p::before', 'div *:first-of-type', '.a > :nth-last-of-type(1)']
+        for selector in selectors:
+            bs4_processor = DomProcessor(html_text, self.html_cfg)
+            bs4_processor.assign_selector_to_nodes({selector: {'color': 'red'}})
+            expect = [(ele.name, ele.get_text()) for ele in bs4_processor.dom.find_all(True)
+                      if ele.attrs.get('css_mark')]
+            lxml_processor = LxmlDomProcessor(html_text, self.html_cfg)
+            lxml_processor.assign_selector_to_nodes({selector: {'color': 'red'}})
+            actual = [(ele.tag, ''.join(ele.itertext())) for ele in lxml_processor.dom.iter()
+                      if ele in lxml_processor.css_marked]
+            self.assertEqual(actual, expect, selector)
+            self.assertTrue(all(ele.get('color') == 'red' for ele in lxml_processor.css_marked))
+
+    def test_same_tree_as_bs4_with_css(self):
+        # 开启include_css后两种解析方式的结点属性(包括css_mark的取值和类型)一致
+        self.html_cfg.include_css = True
+        html_files = local_html_files + [None]
+        for html_file in html_files:
+            if html_file is None:
+                html_text = '<html><head><style>.a{color:red} p{margin:0}</style></head><body>' \
+                            '<div class="a" css_mark="x"><p>y</p></div><span css_mark="1">z</span></body></html>'
+            else:
+                with open(html_file, 'r', encoding='utf-8') as f:
+                    html_text = f.read().strip()
+            _, bs4_tree = self.build_tree(DomProcessor, html_text)
+            _, lxml_tree = self.build_tree(LxmlDomProcessor, html_text)
+            bs4_nodes, lxml_nodes = dump_tree(bs4_tree), dump_tree(lxml_tree)
+            self.assertEqual(lxml_nodes, bs4_nodes)
+            self.assertEqual([type(attrs.get('css_mark')) for *_, attrs in lxml_nodes],
+                             [type(attrs.get('css_mark')) for *_, attrs in bs4_nodes])
+            self.assertTrue(any(attrs.get('css_mark') == '1' for *_, attrs in bs4_nodes))
+
+    def test_missing_cssselect(self):
+        # 未安装cssselect时开启include_css直接报错，而不是静默跳过css
+        self.html_cfg.include_css = True
+        with mock.patch('src.dom_tree.dom_preprocess.cssselect', None):
+            with self.assertRaises(ImportError):
+                LxmlDomProcessor('<html></html>', self.html_cfg)
+            self.html_cfg.include_css = False
+            LxmlDomProcessor('<html></html>', self.html_cfg)
+
+
+class FusedPreprocessTest(unittest.TestCase):
+    '''
+    测试单次遍历的preprocess与依次调用filter_dom、process_css、transform_dom_tree结果一致
+    '''
+
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+        self.html_cfg.remote_css = False
+
+    def check_same(self, processor_cls, html_text):
+        dom_processor = processor_cls(html_text, self.html_cfg)
+        dom_processor.filter_dom()
+        dom_processor.process_css()
+        expect_tree = dump_tree(dom_processor.transform_dom_tree())
+        fused_processor = processor_cls(html_text, self.html_cfg)
+        fused_tree = dump_tree(fused_processor.preprocess())
+        self.assertEqual(fused_tree, expect_tree)
+        self.assertEqual(fused_processor.css_dict, dom_processor.css_dict)
+
+    def test_same_as_multi_pass(self):
+        for html_file in local_html_files:
+            with open(html_file, 'r', encoding='utf-8') as f:
+                html_text = f.read().strip()
+            for processor_cls in [DomProcessor, LxmlDomProcessor]:
+                self.check_same(processor_cls, html_text)
+
+    def test_css_in_duplicated_sibling(self):
+        # 重复的sibling不加入树，但其中的css仍需收集；被过滤结点中的css不收集
+        html_text = '<html><body><div><style>.a{color:red}</style></div><div><style>.b{color:blue}</style></div>' \
+                    '<noscript><style>.c{color:green}</style></noscript></body></html>'
+        for processor_cls in [DomProcessor, LxmlDomProcessor]:
+            self.check_same(processor_cls, html_text)
+
+    def test_stylesheet_urls(self):
+        self.html_cfg.remote_css = True
+        html_text = '<html><head><base href="/static/"><link rel="stylesheet" href="a.css"></head></html>'
+        for processor_cls in [DomProcessor, LxmlDomProcessor]:
+            dom_processor = processor_cls(html_text, self.html_cfg, 'http://example.com/page')
+            fetched = []
+            dom_processor.build_selector_dict = lambda css_texts, css_urls: fetched.extend(css_urls) or {}
+            dom_processor.preprocess()
+            self.assertEqual(fetched, ['http://example.com/static/a.css'])
+
+
+class FakeDomNode:
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+
+
+class CompactTreeTest(unittest.TestCase):
+    '''
+    测试TreeNode的迭代遍历，以及构建完成后释放构建状态
+    '''
+
+    def build_chain(self, depth):
+        tree_root = TreeNode(tag_name='root', attr_dict={})
+        node = tree_root
+        for _ in range(depth):
+            node, _ = node.add_child(FakeDomNode('div'))
+        tree_root.finish_build()
+        return tree_root
+
+    def test_deep_tree(self):
+        # 层级远超递归深度限制的树也可以正常遍历
+        depth = 5000
+        tree_root = self.build_chain(depth)
+        node_list, height = tree_root.traverse_preorder()
+        self.assertEqual(len(node_list), depth)
+        self.assertEqual(height, depth + 1)
+        self.assertEqual(node_list[-1].depth, depth)
+        self.assertEqual(node_list[0].height, depth)
+        html_code = tree_root.get_html_structure_code([], max_depth=depth + 1)
+        self.assertEqual(html_code.count('<div>'), depth)
+        node_embed_list = [(np.ones(2), 0)] * depth
+        node_embed_list[depth - 1] = (np.ones(2), 1)
+        node_embed_list.append((np.ones(2), 1))
+        self.assertTrue(np.allclose(tree_root.get_structure_embed(node_embed_list), np.ones(2)))
+
+    def test_structure_code(self):
+        tree_root = TreeNode(tag_name='root', attr_dict={})
+        div_node, _ = tree_root.add_child(FakeDomNode('div', {'class': ['a', 'b'], 'id': 'x'}))
+        div_node.add_child(FakeDomNode('span'))
+        tree_root.add_child(FakeDomNode('p'))
+        tree_root.finish_build()
+        tree_root.traverse_preorder()
+        self.assertEqual(tree_root.get_html_structure_code(['id']), '<div class=a b>\n<span>\n</span>\n</div>\n<p>\n</p>')
+        self.assertEqual(tree_root.get_html_structure_code([], max_depth=1), '<div class=a b id=x></div>\n<p></p>')
+        self.assertEqual(tree_root.height, 3)
+        self.assertEqual(div_node.height, 2)
+
+    def test_compact_node(self):
+        tree_root = self.build_chain(3)
+        node_list, _ = tree_root.traverse_preorder()
+        self.assertFalse(hasattr(tree_root, '__dict__'))
+        self.assertTrue(all(node.child_keys is None for node in node_list))
+        self.assertIs(node_list[0].tag_name, node_list[1].tag_name)
+
+    def test_concurrent_build(self):
+        # 多个线程同时构建树时，各树的结点index互不影响
+        cfg = TaskCfg.load_config_yaml(config_file)
+        html_texts = []
+        for html_file in local_html_files:
+            with open(html_file, 'r', encoding='utf-8') as f:
+                html_texts.append(f.read().strip())
+
+        def build(html_text):
+            return dump_tree(LxmlDomProcessor(html_text, cfg.html).preprocess())
+
+        expect_trees = [build(html_text) for html_text in html_texts]
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            trees = list(executor.map(build, html_texts * 4))
+        self.assertEqual(trees, expect_trees * 4)
+        for tree in trees:
+            self.assertEqual([index for _, _, index, _ in tree], list(range(1, len(tree) + 1)))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,233 @@
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.config.config_loader import TaskCfg
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import MaxRetryError
+from src.download.page_download import AsyncDownloader, BaseDownloader, WebDriverDownloader, \
+    LiteWebDriverDownloader, create_downloader
+
+config_file = '../../config/config.yaml'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    本地模拟网页服务：/page/*返回固定html，/flaky前两次返回503，/missing返回404
+    '''
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    flaky_count = 0
+
+    def do_GET(self):
+        cls = StandInHandler
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            if self.path.startswith('/page/'):
+                time.sleep(0.05)
+                self.reply(200, f'<html><body><div id="{self.path}"></div></body></html>')
+            elif self.path == '/flaky':
+                with cls.lock:
+                    cls.flaky_count += 1
+                    count = cls.flaky_count
+                self.reply(503 if count <= 2 else 200, '<html>flaky</html>')
+            else:
+                self.reply(404, 'not found')
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def reply(self, status, body):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class AsyncDownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+        self.html_cfg.fetch_method = 'async'
+        self.html_cfg.max_connections_per_host = 3
+        self.html_cfg.retry_backoff = 0.01
+        self.downloader = create_downloader(self.html_cfg)
+        StandInHandler.max_active = 0
+        StandInHandler.flaky_count = 0
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def test_create_downloader(self):
+        self.assertTrue(isinstance(self.downloader, AsyncDownloader))
+        self.html_cfg.fetch_method = 'base'
+        self.assertTrue(isinstance(create_downloader(self.html_cfg), BaseDownloader))
+
+    def test_get_html(self):
+        html_text = self.downloader.get_html(f'{self.base_url}/page/1')
+        self.assertIn('id="/page/1"', html_text)
+        self.assertEqual(self.downloader.get_html(f'{self.base_url}/missing'), '')
+
+    def test_get_html_batch(self):
+        # 批量下载结果与输入顺序一致，并且单个host的并发数不超过配置
+        urls = [f'{self.base_url}/page/{i}' for i in range(12)]
+        html_texts = self.downloader.get_html_batch(urls)
+        self.assertEqual(len(html_texts), len(urls))
+        for i, html_text in enumerate(html_texts):
+            self.assertIn(f'id="/page/{i}"', html_text)
+        self.assertGreater(StandInHandler.max_active, 1)
+        self.assertLessEqual(StandInHandler.max_active, 3)
+
+    def test_retry(self):
+        html_text = self.downloader.get_html(f'{self.base_url}/flaky')
+        self.assertEqual(html_text, '<html>flaky</html>')
+        self.assertEqual(StandInHandler.flaky_count, 3)
+
+
+class FakeDriver:
+    '''
+    模拟浏览器会话，url中包含crash时模拟浏览器崩溃
+    '''
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def __init__(self):
+        self.url = None
+        self.quit_called = False
+
+    def get(self, url):
+        if 'crash' in url:
+            raise WebDriverException('browser crashed')
+        if 'dead' in url:
+            # chromedriver进程退出时selenium不封装的连接错误
+            raise MaxRetryError(None, url, 'connection refused')
+        with FakeDriver.lock:
+            FakeDriver.active += 1
+            FakeDriver.max_active = max(FakeDriver.max_active, FakeDriver.active)
+        time.sleep(0.05)
+        with FakeDriver.lock:
+            FakeDriver.active -= 1
+        self.url = url
+
+    def execute_script(self, script):
+        return ['complete', 3]
+
+    @property
+    def page_source(self):
+        return f'<html>{self.url}</html>'
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeWebDriverDownloader(WebDriverDownloader):
+    def create_driver(self):
+        driver = FakeDriver()
+        self.drivers.append(driver)
+        return driver
+
+
+class WebDriverDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+        self.html_cfg.driver_pool_size = 3
+        self.html_cfg.max_pages_per_driver = 4
+        self.html_cfg.network_idle_time = 0
+        self.downloader = FakeWebDriverDownloader(self.html_cfg)
+        self.downloader.drivers = []
+        FakeDriver.max_active = 0
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def test_parallel_pool(self):
+        # 并行下载结果与输入顺序一致，并发会话数不超过会话池大小
+        urls = [f'http://page/{i}' for i in range(12)]
+        html_texts = self.downloader.get_html_batch(urls)
+        self.assertEqual(html_texts, [f'<html>{url}</html>' for url in urls])
+        self.assertGreater(FakeDriver.max_active, 1)
+        self.assertLessEqual(FakeDriver.max_active, 3)
+        # 12个网页、每个会话最多加载4个网页，至少需要创建3个会话
+        self.assertGreaterEqual(len(self.downloader.drivers), 3)
+        self.assertLessEqual(len(self.downloader.all_sessions), 3)
+
+    def test_recycle_session(self):
+        for i in range(5):
+            self.downloader.get_html(f'http://page/{i}')
+        # 串行下载时第一个会话加载4个网页后被回收
+        self.assertEqual(len(self.downloader.drivers), 2)
+        self.assertTrue(self.downloader.drivers[0].quit_called)
+        self.assertEqual(self.downloader.get_html('http://crash'), '')
+        self.assertTrue(self.downloader.drivers[1].quit_called)
+        self.assertEqual(self.downloader.get_html('http://page/5'), '<html>http://page/5</html>')
+        self.assertEqual(len(self.downloader.drivers), 3)
+
+
+    def test_dead_driver(self):
+        # chromedriver断开时回收会话，后续下载使用新建的会话
+        self.assertEqual(self.downloader.get_html('http://dead'), '')
+        self.assertTrue(self.downloader.drivers[0].quit_called)
+        self.assertEqual(len(self.downloader.all_sessions), 0)
+        self.assertEqual(self.downloader.get_html('http://page/1'), '<html>http://page/1</html>')
+        self.assertEqual(len(self.downloader.drivers), 2)
+        self.assertEqual(len(self.downloader.all_sessions), 1)
+
+    def test_create_driver_fails(self):
+        # 创建会话失败时返回空字符串，不占用会话池的名额
+        def fail_create():
+            raise MaxRetryError(None, 'http://localhost', 'chromedriver not started')
+
+        self.downloader.create_driver = fail_create
+        self.assertEqual(self.downloader.get_html_batch(['http://page/1'] * 4), [''] * 4)
+        del self.downloader.create_driver
+        self.assertEqual(self.downloader.get_html_batch([f'http://page/{i}' for i in range(3)]),
+                         [f'<html>http://page/{i}</html>' for i in range(3)])
+
+
+class LiteWebDriverDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.html_cfg = cfg.html
+        self.html_cfg.fetch_method = 'webdriver_lite'
+
+    def test_lite_profile(self):
+        downloader = create_downloader(self.html_cfg)
+        self.assertTrue(isinstance(downloader, LiteWebDriverDownloader))
+        options = downloader.build_options()
+        self.assertEqual(options.page_load_strategy, 'eager')
+        self.assertIn('--blink-settings=imagesEnabled=false', options.arguments)
+        viewport = ','.join(str(size) for size in self.html_cfg.lite_profile.viewport)
+        self.assertIn(f'--window-size={viewport}', options.arguments)
+        patterns = downloader.blocked_url_patterns()
+        self.assertIn('*.woff2', patterns)
+        self.assertIn('*.mp4', patterns)
+        for domain in self.html_cfg.lite_profile.block_domains:
+            self.assertIn(f'*{domain}/*', patterns)
+        self.assertLessEqual(downloader.ready_timeout, self.html_cfg.lite_profile.js_budget)
+        downloader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+from src.config.config_loader import TaskCfg
+from src.index.cluster import main, UnionFind, TemplateCluster, FeatureFile
+from src.model.sparse_vector import SparseVector, vec_to_json
+
+config_file = '../../config/config.yaml'
+
+
+class TemplateClusterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.tmp_dir.name, 'features.jsonl')
+        self.output_file = os.path.join(self.tmp_dir.name, 'clusters.jsonl')
+        rng = np.random.default_rng(0)
+        dim = 1 << 20
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            # 3个模板各6个网页，同模板网页只有少量特征取值不同；另有5个互不相似的网页
+            for template in range(3):
+                indices = rng.choice(dim, 300, replace=False)
+                values = rng.uniform(0.1, 1, 300)
+                css_vec = SparseVector.from_pairs(rng.choice(dim, 50, replace=False), np.ones(50), dim)
+                for page in range(6):
+                    page_values = values.copy()
+                    page_values[:10] *= rng.uniform(0.5, 1.5, 10)
+                    self.write_record(f, f'http://t{template}/{page}', SparseVector.from_pairs(indices, page_values, dim),
+                                      css_vec)
+            for page in range(5):
+                feature_vec = SparseVector.from_pairs(rng.choice(dim, 300, replace=False), np.ones(300), dim)
+                self.write_record(f, f'http://single/{page}', feature_vec, feature_vec)
+            f.write(json.dumps({'url': 'http://failed', 'feature_vec': [], 'css_vec': []}) + '\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def write_record(f, url, feature_vec, css_vec):
+        record = {'url': url, 'feature_vec': vec_to_json(feature_vec), 'css_vec': vec_to_json(css_vec)}
+        f.write(json.dumps(record) + '\n')
+
+    def test_union_find(self):
+        union_find = UnionFind(5)
+        self.assertTrue(union_find.union(3, 4))
+        self.assertTrue(union_find.union(4, 1))
+        self.assertFalse(union_find.union(1, 3))
+        self.assertEqual(union_find.roots().tolist(), [0, 1, 2, 1, 1])
+
+    def test_cluster_job(self):
+        main(['--config', config_file, '--input', self.input_file, '--output', self.output_file])
+        with open(self.output_file, 'r', encoding='utf-8') as f:
+            clusters = [json.loads(line) for line in f]
+        self.assertEqual(len(clusters), 3)
+        for cluster in clusters:
+            self.assertEqual(cluster['size'], 6)
+            template = cluster['members'][0].split('/')[2]
+            self.assertTrue(all(url.split('/')[2] == template for url in cluster['members']))
+            self.assertIn(cluster['representative'], cluster['members'])
+
+    def test_far_apart_duplicates(self):
+        # 两个相同的网页在输入文件中相隔超过window个同桶的无关网页，桶内按签名排序后仍能比较到
+        rng = np.random.default_rng(1)
+        dim = 1 << 20
+        dup_vec = SparseVector.from_pairs(rng.choice(dim, 300, replace=False), rng.uniform(0.1, 1, 300), dim)
+        dup_sig = int(rng.integers(1, 1 << 63))
+        signatures = {}
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            self.write_record(f, 'http://dup/0', dup_vec, dup_vec)
+            for page in range(40):
+                # 无关网页与重复网页只有一段签名不同，因此每一段的桶中都混有约30个无关网页
+                feature_vec = SparseVector.from_pairs(rng.choice(dim, 300, replace=False), np.ones(300), dim)
+                band = page % 4
+                signatures[int(feature_vec.indices[0])] = dup_sig ^ (int(rng.integers(1, 1 << 16)) << (band * 16))
+                self.write_record(f, f'http://single/{page}', feature_vec, feature_vec)
+            self.write_record(f, 'http://dup/1', dup_vec, dup_vec)
+        signatures[int(dup_vec.indices[0])] = dup_sig
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cluster = TemplateCluster(cfg, window=10)
+        cluster.signature = lambda feature_vec: signatures[int(feature_vec.indices[0])]
+        feature_file = FeatureFile(self.input_file)
+        union_find, degrees = cluster.run(feature_file)
+        clusters = list(cluster.iter_clusters(feature_file, union_find, degrees))
+        feature_file.close()
+        self.assertEqual([cluster_info['members'] for cluster_info in clusters], [['http://dup/0', 'http://dup/1']])
+
+
+if __name__ == '__main__':
+    unittest.main()
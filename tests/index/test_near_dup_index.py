@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+import numpy as np
+from src.index.lsh import simhash_signature, band_keys
+from src.index.near_dup_index import NearDupIndex
+from src.model.sparse_vector import SparseVector
+
+
+def perturb(vec, rng, ratio=0.05):
+    # 随机修改少量非零特征的取值，模拟同模板的网页
+    vec = vec.to_dense()
+    nonzero = np.flatnonzero(vec)
+    changed = rng.choice(nonzero, max(1, int(len(nonzero) * ratio)), replace=False)
+    vec[changed] *= rng.uniform(0.5, 1.5, len(changed))
+    return SparseVector.from_dense(vec)
+
+
+class NearDupIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.rng = rng
+        self.vecs = {}
+        for i in range(50):
+            indices = rng.choice(1 << 20, 300, replace=False)
+            self.vecs[f'page_{i}'] = SparseVector.from_pairs(indices, rng.uniform(0.1, 1, 300), 1 << 20)
+        self.index = NearDupIndex('bow')
+        for key, vec in self.vecs.items():
+            self.index.add(key, vec)
+
+    def test_simhash_signature(self):
+        vec = self.vecs['page_0']
+        self.assertEqual(simhash_signature(vec), simhash_signature(vec.to_dense()))
+        near_sig = simhash_signature(perturb(vec, self.rng))
+        far_sig = simhash_signature(self.vecs['page_1'])
+        self.assertLess(bin(simhash_signature(vec) ^ near_sig).count('1'), bin(simhash_signature(vec) ^ far_sig).count('1'))
+        self.assertEqual(len(band_keys(near_sig, 64, 16)), 16)
+
+    def test_query_top_k(self):
+        for i in range(10):
+            query_vec = perturb(self.vecs[f'page_{i}'], self.rng)
+            results = self.index.query(query_vec, top_k=3)
+            self.assertEqual(results[0][0], f'page_{i}')
+            self.assertGreater(results[0][1], 0.8)
+            self.assertLessEqual(len(results), 3)
+
+    def test_candidates_selective(self):
+        # 无关页面的查询只召回索引中很小比例的页面，而不是退化为全量比较
+        index = NearDupIndex('bow')
+        for i in range(5000):
+            indices = self.rng.choice(1 << 20, 50, replace=False)
+            index.add(i, SparseVector.from_pairs(indices, self.rng.uniform(0.1, 1, 50), 1 << 20))
+        for _ in range(5):
+            indices = self.rng.choice(1 << 20, 50, replace=False)
+            query_vec = SparseVector.from_pairs(indices, self.rng.uniform(0.1, 1, 50), 1 << 20)
+            self.assertLess(len(index.candidates(query_vec)), len(index) * 0.01)
+
+    def test_remove(self):
+        self.assertTrue(self.index.remove('page_0'))
+        self.assertFalse(self.index.remove('page_0'))
+        self.assertNotIn('page_0', self.index)
+        results = self.index.query(self.vecs['page_0'])
+        self.assertNotIn('page_0', [key for key, _ in results])
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            self.index.save(index_dir)
+            index = NearDupIndex.load(index_dir)
+        self.assertEqual(len(index), len(self.index))
+        query_vec = self.vecs['page_3']
+        self.assertEqual(index.query(query_vec), self.index.query(query_vec))
+
+    def test_embedding_index(self):
+        embeds = self.rng.standard_normal((50, 64))
+        index = NearDupIndex('html_structure')
+        for i, embed in enumerate(embeds):
+            index.add(i, embed.tolist(), [1.0, 0.0])
+        query = embeds[7] + self.rng.normal(scale=0.05, size=64)
+        key, score = index.query(query.tolist(), [1.0, 0.0], top_k=1)[0]
+        self.assertEqual(key, 7)
+        self.assertGreater(score, 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import json
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.config.config_loader import TaskCfg
+from src.model.embed_scheduler import EmbedScheduler, RateLimiter
+from src.model.openai_model import OpenaiEmbedding
+
+config_file = '../../config/config.yaml'
+
+
+class MockEmbeddingHandler(BaseHTTPRequestHandler):
+    '''
+    模拟openai embeddings接口：每隔一个请求返回一次429，其余请求返回由文本长度构造的embedding
+    '''
+    lock = threading.Lock()
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            self.requests.append(body['input'])
+            rate_limited = len(self.requests) % 2 == 1
+        if rate_limited:
+            self.send_json(429, {'error': {'message': 'rate limited', 'type': 'rate_limit', 'code': '429'}},
+                           {'retry-after': '0.01'})
+            return
+        data = [{'object': 'embedding', 'index': i, 'embedding': [float(len(text)), 1.0]}
+                for i, text in enumerate(body['input'])]
+        # 打乱返回顺序，客户端需要按index还原
+        self.send_json(200, {'object': 'list', 'data': data[::-1], 'model': body['model'],
+                             'usage': {'prompt_tokens': 1, 'total_tokens': 1}})
+
+    def send_json(self, status, obj, headers=None):
+        content = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class OpenaiSchedulerTest(unittest.TestCase):
+    '''
+    基于本地模拟的embeddings接口测试批次切分、429重试以及结果顺序
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockEmbeddingHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        MockEmbeddingHandler.requests = []
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cfg.openai.endpoint = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        cfg.openai.embed_cache_file = ''
+        cfg.openai.max_batch_size = 4
+        cfg.openai.retry_backoff = 0.01
+        self.openai_model = OpenaiEmbedding(cfg.openai)
+
+    def test_batches_and_retry(self):
+        texts = [f'<div id={i}>' + 'a' * i for i in range(10)]
+        embed_list = self.openai_model.get_text_embed(texts)
+        self.assertEqual(embed_list, [[float(len(text)), 1.0] for text in texts])
+        # 奇数次请求均被限流，3个批次重试后共需6次请求
+        self.assertEqual(len(MockEmbeddingHandler.requests), 6)
+        self.assertTrue(all(len(batch) <= 4 for batch in MockEmbeddingHandler.requests))
+
+    def test_token_budget_batches(self):
+        scheduler = EmbedScheduler(lambda texts: texts, max_batch_size=100, max_batch_tokens=100)
+        batches = scheduler.make_batches(['a' * 150, 'b' * 150, 'c' * 30, 'd' * 600])
+        self.assertEqual([start for start, _, _ in batches], [0, 1, 3])
+        self.assertEqual(scheduler.run(['x', 'y', 'z']), ['x', 'y', 'z'])
+        scheduler.close()
+
+    def test_retry_exhausted(self):
+        def fail(texts):
+            raise ConnectionError('unavailable')
+
+        scheduler = EmbedScheduler(fail, max_retries=2, retry_backoff=0.001, retryable_errors=(ConnectionError,))
+        with self.assertRaises(ConnectionError):
+            scheduler.run(['x'])
+        scheduler.close()
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_rpm_limit(self):
+        limiter = RateLimiter(rpm=2, window=0.2)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_tpm_limit(self):
+        limiter = RateLimiter(tpm=100, window=0.2)
+        start = time.monotonic()
+        limiter.acquire(60)
+        limiter.acquire(60)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        # 超过tpm的单个批次不会永久等待
+        limiter.acquire(500)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+import numpy as np
+from src.model.feature_hashing import FeatureHasher, stable_hash
+from src.model.sparse_vector import SparseVector
+
+words = ['div_class_main', 'a_title_home', 'span_style_color:red', 'div_class_main', '中文属性_id_1']
+hash_script = '''
+import json
+from src.model.feature_hashing import FeatureHasher
+hasher = FeatureHasher(1 << 20, signed=True)
+print(json.dumps(hasher.transform(json.loads(input()), sparse=True).indices.tolist()))
+'''
+
+
+class FeatureHasherTest(unittest.TestCase):
+    def test_hash_stable_across_processes(self):
+        # 不同hash随机种子的进程得到的特征下标应完全一致
+        results = []
+        for seed in ['1', '2']:
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            output = subprocess.run([sys.executable, '-c', hash_script], input=json.dumps(words), env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output))
+        self.assertEqual(results[0], results[1])
+        local_vec = FeatureHasher(1 << 20, signed=True).transform(words, sparse=True)
+        self.assertEqual(local_vec.indices.tolist(), results[0])
+
+    def test_transform_dense_and_sparse(self):
+        hasher = FeatureHasher(1000)
+        dense_vec = hasher.transform(words, [1, 2, 3, 4, 5])
+        sparse_vec = hasher.transform(words, [1, 2, 3, 4, 5], sparse=True)
+        self.assertTrue(isinstance(dense_vec, list))
+        self.assertEqual(len(dense_vec), 1000)
+        self.assertTrue(isinstance(sparse_vec, SparseVector))
+        self.assertTrue(np.allclose(sparse_vec.to_dense(), dense_vec))
+        self.assertEqual(dense_vec[stable_hash(words[0]) % 1000], 5)
+
+    def test_signed_hash(self):
+        hasher = FeatureHasher(1000, signed=True)
+        dense_vec = hasher.transform(words)
+        for word in set(words):
+            word_hash = stable_hash(word)
+            sign = -1 if word_hash & (1 << 31) else 1
+            self.assertEqual(np.sign(dense_vec[word_hash % 1000]), sign)
+
+    def test_depth_weights(self):
+        hasher = FeatureHasher(1000, depth_decay=0.8, warmup_depth=3)
+        depths = [0, 3, 4, 10, 200]
+        expect = [0.8 ** max(0, depth - 3) for depth in depths]
+        self.assertTrue(np.allclose(hasher.depth_weights(depths), expect))
+
+
+if __name__ == '__main__':
+    unittest.main()
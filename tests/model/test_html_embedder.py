@@ -1,6 +1,8 @@
 import unittest
+import numpy as np
 from src.config.config_loader import TaskCfg
-from src.model.html_embedding import BowEmbedder, TextEmbedder, StructureEmbedder
+from src.model.html_embedding import BowEmbedder, TextEmbedder, StructureEmbedder, CssEmbedder
+from src.model.sparse_vector import SparseVector
 from src.dom_tree.dom_preprocess import DomProcessor
 
 local_html_path = '../../datas/huawei_ads_1.html'
@@ -28,6 +30,16 @@ class EmbedderTest(unittest.TestCase):
         self.assertTrue(isinstance(feature_vec, list))
         self.assertEqual(len(feature_vec), self.model_cfg.feature_dim_bow)
 
+    def test_sparse_bow_embedding(self):
+        # 测试稀疏bag-of-words编码结果与稠密编码一致
+        dense_vec = self.bow_embedder.get_feature_vec(self.tree_root)
+        self.model_cfg.sparse_bow = True
+        sparse_vec = self.bow_embedder.get_feature_vec(self.tree_root)
+        self.assertTrue(isinstance(sparse_vec, SparseVector))
+        self.assertEqual(len(sparse_vec), self.model_cfg.feature_dim_bow)
+        self.assertLess(sparse_vec.nnz, self.model_cfg.feature_dim_bow)
+        self.assertTrue(np.allclose(sparse_vec.to_dense(), dense_vec))
+
     def test_plain_text_embedding(self):
         # 测试树序列化文本编码器模型
         feature_vec = self.text_embedder.get_feature_vec(self.tree_root)
@@ -39,3 +51,67 @@ class EmbedderTest(unittest.TestCase):
         feature_vec = self.structure_embedder.get_feature_vec(self.tree_root)
         self.assertTrue(isinstance(feature_vec, list))
         self.assertEqual(len(feature_vec), 1536)
+
+    def test_subtree_code_lens(self):
+        # 自底向上计算的子树序列化长度与实际序列化结果一致
+        exclude_attrs = self.model_cfg.embed_ignore_tags
+        node_list, _ = self.tree_root.traverse_preorder()
+        for max_depth in [5, 100]:
+            code_lens, _ = self.tree_root.get_subtree_code_lens(exclude_attrs, max_depth)
+            for node in [self.tree_root] + node_list:
+                html_code = node.get_html_structure_code(exclude_attrs, max_depth)
+                self.assertEqual(code_lens[node.index], len(html_code))
+
+    def test_select_subtrees(self):
+        # 筛选结果与逐结点序列化后判断长度的方式一致
+        self.tree_root.traverse_preorder()
+        exclude_attrs = self.model_cfg.embed_ignore_tags
+
+        def select_by_code(node, selected):
+            html_code = node.get_html_structure_code(exclude_attrs=exclude_attrs)
+            if node.height <= self.model_cfg.min_height or \
+                    node.height <= self.model_cfg.max_height and len(html_code) <= self.model_cfg.min_code_len:
+                selected.append((html_code, node.index, 1))
+                return
+            node_text = node.get_node_html_tag(exclude_attrs=exclude_attrs)
+            if node_text:
+                selected.append((node_text, node.index, 0))
+            for child in node.children:
+                select_by_code(child, selected)
+
+        for min_height, max_height, min_code_len in [(5, 10, 500), (2, 8, 2000), (1, 30, 100)]:
+            self.model_cfg.min_height = min_height
+            self.model_cfg.max_height = max_height
+            self.model_cfg.min_code_len = min_code_len
+            expect = []
+            select_by_code(self.tree_root, expect)
+            self.assertEqual(self.structure_embedder.select_subtrees_for_embedding(self.tree_root), expect)
+
+
+class CssEmbedderTest(unittest.TestCase):
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        self.model_cfg = cfg.similarity_model
+        self.css_embedder = CssEmbedder(cfg.similarity_model, cfg.openai)
+        self.css_dict = {
+            'div.main[_ngcontent-abc-c1] > A': {'color': 'red', '-webkit-transition': 'all 1s'},
+            'div.main[_ngcontent-xyz-c2]>a': {'color': 'RED', 'transition': 'all 1s'},
+            '.x, .y': {'display': '-webkit-box'},
+        }
+
+    def test_css_words(self):
+        # 每个(selector, 属性名, 属性值)三元组对应一个虚拟word
+        self.model_cfg.css_normalize = False
+        words = self.css_embedder.get_css_words(self.css_dict)
+        self.assertEqual(len(words), 5)
+        self.assertIn('.x, .y_display_-webkit-box', words)
+
+    def test_normalized_css_words(self):
+        # 规范化后作用域属性、空白、大小写和厂商前缀不同的规则合并为一个
+        self.model_cfg.css_normalize = True
+        words = self.css_embedder.get_css_words(self.css_dict)
+        self.assertEqual(sorted(words), ['.x_display_box', '.y_display_box', 'div.main > a_color_red',
+                                         'div.main > a_transition_all 1s'])
+        feature_vec = self.css_embedder.get_feature_vec(self.css_dict)
+        self.assertEqual(len(feature_vec), self.model_cfg.feature_dim_bow)
+        self.assertEqual(sum(feature_vec), 4)
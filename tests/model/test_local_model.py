@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from src.config.config_loader import TaskCfg
+from src.model.local_model import LocalEmbedding
+from src.model.registry import EmbedRegistry
+from src.model.html_embedding import TextEmbedder, StructureEmbedder
+from src.dom_tree.dom_preprocess import DomProcessor
+
+local_html_path = '../../datas/huawei_ads_1.html'
+config_file = '../../config/config.yaml'
+
+
+class LocalEmbeddingTest(unittest.TestCase):
+    def setUp(self):
+        self.local_model = LocalEmbedding(embed_dim=256, num_workers=2, batch_size=2)
+
+    def tearDown(self):
+        self.local_model.close()
+
+    def test_text_embedding(self):
+        # 单个文本返回单个向量，多个文本返回与输入顺序一致的向量列表
+        texts = ['<div class=main>', '<div class=main>\n<a>', '<span id=footer>', '']
+        embed = self.local_model.get_text_embed(texts[0])
+        self.assertEqual(len(embed), 256)
+        self.assertAlmostEqual(np.linalg.norm(embed), 1)
+        embed_list = self.local_model.get_text_embed(texts)
+        self.assertEqual(len(embed_list), len(texts))
+        self.assertEqual(embed_list[0], embed)
+        self.assertEqual(embed_list[3], [0.0] * 256)
+        # 相近的文本余弦相似度更高
+        self.assertGreater(np.dot(embed_list[0], embed_list[1]), np.dot(embed_list[0], embed_list[2]))
+
+    def test_registry(self):
+        self.assertIs(EmbedRegistry.get_backend_cls('local'), LocalEmbedding)
+        with self.assertRaises(ValueError):
+            EmbedRegistry.get_backend_cls('unknown')
+
+
+class LocalBackendEmbedderTest(unittest.TestCase):
+    '''
+    测试plain_text和html_structure方法通过配置使用本地向量化后端，不需要访问网络
+    '''
+
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cfg.similarity_model.embed_backend = 'local'
+        self.model_cfg = cfg.similarity_model
+        self.openai_cfg = cfg.openai
+        with open(local_html_path, 'r', encoding='utf-8') as f:
+            html_text = f.read().strip()
+        self.tree_root = DomProcessor(html_text, cfg.html).preprocess()
+
+    def test_embedders(self):
+        for embedder_cls in [TextEmbedder, StructureEmbedder]:
+            embedder = embedder_cls(self.model_cfg, self.openai_cfg)
+            self.assertTrue(isinstance(embedder.text_embed_model, LocalEmbedding))
+            feature_vec = embedder.get_feature_vec(self.tree_root)
+            self.assertEqual(len(feature_vec), self.model_cfg.local_embed_dim)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 from src.model.openai_model import OpenaiEmbedding
 from src.config.config_loader import TaskCfg
 
@@ -37,5 +40,37 @@ class OpenaiEmbeddingTest(unittest.TestCase):
             self.assertEqual(len(embed), 1536)
 
 
+class OpenaiEmbeddingCacheTest(unittest.TestCase):
+    '''
+    测试embedding缓存与批内去重，不实际调用openai接口
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cfg.openai.embed_cache_file = os.path.join(self.tmp_dir.name, 'embeddings.db')
+        self.openai_model = OpenaiEmbedding(cfg.openai)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def fake_request_embed(texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def test_cache_and_dedupe(self):
+        with mock.patch.object(self.openai_model, 'request_embed', side_effect=self.fake_request_embed) as request:
+            embed_list = self.openai_model.get_text_embed(['<div>', '<p>', '<div>'])
+            self.assertEqual(embed_list, [[5.0, 1.0], [3.0, 1.0], [5.0, 1.0]])
+            request.assert_called_once_with(['<div>', '<p>'])
+            # 第二次请求只需要获取未缓存的文本
+            embed_list = self.openai_model.get_text_embed(['<p>', '<span>'])
+            self.assertEqual(embed_list, [[3.0, 1.0], [6.0, 1.0]])
+            request.assert_called_with(['<span>'])
+            embed = self.openai_model.get_text_embed('<div>')
+            self.assertEqual(embed, [5.0, 1.0])
+            self.assertEqual(request.call_count, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+import json
+import yaml
+import functools
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from src.batch import run_batch, read_tasks, load_checkpoint
+import src.batch
+
+config_file = '../config/config.yaml'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class BatchJobTest(unittest.TestCase):
+    '''
+    基于本地http服务提供datas中的网页，测试多进程批量任务、按序输出及断点续跑
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        handler = functools.partial(QuietHandler, directory='../datas')
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.urls = [f'{base_url}/{name}.html' for name in ['huawei_ads_1', 'huawei_ads_2', 'huawei_cloud']]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with open(config_file, 'r', encoding='utf-8') as f:
+            cfg_obj = yaml.safe_load(f)
+        cfg_obj['html']['fetch_method'] = 'async'
+        cfg_obj['similarity_model']['method'] = 'bow'
+        self.config_file = os.path.join(self.tmp_dir.name, 'config.yaml')
+        with open(self.config_file, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(cfg_obj, f)
+        self.input_file = os.path.join(self.tmp_dir.name, 'tasks.jsonl')
+        self.output_file = os.path.join(self.tmp_dir.name, 'results.jsonl')
+        tasks = [{'url1': self.urls[0], 'url2': self.urls[1]}, {'url': self.urls[2]},
+                 {'url1': self.urls[0], 'url2': self.urls[2]}, {'url1': self.urls[1], 'url2': self.urls[1]},
+                 {'foo': 'bar'}]
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            for task in tasks:
+                f.write(json.dumps(task) + '\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_results(self):
+        with open(self.output_file, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_read_csv_tasks(self):
+        csv_file = os.path.join(self.tmp_dir.name, 'tasks.csv')
+        with open(csv_file, 'w', encoding='utf-8') as f:
+            f.write('url1,url2\nhttp://a,http://b\nhttp://c,http://d\n')
+        tasks = list(read_tasks(csv_file))
+        self.assertEqual(tasks[1], (1, {'url1': 'http://c', 'url2': 'http://d'}))
+
+    def test_batch_ordered_and_resume(self):
+        self.assertEqual(run_batch(self.config_file, self.input_file, self.output_file, workers=2), 5)
+        results = self.read_results()
+        self.assertEqual([result['id'] for result in results], [0, 1, 2, 3, 4])
+        self.assertTrue(0 <= results[0]['score'] <= 1)
+        self.assertTrue(results[3]['is_sim'])
+        self.assertEqual(len(results[1]['feature_vec']), 5000)
+        self.assertIn('error', results[4])
+        # 模拟中断：保留前两条结果以及写了一半的第三条结果，续跑时只执行剩余任务
+        with open(self.output_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        with open(self.output_file, 'w', encoding='utf-8') as f:
+            f.writelines(lines[:2])
+            f.write(lines[2][:10])
+        self.assertEqual(load_checkpoint(self.output_file), {0, 1})
+        self.assertEqual(run_batch(self.config_file, self.input_file, self.output_file, workers=0), 3)
+        self.assertEqual(self.read_results(), results)
+
+    def test_ordered_buffer_bounded(self):
+        # 队首任务很慢时，其后已完成的结果不会无限堆积，提交的任务数不超过max_inflight
+        input_file = os.path.join(self.tmp_dir.name, 'many_tasks.jsonl')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            for i in range(50):
+                f.write(json.dumps({'url': f'http://page/{i}'}) + '\n')
+        release = threading.Event()
+        started = []
+        started_before_release = []
+
+        def fake_run_task(task):
+            task_id, record = task
+            started.append(task_id)
+            if task_id == 0:
+                release.wait(5)
+            return {'id': task_id, 'url': record['url']}
+
+        def release_head():
+            started_before_release.append(len(started))
+            release.set()
+
+        timer = threading.Timer(0.5, release_head)
+        timer.start()
+        with mock.patch.object(src.batch, 'ProcessPoolExecutor', ThreadPoolExecutor), \
+                mock.patch.object(src.batch, 'run_task', fake_run_task), \
+                mock.patch.object(src.batch, 'init_worker', lambda config_file: None):
+            finished = run_batch(self.config_file, input_file, self.output_file, workers=2, max_inflight=4)
+        timer.join()
+        self.assertEqual(finished, 50)
+        self.assertLessEqual(started_before_release[0], 4)
+        self.assertEqual([result['id'] for result in self.read_results()], list(range(50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import time
+import asyncio
+import functools
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from aiohttp.test_utils import TestServer, TestClient
+from src.config.config_loader import TaskCfg
+from src.service import SimilarityService, create_app
+from src.util.metrics import set_metrics_sink
+
+config_file = '../config/config.yaml'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class SimilarityServiceTest(unittest.IsolatedAsyncioTestCase):
+    '''
+    基于本地http服务提供datas中的网页，测试相似度服务的各接口
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        handler = functools.partial(QuietHandler, directory='../datas')
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.urls = [f'{base_url}/{name}.html' for name in ['huawei_ads_1', 'huawei_ads_2', 'huawei_cloud']]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def asyncSetUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cfg.html.fetch_method = 'async'
+        cfg.similarity_model.method = 'bow'
+        cfg.service.max_pending = 8
+        self.service = SimilarityService(cfg)
+        self.client = TestClient(TestServer(create_app(cfg, self.service)))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        set_metrics_sink(None)
+
+    async def test_similarity(self):
+        response = await self.client.post('/similarity', json={'url1': self.urls[0], 'url2': self.urls[1]})
+        self.assertEqual(response.status, 200)
+        result = await response.json()
+        expect_flag, expect_score = self.service.sim_model.get_similarity(self.urls[0], self.urls[1])
+        self.assertEqual(result['is_sim'], expect_flag)
+        self.assertAlmostEqual(result['score'], expect_score)
+        response = await self.client.post('/similarity', json={'url1': self.urls[0]})
+        self.assertEqual(response.status, 400)
+        response = await self.client.post('/similarity', data='not json')
+        self.assertEqual(response.status, 400)
+
+    async def test_features_and_batch(self):
+        response = await self.client.post('/features', json={'url': self.urls[2]})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len((await response.json())['feature_vec']), self.service.cfg.similarity_model.feature_dim_bow)
+        response = await self.client.post('/features', json={'url': f'{self.urls[0]}.missing'})
+        self.assertEqual(response.status, 502)
+        tasks = [{'url1': self.urls[0], 'url2': self.urls[2]}, {'url': self.urls[1]}, {'foo': 1}]
+        response = await self.client.post('/batch', json={'tasks': tasks})
+        results = (await response.json())['results']
+        self.assertEqual([result['id'] for result in results], [0, 1, 2])
+        self.assertFalse(results[0]['is_sim'])
+        self.assertIn('feature_vec', results[1])
+        self.assertIn('error', results[2])
+
+    async def test_malformed_body(self):
+        # 格式错误的请求体返回400，不会在背压控制时出错
+        for body in [{'tasks': 5}, {'tasks': None}, {'tasks': {'url': self.urls[0]}}, {'tasks': []}]:
+            response = await self.client.post('/batch', json=body)
+            self.assertEqual(response.status, 400, body)
+        for path in ['/batch', '/similarity', '/features']:
+            for body in [[1, 2], 'tasks', 5]:
+                response = await self.client.post(path, json=body)
+                self.assertEqual(response.status, 400, (path, body))
+        # url不是非空字符串时在计入任务数之前返回400，不进入特征提取
+        calls = []
+        self.service.sim_model.get_page_feature_pipeline = lambda url: calls.append(url)
+        for path, body in [('/features', {'url': 1}), ('/features', {'url': ''}), ('/features', {}),
+                           ('/similarity', {'url1': self.urls[0], 'url2': ['x']}),
+                           ('/similarity', {'url1': None, 'url2': self.urls[0]})]:
+            response = await self.client.post(path, json=body)
+            self.assertEqual(response.status, 400, (path, body))
+            self.assertIn('error', await response.json())
+        response = await self.client.post('/batch', json={'tasks': [{'url': 1}, {'url1': 2, 'url2': self.urls[0]}]})
+        self.assertTrue(all('error' in result for result in (await response.json())['results']))
+        self.assertEqual(calls, [])
+        self.assertEqual(self.service.pending, 0)
+
+    async def test_coalesce_requests(self):
+        # 同一url的并发请求只提取一次特征
+        pipeline = self.service.sim_model.get_page_feature_pipeline
+        calls = []
+
+        def slow_pipeline(url):
+            calls.append(url)
+            time.sleep(0.2)
+            return pipeline(url)
+
+        self.service.sim_model.get_page_feature_pipeline = slow_pipeline
+        requests = [self.client.post('/features', json={'url': self.urls[0]}) for _ in range(4)]
+        requests.append(self.client.post('/similarity', json={'url1': self.urls[0], 'url2': self.urls[0]}))
+        responses = await asyncio.gather(*requests)
+        self.assertTrue(all(response.status == 200 for response in responses))
+        self.assertEqual(calls, [self.urls[0]])
+        self.assertEqual(self.service.inflight, {})
+
+    async def test_backpressure(self):
+        # 处理中的任务数达到max_pending后返回503
+        pipeline = self.service.sim_model.get_page_feature_pipeline
+        self.service.sim_model.get_page_feature_pipeline = lambda url: time.sleep(0.3) or pipeline(url)
+        requests = [self.client.post('/features', json={'url': f'{self.urls[0]}?q={i}'}) for i in range(10)]
+        statuses = sorted([response.status for response in await asyncio.gather(*requests)])
+        self.assertEqual(statuses.count(200), 8)
+        self.assertEqual(statuses.count(503), 2)
+        response = await self.client.get('/health')
+        self.assertEqual((await response.json())['pending'], 0)
+
+    async def test_health_and_metrics(self):
+        response = await self.client.get('/health')
+        self.assertEqual((await response.json())['status'], 'ok')
+        await self.client.post('/features', json={'url': self.urls[1]})
+        response = await self.client.get('/metrics')
+        text = await response.text()
+        self.assertIn('webpage_sim_http_requests_total{path="/features",status="200"} 1', text)
+        self.assertIn('webpage_sim_stage_seconds_count{stage="download"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
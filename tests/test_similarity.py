@@ -1,6 +1,16 @@
+import os
+import tempfile
+import functools
+import threading
 import unittest
+from unittest import mock
+import numpy as np
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from src.config.config_loader import TaskCfg
-from src.similarity import WebPageSimilarity
+from src.similarity import WebPageSimilarity, bow_vec_similarity, cosine_similarity, \
+    bow_similarity_matrix, cosine_similarity_matrix
+from src.model.sparse_vector import SparseVector
+from src.util.metrics import PrometheusSink, set_metrics_sink
 
 config_file = '../config/config.yaml'
 url1 = 'https://developer.huawei.com/consumer/cn/doc/promotion/ads_shenhe01-0000001055334495'
@@ -29,5 +39,212 @@ class WebPageSimilarityTest(unittest.TestCase):
         self.assertFalse(sim_flag2)
 
 
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LocalPageSimilarityTest(unittest.TestCase):
+    '''
+    基于本地http服务提供datas中的网页，测试相似度主流程及批量接口
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        handler = functools.partial(QuietHandler, directory='../datas')
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.urls = [f'{base_url}/{name}.html' for name in ['huawei_ads_1', 'huawei_ads_2', 'huawei_cloud']]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cfg.html.fetch_method = 'async'
+        cfg.similarity_model.method = 'bow'
+        self.sim_model = WebPageSimilarity(cfg)
+
+    def tearDown(self):
+        self.sim_model.page_downloader.close()
+
+    def test_batch_consistent_with_pairwise(self):
+        pair_results = [self.sim_model.get_similarity(self.urls[0], url) for url in self.urls]
+        batch_results = self.sim_model.compare_one_to_many(self.urls[0], self.urls)
+        for (pair_flag, pair_score), (batch_flag, batch_score) in zip(pair_results, batch_results):
+            self.assertEqual(pair_flag, batch_flag)
+            self.assertAlmostEqual(pair_score, batch_score)
+        self.assertTrue(batch_results[0][0])
+
+    def test_similarity_matrix(self):
+        sim_flags, sim_scores = self.sim_model.similarity_matrix(self.urls + [f'{self.urls[0]}.missing'])
+        self.assertEqual(sim_scores.shape, (4, 4))
+        self.assertTrue(np.allclose(sim_scores, sim_scores.T))
+        self.assertTrue(all(sim_flags[i, i] for i in range(3)))
+        # 下载失败的网页与其它网页均不相似
+        self.assertFalse(sim_flags[3].any())
+        self.assertEqual(sim_scores[3].sum(), 0)
+
+    def test_concurrent_features(self):
+        # 线程池并发提取的特征与逐个提取的结果一致
+        urls = self.urls + self.urls[:1]
+        concurrent_features = self.sim_model.get_page_features_concurrent(urls, max_workers=3)
+        batch_features = self.sim_model.get_features_batch(urls)
+        self.assertEqual(len(concurrent_features), len(urls))
+        for (feature_vec1, css_vec1), (feature_vec2, css_vec2) in zip(concurrent_features, batch_features):
+            self.assertEqual(feature_vec1, feature_vec2)
+            self.assertEqual(css_vec1, css_vec2)
+
+    def test_pipeline_metrics(self):
+        # 开启指标后统计各阶段耗时、结点数、下载字节数等，下载失败的页面单独计数
+        metrics = PrometheusSink()
+        set_metrics_sink(metrics)
+        try:
+            self.sim_model.get_page_features_concurrent(self.urls + [f'{self.urls[0]}.missing'], max_workers=2)
+        finally:
+            set_metrics_sink(None)
+        self.assertEqual(metrics.get_counter('pages', status='ok'), 3)
+        self.assertEqual(metrics.get_counter('pages', status='download_failed'), 1)
+        self.assertEqual(metrics.get_histogram('stage_seconds', stage='download')[0], 4)
+        for stage in ['parse', 'preprocess', 'css_parse', 'embed', 'css_embed']:
+            self.assertEqual(metrics.get_histogram('stage_seconds', stage=stage)[0], 3)
+        self.assertGreater(metrics.get_counter('download_bytes'), 100000)
+        self.assertGreater(metrics.get_counter('dom_nodes'), 100)
+        self.assertGreater(metrics.get_counter('css_selectors'), 0)
+        self.assertIn('webpage_sim_pages_total{status="ok"} 3', metrics.render())
+        # 批量下载按整批计时，不计入单个网页的download阶段
+        metrics = PrometheusSink()
+        set_metrics_sink(metrics)
+        try:
+            self.sim_model.get_features_batch(self.urls, batch_size=2)
+        finally:
+            set_metrics_sink(None)
+        self.assertEqual(metrics.get_histogram('stage_seconds', stage='download_batch')[0], 2)
+        self.assertEqual(metrics.get_histogram('stage_seconds', stage='download')[0], 0)
+
+    def create_cascade_model(self, cascade_low, cascade_high, feature_cache_file=''):
+        cfg = TaskCfg.load_config_yaml(config_file)
+        cfg.cache.feature_cache_file = feature_cache_file
+        cfg.html.fetch_method = 'async'
+        cfg.similarity_model.method = 'cascade'
+        cfg.similarity_model.cascade_low = cascade_low
+        cfg.similarity_model.cascade_high = cascade_high
+        sim_model = WebPageSimilarity(cfg)
+        # 用结点数量构造的向量代替远端embedding
+        sim_model.remote_embedder.get_feature_vec = mock.Mock(
+            side_effect=lambda tree_root: [1.0, len(tree_root.traverse_preorder()[0]) / 1000])
+        return sim_model
+
+    def test_cascade_bow_tiers(self):
+        # 两个阈值均等于bow_thre时不调用远端embedding，结果与bow方法一致
+        bow_thre = self.sim_model.cfg.similarity_model.bow_thre
+        sim_model = self.create_cascade_model(bow_thre, bow_thre)
+        urls = self.urls + [f'{self.urls[0]}.missing']
+        sim_flags, sim_scores = sim_model.similarity_matrix(urls)
+        expect_flags, expect_scores = self.sim_model.similarity_matrix(urls)
+        self.assertTrue(np.array_equal(sim_flags, expect_flags))
+        self.assertTrue(np.allclose(sim_scores, expect_scores))
+        sim_model.remote_embedder.get_feature_vec.assert_not_called()
+        stats = sim_model.get_cascade_stats()
+        self.assertEqual(stats['embedding'], 0)
+        self.assertEqual(stats['total'], 9)
+        self.assertEqual(stats['bow_similar'], int((expect_scores[:3, :3] >= bow_thre).sum()))
+        sim_model.page_downloader.close()
+
+    def test_cascade_embedding_tier(self):
+        # 所有页面对都落在不确定区间时调用远端embedding，复用缓存的dom tree而不重新下载
+        sim_model = self.create_cascade_model(0, 1.01)
+        with mock.patch.object(sim_model.page_downloader, 'get_html') as get_html:
+            sim_flags, sim_scores = sim_model.similarity_matrix(self.urls)
+            get_html.assert_not_called()
+        self.assertEqual(sim_model.remote_embedder.get_feature_vec.call_count, len(self.urls))
+        self.assertEqual(sim_model.get_cascade_stats()['embedding'], 9)
+        self.assertTrue(all(sim_flags[i, i] for i in range(3)))
+        pair_flag, pair_score = sim_model.get_similarity(self.urls[0], self.urls[2])
+        self.assertEqual(pair_flag, sim_flags[0, 2])
+        self.assertAlmostEqual(pair_score, sim_scores[0, 2])
+        sim_model.page_downloader.close()
+
+    def test_cascade_feature_cache_hit(self):
+        # 特征缓存命中时不解析dom tree，需要远端向量化的页面使用已下载的源码解析，不重新下载
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, 'features.db')
+            sim_model = self.create_cascade_model(0, 1.01, cache_file)
+            expect_flags, expect_scores = sim_model.similarity_matrix(self.urls)
+            sim_model.page_downloader.close()
+            sim_model.feature_cache.close()
+            sim_model = self.create_cascade_model(0, 1.01, cache_file)
+            with mock.patch.object(sim_model.page_downloader, 'get_html') as get_html:
+                sim_flags, sim_scores = sim_model.similarity_matrix(self.urls)
+                get_html.assert_not_called()
+            self.assertEqual(sim_model.feature_cache.hits, len(self.urls))
+            self.assertEqual(len(sim_model.tree_cache), len(self.urls))
+            self.assertTrue(np.array_equal(sim_flags, expect_flags))
+            self.assertTrue(np.allclose(sim_scores, expect_scores))
+            sim_model.page_downloader.close()
+            sim_model.feature_cache.close()
+
+
+class SimilarityMatrixTest(unittest.TestCase):
+    '''
+    测试批量相似度计算与逐对计算结果一致
+    '''
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vecs1 = (rng.random((3, 50)) * (rng.random((3, 50)) > 0.7)).tolist()
+        self.vecs2 = (rng.random((4, 50)) * (rng.random((4, 50)) > 0.7)).tolist()
+        self.vecs2.append([0] * 50)
+
+    def test_bow_similarity_matrix(self):
+        scores = bow_similarity_matrix(self.vecs1, self.vecs2, block_elems=100)
+        self.assertEqual(scores.shape, (3, 5))
+        for i, vec1 in enumerate(self.vecs1):
+            for j, vec2 in enumerate(self.vecs2):
+                self.assertAlmostEqual(scores[i, j], bow_vec_similarity(vec1, vec2))
+
+    def test_cosine_similarity_matrix(self):
+        scores = cosine_similarity_matrix(self.vecs1, self.vecs2)
+        self.assertEqual(scores.shape, (3, 5))
+        for i, vec1 in enumerate(self.vecs1):
+            for j, vec2 in enumerate(self.vecs2):
+                self.assertAlmostEqual(scores[i, j], cosine_similarity(vec1, vec2))
+
+    def test_sparse_similarity(self):
+        # 稀疏向量的单对及批量相似度应与稠密向量结果一致
+        sparse1 = [SparseVector.from_dense(vec) for vec in self.vecs1]
+        sparse2 = [SparseVector.from_dense(vec) for vec in self.vecs2]
+        bow_scores = bow_similarity_matrix(sparse1, sparse2)
+        cos_scores = cosine_similarity_matrix(sparse1, sparse2)
+        for i, vec1 in enumerate(self.vecs1):
+            for j, vec2 in enumerate(self.vecs2):
+                self.assertAlmostEqual(bow_vec_similarity(sparse1[i], sparse2[j]), bow_vec_similarity(vec1, vec2))
+                self.assertAlmostEqual(cosine_similarity(sparse1[i], sparse2[j]), cosine_similarity(vec1, vec2))
+                self.assertAlmostEqual(bow_scores[i, j], bow_vec_similarity(vec1, vec2))
+                self.assertAlmostEqual(cos_scores[i, j], cosine_similarity(vec1, vec2))
+
+    def test_sparse_signed_similarity(self):
+        # 带符号取值(signed hashing)时稀疏批量计算结果同样与稠密向量一致
+        rng = np.random.default_rng(1)
+        vecs = (rng.normal(size=(4, 30)) * (rng.random((4, 30)) > 0.6)).tolist()
+        sparse_vecs = [SparseVector.from_dense(vec) for vec in vecs]
+        bow_scores = bow_similarity_matrix(sparse_vecs, sparse_vecs)
+        dense_scores = bow_similarity_matrix(vecs, vecs, block_elems=50)
+        for i, vec1 in enumerate(vecs):
+            for j, vec2 in enumerate(vecs):
+                self.assertAlmostEqual(bow_scores[i, j], bow_vec_similarity(vec1, vec2))
+                self.assertAlmostEqual(dense_scores[i, j], bow_vec_similarity(vec1, vec2))
+                self.assertAlmostEqual(bow_vec_similarity(sparse_vecs[i], sparse_vecs[j]), bow_vec_similarity(vec1, vec2))
+        # 带符号取值的相似度仍在[0, 1]之间，完全相同为1，符号相反为0
+        self.assertTrue(np.all((bow_scores >= 0) & (bow_scores <= 1 + 1e-12)))
+        self.assertTrue(np.allclose(np.diag(bow_scores), 1))
+        self.assertTrue(0 <= bow_vec_similarity([-1, -1], [-1, -2]) <= 1)
+        self.assertTrue(0 <= bow_vec_similarity([1, -3], [1, -1]) <= 1)
+        self.assertAlmostEqual(bow_vec_similarity([1, -2], [-1, 2]), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
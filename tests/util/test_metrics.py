@@ -0,0 +1,82 @@
+import time
+import threading
+import unittest
+from src.util.metrics import NullSink, PrometheusSink, create_metrics_sink, get_metrics_sink, set_metrics_sink
+
+
+class MetricsSinkTest(unittest.TestCase):
+    def test_null_sink(self):
+        metrics = NullSink()
+        self.assertFalse(metrics.enabled)
+        metrics.inc('pages', status='ok')
+        metrics.observe('stage_seconds', 1.0, stage='parse')
+        # 计时复用同一个空上下文管理器
+        self.assertIs(metrics.timer('parse'), metrics.timer('embed'))
+        with metrics.timer('parse'):
+            pass
+        self.assertEqual(metrics.render(), '')
+
+    def test_counter_and_histogram(self):
+        metrics = PrometheusSink(buckets=(0.1, 1.0))
+        metrics.inc('pages', status='ok')
+        metrics.inc('pages', 2, status='ok')
+        metrics.inc('pages', status='download_failed')
+        self.assertEqual(metrics.get_counter('pages', status='ok'), 3)
+        self.assertEqual(metrics.get_counter('pages', status='cache_hit'), 0)
+        for value in [0.05, 0.5, 5]:
+            metrics.observe('stage_seconds', value, stage='parse')
+        with metrics.timer('embed'):
+            time.sleep(0.01)
+        count, total = metrics.get_histogram('stage_seconds', stage='parse')
+        self.assertEqual(count, 3)
+        self.assertAlmostEqual(total, 5.55)
+        self.assertEqual(metrics.get_histogram('stage_seconds', stage='embed')[0], 1)
+        self.assertGreaterEqual(metrics.get_histogram('stage_seconds', stage='embed')[1], 0.01)
+
+    def test_render_prometheus_text(self):
+        metrics = PrometheusSink(buckets=(0.1, 1.0))
+        metrics.inc('download_bytes', 1024)
+        metrics.inc('pages', status='a"b')
+        metrics.observe('stage_seconds', 0.05, stage='parse')
+        metrics.observe('stage_seconds', 0.5, stage='parse')
+        metrics.observe('stage_seconds', 5, stage='parse')
+        lines = metrics.render().splitlines()
+        self.assertIn('# TYPE webpage_sim_download_bytes_total counter', lines)
+        self.assertIn('webpage_sim_download_bytes_total 1024', lines)
+        self.assertIn('webpage_sim_pages_total{status="a\\"b"} 1', lines)
+        self.assertIn('# TYPE webpage_sim_stage_seconds histogram', lines)
+        # 分桶计数为累计值
+        self.assertIn('webpage_sim_stage_seconds_bucket{stage="parse",le="0.1"} 1', lines)
+        self.assertIn('webpage_sim_stage_seconds_bucket{stage="parse",le="1.0"} 2', lines)
+        self.assertIn('webpage_sim_stage_seconds_bucket{stage="parse",le="+Inf"} 3', lines)
+        self.assertIn('webpage_sim_stage_seconds_count{stage="parse"} 3', lines)
+
+    def test_concurrent_inc(self):
+        metrics = PrometheusSink()
+
+        def work():
+            for _ in range(1000):
+                metrics.inc('embed_requests', backend='local')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.get_counter('embed_requests', backend='local'), 8000)
+
+    def test_global_sink(self):
+        self.assertFalse(get_metrics_sink().enabled)
+        metrics = create_metrics_sink('prometheus')
+        set_metrics_sink(metrics)
+        try:
+            self.assertIs(get_metrics_sink(), metrics)
+        finally:
+            set_metrics_sink(None)
+        self.assertTrue(isinstance(get_metrics_sink(), NullSink))
+        with self.assertRaises(ValueError):
+            create_metrics_sink('statsd')
+
+
+if __name__ == '__main__':
+    unittest.main()